@@ -0,0 +1,203 @@
+"""Content-addressed cache of synthesized audio for repeated phrases.
+
+Entries are keyed on (text, voice_id, rate, volume). A bounded in-memory LRU
+tier serves hot phrases ("gg", "lol", greetings); an optional on-disk tier
+keeps more of them across restarts and evicts the least recently used files
+once it grows past its size limit.
+"""
+import collections
+import hashlib
+import os
+import threading
+
+from tts_pipeline import join_wavs
+
+
+def settings_key(voice_id, rate, volume):
+    """Short hash of the voice settings, shared by every entry rendered with them."""
+    return hashlib.sha1(repr((voice_id, rate, float(volume))).encode("utf-8")).hexdigest()[:12]
+
+
+def text_key(text):
+    """Hash of the whitespace-normalized text."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Two-tier LRU cache of audio bytes; thread-safe."""
+
+    def __init__(self, max_memory_bytes=32 * 1024 * 1024, disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = collections.OrderedDict()  # (settings, text) key -> audio bytes
+        self.memory_bytes = 0
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.disk = collections.OrderedDict()  # file name -> size, least recently used first
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            self.load_disk_index()
+
+    def load_disk_index(self):
+        """Indexes files already in the disk tier, oldest access first."""
+        os.makedirs(self.disk_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".wav"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.disk[name] = size
+            self.disk_bytes += size
+
+    @staticmethod
+    def file_name(key):
+        """Name of the disk-tier file for a cache key."""
+        return f"{key[0]}_{key[1]}.wav"
+
+    def get(self, text, voice_id, rate, volume):
+        """Returns cached audio for the phrase and settings, or None."""
+        key = (settings_key(voice_id, rate, volume), text_key(text))
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            name = self.file_name(key)
+            if name in self.disk:
+                try:
+                    with open(os.path.join(self.disk_dir, name), "rb") as f:
+                        audio = f.read()
+                except OSError:
+                    self.forget_file(name)
+                else:
+                    self.disk.move_to_end(name)
+                    os.utime(os.path.join(self.disk_dir, name))
+                    self.disk_hits += 1
+                    self.store_memory(key, audio)
+                    return audio
+            self.misses += 1
+            return None
+
+    def put(self, text, voice_id, rate, volume, audio):
+        """Stores freshly synthesized audio in both tiers."""
+        key = (settings_key(voice_id, rate, volume), text_key(text))
+        with self.lock:
+            self.store_memory(key, audio)
+            if self.disk_dir:
+                self.store_disk(key, audio)
+
+    def store_memory(self, key, audio):
+        """Adds audio to the memory tier, evicting the least recently used entries."""
+        if len(audio) > self.max_memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old)
+        self.memory[key] = audio
+        self.memory_bytes += len(audio)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def store_disk(self, key, audio):
+        """Writes audio to the disk tier, evicting the least recently used files."""
+        name = self.file_name(key)
+        if name in self.disk or len(audio) > self.max_disk_bytes:
+            return
+        try:
+            with open(os.path.join(self.disk_dir, name), "wb") as f:
+                f.write(audio)
+        except OSError:
+            return
+        self.disk[name] = len(audio)
+        self.disk_bytes += len(audio)
+        while self.disk_bytes > self.max_disk_bytes:
+            self.forget_file(next(iter(self.disk)))
+
+    def forget_file(self, name):
+        """Drops a file from the disk tier and its index."""
+        self.disk_bytes -= self.disk.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.disk_dir, name))
+        except OSError:
+            pass
+
+    def invalidate(self, voice_id, rate, volume):
+        """Drops every entry rendered with settings other than the given ones."""
+        current = settings_key(voice_id, rate, volume)
+        with self.lock:
+            for key in [k for k in self.memory if k[0] != current]:
+                self.memory_bytes -= len(self.memory.pop(key))
+            if self.disk_dir:
+                for name in [n for n in self.disk if not n.startswith(current + "_")]:
+                    self.forget_file(name)
+
+    def summary(self):
+        """A short hit/miss description for the status bar."""
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            rate = hits * 100.0 / total if total else 0.0
+            return f"cache {hits}/{total} hits ({rate:.0f}%), {self.memory_bytes / 1e6:.1f} MB"
+
+
+class CachingBackend:
+    """Wraps a TTS backend so repeated phrases are served from an AudioCache.
+
+    Queue entries may be a tuple of phrases, such as ("bob says", "gg"); each
+    phrase is cached on its own and the audio is joined, so "gg" is reused no
+    matter who said it.
+    """
+
+    def __init__(self, backend, cache, max_text_length=120, voice_for=None):
+        self.backend = backend
+        self.cache = cache
+        # Long messages are rarely repeated and would only push hot phrases out
+        self.max_text_length = max_text_length
+        self.voice_for = voice_for  # Picks a voice for a queue entry, e.g. per user; None means the default
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    @property
+    def rate(self):
+        return self.backend.rate
+
+    def configure(self, voice_id, rate, volume):
+        """Applies new voice settings and drops audio rendered with the old ones."""
+        self.backend.configure(voice_id, rate, volume)
+        self.cache.invalidate(self.cache_voice(voice_id), rate, volume)
+
+    def set_backend(self, backend):
+        """Switches to another engine and returns the old one; cached audio is kept per engine."""
+        old, self.backend = self.backend, backend
+        return old
+
+    def cache_voice(self, voice_id):
+        """The voice part of the cache key; includes the engine so two engines' voices never collide."""
+        return f"{self.backend.name}:{voice_id}"
+
+    def synthesize(self, text):
+        """Returns cached audio when available, otherwise synthesizes and caches it."""
+        voice_id = self.voice_for(text) if self.voice_for else None
+        if isinstance(text, tuple):
+            return join_wavs([self.synthesize_phrase(phrase, voice_id) for phrase in text])
+        return self.synthesize_phrase(text, voice_id)
+
+    def synthesize_phrase(self, text, voice_id=None):
+        """Synthesizes a single phrase through the cache."""
+        backend = self.backend
+        if len(text) > self.max_text_length:
+            return backend.synthesize(text, voice_id)
+        settings = (self.cache_voice(voice_id or backend.voice_id), backend.rate, backend.volume)
+        audio = self.cache.get(text, *settings)
+        if audio is None:
+            audio = backend.synthesize(text, voice_id)
+            self.cache.put(text, *settings, audio)
+        return audio
@@ -0,0 +1,1098 @@
+"""Microbenchmarks for the chat pipeline, and an end-to-end scenario suite.
+
+Run `python benchmarks.py <name> [options]`. Benchmarks that take a corpus read
+a file of raw IRC lines (one per line, as received from Twitch) or a recording
+made with irc_recording; without one a synthetic high-traffic corpus is
+generated.
+
+`python benchmarks.py e2e` replays quiet, busy and raid scenarios (or
+`--recording FILE`) from the fake TMI server into a real ChatEngine with a
+null TTS backend, and reports throughput, latency percentiles, memory and
+drop rates. `--speed` replays faster than real time (0 = as fast as
+possible) and `--json` prints one machine-readable line per scenario for
+comparing runs. A scenario fails if it loses lines, has TTS errors or doesn't
+drain, if it breaks a `--max-p99`, `--max-drop-rate` or
+`--min-lines-per-second` limit, or if it is more than `--tolerance` worse than
+the same scenario in a `--baseline` file saved from `--json`; the script
+then exits with status 1, so CI can run it.
+"""
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from chat_engine import ChatEngine
+from chat_history import ChatHistory
+from coalescer import Coalescer
+from fake_tmi import FakeTMIServer, privmsg_line
+from greeter import Greeter, SeenUsers
+from irc_client import IRCClient
+from irc_parser import CommandDispatcher, parse_line
+from irc_reader import DEFAULT_BUFFER_SIZE, IRCReader
+from irc_writer import TWITCH_LIMITS
+from irc_recording import read_recording, write_recording
+from metrics import MetricsRegistry
+from text_normalizer import TextNormalizer
+from tts_backends import BACKENDS, NullBackend, ProcessPoolBackend, create_backend
+from tts_pipeline import NullPlayer, TTSPipeline
+from tts_scheduler import DROP_POLICIES, PRIORITY_CHAT, PRIORITY_HIGH, TTSScheduler
+
+CHATTERS = [f"viewer{i}" for i in range(2000)]
+CHAT_WORDS = ["lol", "gg", "KEKW", "PogChamp", "LUL", "nice", "what", "is", "that",
+              "clip", "it", "no", "way", "JOIN", "366", "wp", "hype", "OMEGALUL"]
+
+
+def synthetic_line(rng, channel="bigchannel"):
+    """Returns one plausible line of traffic from a busy channel."""
+    user = rng.choice(CHATTERS)
+    roll = rng.random()
+    if roll < 0.85:
+        text = " ".join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(1, 12)))
+        tags = (f"@badge-info=;badges=subscriber/12;color=#1E90FF;display-name={user};"
+                f"emotes=;first-msg=0;flags=;id={rng.getrandbits(64):016x};mod=0;"
+                f"room-id=12345;subscriber=1;tmi-sent-ts={1700000000000 + rng.randint(0, 10**6)};"
+                f"turbo=0;user-id={rng.randint(1, 10**8)};user-type=")
+        return f"{tags} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{text}"
+    if roll < 0.93:
+        return f":{user}!{user}@{user}.tmi.twitch.tv JOIN #{channel}"
+    if roll < 0.99:
+        return f":{user}!{user}@{user}.tmi.twitch.tv PART #{channel}"
+    return "PING :tmi.twitch.tv"
+
+
+def load_corpus(path, count, seed=1):
+    """Loads raw lines from a recorded file, or generates `count` synthetic ones."""
+    if path:
+        return [line for _, line in read_recording(path)]
+    rng = random.Random(seed)
+    return [synthetic_line(rng) for _ in range(count)]
+
+
+def legacy_dispatch(line):
+    """The substring/regex routing that listen_for_messages used before irc_parser."""
+    if line.startswith("PING"):
+        return "PING"
+    elif "366" in line:
+        return "366"
+    elif "JOIN" in line and not line.startswith(":jtv"):
+        match = re.search(r':(\w+)!.*JOIN #(\w+)', line)
+        return ("JOIN", match.group(1)) if match else None
+    elif "PART" in line:
+        match = re.search(r':(\w+)!.*PART #(\w+)', line)
+        return ("PART", match.group(1)) if match else None
+    elif "PRIVMSG" in line:
+        match = re.search(r'display-name=([^;]+).*PRIVMSG #\w+ :(.+)', line)
+        return ("PRIVMSG", match.group(1), match.group(2)) if match else None
+    return None
+
+
+def parser_dispatch():
+    """Builds a dispatcher equivalent to the legacy routing for benchmarking."""
+    return CommandDispatcher({
+        "PING": lambda m: "PING",
+        "366": lambda m: "366",
+        "JOIN": lambda m: ("JOIN", m.nick),
+        "PART": lambda m: ("PART", m.nick),
+        "PRIVMSG": lambda m: ("PRIVMSG", m.tag("display-name"), m.trailing),
+    })
+
+
+def time_passes(passes, repeat):
+    """Returns the best time in seconds of each `(func, arg)` pass over `repeat` rounds.
+
+    The passes take turns within each round, so a noisy neighbour or a
+    clock change slows them all alike, and the garbage collector is off
+    while they run, as in timeit.
+    """
+    best = [float("inf")] * len(passes)
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for i, (func, arg) in enumerate(passes):
+                start = time.perf_counter()
+                func(arg)
+                best[i] = min(best[i], time.perf_counter() - start)
+    finally:
+        if collecting:
+            gc.enable()
+    return best
+
+
+def bench_parser(args):
+    """Compares the legacy substring/regex routing with the IRCv3 parser.
+
+    Each side runs the loop its receive path runs: the legacy loop routed
+    one decoded line at a time; IRCConnection parses a whole chunk of bytes
+    frames, then dispatches the messages. The legacy routing is quick on the
+    lines it sends down the wrong branch (chat containing "366" or "JOIN"
+    stops after one substring test), so the rates over just the lines it
+    routes correctly are printed too.
+    """
+    lines = load_corpus(args.corpus, args.lines)
+    dispatcher = parser_dispatch()
+
+    def legacy_loop(lines):
+        for line in lines:
+            legacy_dispatch(line)
+
+    def parser_loop(frames):
+        dispatch = dispatcher.dispatch
+        for message in [parse_line(frame) for frame in frames]:
+            if message:
+                dispatch(message)
+
+    # Count lines the legacy routing sends down the wrong branch
+    misrouted = 0
+    routed = []
+    for line in lines:
+        message = parse_line(line)
+        legacy = legacy_dispatch(line)
+        legacy_cmd = legacy if isinstance(legacy, str) else (legacy[0] if legacy else None)
+        if message and message.command in ("PING", "366", "JOIN", "PART", "PRIVMSG") \
+                and legacy_cmd != message.command:
+            misrouted += 1
+        else:
+            routed.append(line)
+
+    # The reader hands the parser raw bytes frames
+    legacy_all, parser_all, legacy_routed, parser_routed = (
+        len(corpus) / seconds for corpus, seconds in zip((lines, lines, routed, routed), time_passes([
+            (legacy_loop, lines), (parser_loop, [line.encode("utf-8") for line in lines]),
+            (legacy_loop, routed), (parser_loop, [line.encode("utf-8") for line in routed]),
+        ], args.repeat)))
+    print(f"corpus:            {len(lines)} lines ({args.corpus or 'synthetic'})")
+    print(f"legacy dispatch:   {legacy_all:12,.0f} lines/s")
+    print(f"irc_parser:        {parser_all:12,.0f} lines/s ({parser_all / legacy_all:.2f}x)")
+    print(f"legacy misrouted:  {misrouted} lines")
+    print(f"correctly routed:  {len(routed)} lines; legacy {legacy_routed:,.0f} lines/s, "
+          f"irc_parser {parser_routed:,.0f} lines/s ({parser_routed / legacy_routed:.2f}x)")
+
+
+def legacy_receive(sock, handle):
+    """The str-based receive loop listen_for_messages used before irc_reader."""
+    buffer = ""
+    while True:
+        response = sock.recv(2048).decode('utf-8', errors='ignore')
+        if not response:
+            break
+        buffer += response
+        lines = buffer.split('\r\n')
+        buffer = lines.pop()
+        for line in lines:
+            handle(line)
+
+
+def reader_receive(sock, handle, buffer_size):
+    """The recv_into/bytes framing receive loop from irc_reader."""
+    reader = IRCReader(sock, buffer_size)
+    while True:
+        lines = reader.read_lines()
+        if lines is None:
+            break
+        for line in lines:
+            handle(line)
+
+
+def replay_through_socketpair(payload, receive):
+    """Streams `payload` through a local socketpair into `receive`; returns (seconds, lines)."""
+    sender, receiver = socket.socketpair()
+    count = [0]
+
+    def handle(line):
+        count[0] += 1
+
+    def send():
+        sender.sendall(payload)
+        sender.close()
+
+    writer = threading.Thread(target=send, daemon=True)
+    start = time.perf_counter()
+    writer.start()
+    receive(receiver, handle)
+    elapsed = time.perf_counter() - start
+    writer.join()
+    receiver.close()
+    return elapsed, count[0]
+
+
+def bench_receive(args):
+    """Replays a multi-megabyte capture through a socketpair into both receive loops."""
+    lines = load_corpus(args.corpus, args.lines)
+    payload = "".join(line + "\r\n" for line in lines).encode("utf-8")
+    megabytes = len(payload) / 1e6
+    print(f"capture:  {megabytes:.1f} MB, {len(lines)} lines ({args.corpus or 'synthetic'})")
+
+    runs = [
+        ("legacy recv(2048)+str", lambda sock, handle: legacy_receive(sock, handle)),
+        (f"recv_into {args.buffer_size}B", lambda sock, handle: reader_receive(sock, handle, args.buffer_size)),
+    ]
+    for label, receive in runs:
+        best = float("inf")
+        for _ in range(args.repeat):
+            elapsed, received = replay_through_socketpair(payload, receive)
+            best = min(best, elapsed)
+        print(f"{label:24} {megabytes / best:8.1f} MB/s {received / best:12,.0f} lines/s")
+
+
+def bench_reconnect(args):
+    """Drops every connection on a schedule and measures how fast all channels rejoin."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(FakeTMIServer().start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    channels = [f"channel{i}" for i in range(args.channels)]
+    joined = {}
+    latencies = []
+    dispatcher = CommandDispatcher({"366": lambda m, channel: joined.__setitem__(channel, time.perf_counter())})
+    client = IRCClient("oauth:bench", "benchbot", channels, dispatcher=dispatcher,
+                       host=server.host, port=server.port, channels_per_connection=args.shard_size,
+                       latency_callback=latencies.append, ping_interval=0.5, ping_timeout=1.0,
+                       backoff_base=0.2, backoff_cap=2.0)
+    client.start()
+    time.sleep(1.0)
+
+    rejoin_times = []
+    for _ in range(args.drops):
+        joined.clear()
+        dropped_at = time.perf_counter()
+        loop.call_soon_threadsafe(server.drop_connections)
+        deadline = dropped_at + 10
+        while len(joined) < len(channels) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        if len(joined) == len(channels):
+            rejoin_times.append(max(joined.values()) - dropped_at)
+        time.sleep(args.drop_interval)
+    client.stop()
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+
+    print(f"channels:           {len(channels)} over {len(client.connections)} connections")
+    print(f"drops:              {args.drops}, fully rejoined after {len(rejoin_times)}")
+    if rejoin_times:
+        print(f"rejoin time:        mean {sum(rejoin_times) / len(rejoin_times) * 1000:.0f} ms, "
+              f"max {max(rejoin_times) * 1000:.0f} ms")
+    if latencies:
+        print(f"PING/PONG latency:  mean {sum(latencies) / len(latencies) * 1000:.2f} ms over {len(latencies)} samples")
+
+
+def bench_outbound(args):
+    """Bulk JOINs and chat bursts through the rate-limited writer against a server that enforces the limits.
+
+    Twitch's limit windows are shortened by `--time-scale` so the run takes
+    seconds; the server rejects and counts anything over the limits.
+    """
+    scale = args.time_scale
+    limits = {limit: (lines, seconds / scale) for limit, (lines, seconds) in TWITCH_LIMITS.items()}
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(FakeTMIServer(enforce_limits=True, limit_scale=scale).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    channels = [f"channel{i}" for i in range(args.channels)]
+    server.moderators.add(channels[0])
+
+    joined = {}
+    latencies = []
+    dispatcher = CommandDispatcher({"366": lambda m, channel: joined.__setitem__(channel, time.perf_counter())})
+    client = IRCClient("oauth:bench", "benchbot", channels, dispatcher=dispatcher,
+                       host=server.host, port=server.port, channels_per_connection=args.shard_size,
+                       latency_callback=latencies.append, ping_interval=0.2, ping_timeout=5.0,
+                       rate_limits=limits)
+    start = time.perf_counter()
+    client.start()
+    wait_until(lambda: len(joined) == len(channels), 120)
+    join_time = max(joined.values(), default=start) - start
+
+    # A burst of replies in a moderated and an ordinary channel, while PINGs keep going
+    messages = args.messages
+    latencies.clear()
+    chat_start = time.perf_counter()
+    for i in range(messages):
+        client.say(channels[0], f"mod reply {i}")
+        if len(channels) > 1:
+            client.say(channels[1], f"reply {i}")
+    expected = messages * (2 if len(channels) > 1 else 1)
+    wait_until(lambda: len(server.chat_received) >= expected, 120)
+    chat_time = time.perf_counter() - chat_start
+    client.stop()
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+
+    metrics = client.metrics.metrics
+    sent = metrics["irc_lines_sent_total"].total()
+    writes = metrics["irc_writes_total"].total()
+    dropped = metrics["irc_lines_dropped_total"].total()
+    print(f"limits:          Twitch's, with windows shortened {scale:g}x")
+    print(f"bulk join:       {len(channels)} channels over {len(client.connections)} connections "
+          f"in {join_time:.2f}s ({len(joined)} joined)")
+    print(f"chat burst:      {len(server.chat_received)}/{expected} delivered in {chat_time:.2f}s "
+          f"({dropped:.0f} dropped by the writer's queue)")
+    print(f"violations:      {dict(server.limit_violations) or 'none'}")
+    print(f"batching:        {sent:.0f} lines in {writes:.0f} writes ({sent / max(writes, 1):.1f} lines/write)")
+    if latencies:
+        print(f"PING/PONG:       median {sorted(latencies)[len(latencies) // 2] * 1000:.2f} ms, "
+              f"max {max(latencies) * 1000:.2f} ms during the chat backlog")
+
+
+def bench_pipeline(args):
+    """Compares serial synth+play with the look-ahead pipeline on simulated costs.
+
+    With --engine the messages are synthesized by a real speech engine, and
+    --processes runs it in that many worker processes.
+    """
+    def play(audio):
+        time.sleep(args.play_cost)
+
+    options = {"synth_cost": args.synth_cost} if args.engine == "null" else {}
+    if args.processes > 0:
+        backend = ProcessPoolBackend(args.engine, args.processes, **options)
+        backend.synthesize("warm up")  # Don't count the workers starting
+    else:
+        backend = create_backend(args.engine, **options)
+    workers = max(args.workers, args.processes)
+    texts = [f"viewer{i} says message number {i}" for i in range(args.messages)]
+
+    start = time.perf_counter()
+    for text in texts:
+        play(backend.synthesize(text))
+        time.sleep(args.delay)
+    serial = time.perf_counter() - start
+
+    source = queue.Queue()
+    for text in texts:
+        source.put(text)
+    done = threading.Event()
+    spoken = []
+
+    def on_spoken(text, stats):
+        spoken.append(text)
+        if len(spoken) == len(texts):
+            done.set()
+
+    pipeline = TTSPipeline(backend, source, workers=workers, lookahead=max(3, workers),
+                           message_delay=args.delay, player=play, on_spoken=on_spoken)
+    start = time.perf_counter()
+    pipeline.start()
+    done.wait()
+    pipelined = time.perf_counter() - start
+    pipeline.stop()
+    backend.close()
+
+    print(f"engine:      {args.engine}, {args.processes or 'no'} worker processes, {workers} synthesis threads")
+    print(f"messages:    {len(texts)} (synth {args.synth_cost}s, play {args.play_cost}s, delay {args.delay}s)")
+    print(f"serial:      {len(texts) / serial * 60:6.1f} messages/min")
+    print(f"pipelined:   {len(texts) / pipelined * 60:6.1f} messages/min ({serial / pipelined:.2f}x)")
+    print(f"in order:    {spoken == texts}")
+    print(pipeline.stats.summary())
+
+
+def long_message(rng, min_chars=300, max_chars=500):
+    """A wall-of-text chat message of sentences and clauses."""
+    target = rng.randint(min_chars, max_chars)
+    sentences = []
+    while sum(len(sentence) + 1 for sentence in sentences) < target:
+        clauses = [" ".join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(3, 9)))
+                   for _ in range(rng.randint(1, 3))]
+        sentences.append(", ".join(clauses).capitalize() + rng.choice([".", "!", "?"]))
+    return " ".join(sentences)[:max_chars]
+
+
+def bench_chunking(args):
+    """Time-to-first-audio and player blocking for long messages, whole versus chunked.
+
+    Synthesis and playback both run `--play-speed` times faster than real
+    time; the figures are scaled back to real time.
+    """
+    speed = args.play_speed
+    rng = random.Random(5)
+    texts = [long_message(rng) for _ in range(args.messages)]
+    print(f"messages:     {len(texts)} of {min(map(len, texts))}-{max(map(len, texts))} chars, "
+          f"synth {args.synth_cost}s + {args.char_cost * 1000:.1f} ms/char, simulated at {speed:g}x")
+    for label, chunk_chars in (("whole", 0), (f"chunks <= {args.chunk_chars}", args.chunk_chars)):
+        metrics = MetricsRegistry()
+        source = queue.Queue()
+        for text in texts:
+            source.put(text)
+        done = threading.Event()
+        spoken = []
+
+        def on_spoken(text, stats):
+            spoken.append(text)
+            if len(spoken) == len(texts):
+                done.set()
+
+        backend = NullBackend(args.synth_cost / speed, args.char_cost / speed)
+        pipeline = TTSPipeline(backend, source, workers=args.workers,
+                               message_delay=0.0, player=NullPlayer(speed), on_spoken=on_spoken,
+                               metrics=metrics, chunk_chars=chunk_chars)
+        start = time.perf_counter()
+        pipeline.start()
+        done.wait()
+        elapsed = (time.perf_counter() - start) * speed
+        pipeline.stop()
+        first_audio = [value * speed for value in
+                       metrics.histogram("tts_first_audio_seconds", "").percentiles((0.5, 0.95))]
+        blocked = metrics.histogram("tts_blocked_seconds", "")
+        print(f"{label + ':':<17} first audio p50 {first_audio[0] * 1000:6.0f} ms, p95 {first_audio[1] * 1000:6.0f} ms; "
+              f"player blocked {blocked.sum / blocked.count * speed * 1000:6.0f} ms/message; total {elapsed:.0f}s")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def jain_index(values):
+    """Jain's fairness index: 1.0 when every value is equal, 1/n when one takes everything."""
+    if not values or not any(values):
+        return 0.0
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+
+def simulated_arrivals(rng, duration):
+    """One spammer, a few subscribers and a crowd of regular chatters, as (time, user, priority)."""
+    senders = [("spammer", 4.0, PRIORITY_CHAT)]
+    senders += [(f"sub{i}", 1 / 30, PRIORITY_HIGH) for i in range(5)]
+    senders += [(f"viewer{i}", 1 / 20, PRIORITY_CHAT) for i in range(30)]
+    arrivals = []
+    for user, rate, priority in senders:
+        t = rng.expovariate(rate)
+        while t < duration:
+            arrivals.append((t, user, priority))
+            t += rng.expovariate(rate)
+    arrivals.sort()
+    return arrivals
+
+
+def simulate_queue(arrivals, offer, take, service_time, duration):
+    """Runs a single-speaker queue on a virtual clock; returns (spoken, latencies)."""
+    spoken = collections.Counter()
+    latencies = []
+    free_at = 0.0
+    index = 0
+    now = 0.0
+    while now < duration:
+        while index < len(arrivals) and arrivals[index][0] <= now:
+            offer(*arrivals[index])
+            index += 1
+        entry = take(now)
+        if entry is None:
+            now = arrivals[index][0] if index < len(arrivals) else duration
+            continue
+        sent_at, user = entry
+        latencies.append(now - sent_at)
+        spoken[user] += 1
+        free_at = now + service_time
+        now = free_at
+    return spoken, latencies
+
+
+def bench_scheduler(args):
+    """Simulates the old bounded FIFO and the scheduler under one spammer plus normal chat."""
+    rng = random.Random(7)
+    arrivals = simulated_arrivals(rng, args.duration)
+    offered = collections.Counter(user for _, user, _ in arrivals)
+
+    def report(label, spoken, latencies, drops):
+        # Fairness is measured within the regular-chat class; subscribers are meant to come first
+        served = [spoken[u] / offered[u] for u in offered if u.startswith("viewer")]
+        subs = [u for u in offered if u.startswith("sub")]
+        sub_served = sum(spoken[u] for u in subs) * 100 / max(sum(offered[u] for u in subs), 1)
+        total = sum(spoken.values())
+        print(f"{label:28} spoken {total:4}  spammer share {spoken['spammer'] * 100 / max(total, 1):5.1f}%  "
+              f"subs served {sub_served:5.1f}%  viewer fairness {jain_index(served):.2f}  "
+              f"latency p50 {percentile(latencies, 50):5.1f}s p95 {percentile(latencies, 95):5.1f}s "
+              f"p99 {percentile(latencies, 99):5.1f}s  drops {drops}")
+
+    # The old behaviour: a FIFO gated on qsize() < max_queue_size, dropping whatever arrives last
+    fifo = collections.deque()
+    fifo_drops = [0]
+
+    def fifo_offer(t, user, priority):
+        if len(fifo) < args.queue_size:
+            fifo.append((t, user))
+        else:
+            fifo_drops[0] += 1
+
+    spoken, latencies = simulate_queue(arrivals, fifo_offer, lambda now: fifo.popleft() if fifo else None,
+                                       args.service_time, args.duration)
+    print(f"{len(arrivals)} messages over {args.duration:.0f}s, {args.service_time}s per spoken message, "
+          f"queue size {args.queue_size}")
+    report("legacy FIFO", spoken, latencies, fifo_drops[0])
+
+    for policy in DROP_POLICIES:
+        clock = [0.0]
+        scheduler = TTSScheduler(max_size=args.queue_size, max_latency=args.max_latency,
+                                 drop_policy=policy, clock=lambda: clock[0])
+
+        def offer(t, user, priority):
+            clock[0] = t
+            scheduler.put((t, user), user=user, priority=priority)
+
+        def take(now):
+            clock[0] = now
+            try:
+                return scheduler.pop()
+            except queue.Empty:
+                return None
+
+        spoken, latencies = simulate_queue(arrivals, offer, take, args.service_time, args.duration)
+        report(f"scheduler ({policy})", spoken, latencies, sum(scheduler.dropped.values()))
+
+
+COPYPASTAS = [
+    "this streamer is literally the best player i have ever seen in my entire life no cap",
+    "chat is this real or am i dreaming because that play was absolutely insane",
+    "i am once again asking for the streamer to stop throwing every single game",
+]
+SPAM_LINES = ["gg", "KEKW", "LUL LUL LUL", "W", "Pog", "OMEGALUL", "F", "ez clap"]
+
+
+def spam_burst(rng, count):
+    """Chat lines from a hype moment: emote spam and copypasta with small variations."""
+    lines = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.5:
+            lines.append(rng.choice(SPAM_LINES) + rng.choice(["", "", "!", " !!", " " + rng.choice(SPAM_LINES)]))
+        elif roll < 0.8:
+            words = rng.choice(COPYPASTAS).split()
+            if rng.random() < 0.5:
+                words[rng.randrange(len(words))] = rng.choice(SPAM_LINES)
+            lines.append(" ".join(words) + rng.choice(["", " KEKW", " Pog"]))
+        else:
+            lines.append(f"unique message {i} about {rng.choice(CHAT_WORDS)} {rng.random():.6f}")
+    return lines
+
+
+def bench_coalesce(args):
+    """Feeds recorded or synthetic spam bursts through the coalescer on a virtual clock."""
+    rng = random.Random(3)
+    if args.corpus:
+        lines = [m.trailing for m in map(parse_line, load_corpus(args.corpus, 0))
+                 if m and m.command == "PRIVMSG" and m.trailing]
+    else:
+        lines = spam_burst(rng, args.lines)
+    clock = [0.0]
+    emitted = []
+    coalescer = Coalescer(lambda item, user, priority: emitted.append(item), window=args.window,
+                          clock=lambda: clock[0])
+    max_open = 0
+    step = 1.0 / args.rate
+    start = time.perf_counter()
+    for i, text in enumerate(lines):
+        clock[0] = i * step
+        coalescer.add(f"user{rng.randrange(5000)}", text, 2)
+        with coalescer.lock:
+            ready = coalescer.due_groups()
+        coalescer.emit_groups(ready)
+        max_open = max(max_open, len(coalescer.groups))
+    elapsed = time.perf_counter() - start
+    clock[0] += args.window
+    coalescer.emit_groups(coalescer.due_groups())
+
+    print(f"messages:        {len(lines)} at {args.rate:.0f}/s, {args.window}s window")
+    print(f"throughput:      {len(lines) / elapsed:,.0f} messages/s ({elapsed / len(lines) * 1e6:.1f} us each)")
+    print(f"utterances out:  {len(emitted)} ({len(emitted) * 100 / len(lines):.1f}% of input)")
+    print(f"max open groups: {max_open}")
+    for item in emitted[:5]:
+        print(f"  e.g. {' '.join(item)[:80]}")
+
+
+def bench_history(args):
+    """Chat history ingestion rate, caller-side cost of recording, and lookup/search latency."""
+    rng = random.Random(11)
+    directory = tempfile.mkdtemp(prefix="tts-history-")
+    history = ChatHistory(os.path.join(directory, "history.db"))
+    try:
+        channels = [f"channel{i}" for i in range(args.channels)]
+        rows = [(rng.choice(channels), rng.choice(CHATTERS),
+                 " ".join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(1, 12)))) for _ in range(args.lines)]
+        slowest = 0.0
+        start = time.perf_counter()
+        for channel, user, text in rows:
+            call = time.perf_counter()
+            history.record_message(channel, user, text)
+            slowest = max(slowest, time.perf_counter() - call)
+        queued = time.perf_counter() - start
+        history.flush(timeout=600)
+        ingested = time.perf_counter() - start
+        dropped = history.dropped.total()
+
+        lookups = [(rng.choice(channels), rng.choice(CHATTERS)) for _ in range(10000)]
+        start = time.perf_counter()
+        returning = sum(1 for channel, user in lookups if history.last_seen(channel, user) is not None)
+        lookup_time = (time.perf_counter() - start) / len(lookups)
+
+        searches = [{"user": rng.choice(CHATTERS)}, {"channel": channels[0]}, {"text": "PogChamp"},
+                    {"text": "no such phrase anywhere"}]
+        print(f"messages:       {len(rows):,} across {len(channels)} channels")
+        print(f"record():       {queued / len(rows) * 1e6:.2f} us/call on the caller's thread, slowest {slowest * 1e6:.0f} us")
+        print(f"ingestion:      {(len(rows) - dropped) / ingested:,.0f} rows/s committed, {dropped:.0f} dropped "
+              f"(queue size {history.queue.maxsize:,})")
+        print(f"viewer lookup:  {lookup_time * 1e6:.1f} us ({returning} of {len(lookups)} returning)")
+        for filters in searches:
+            start = time.perf_counter()
+            found = history.search(limit=100, **filters)
+            print(f"search {filters}: {len(found)} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        history.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_greeter(args):
+    """Seen-users filter cost and accuracy at `--lines` viewers, and how a raid is welcomed."""
+    directory = tempfile.mkdtemp(prefix="tts-greeter-")
+    path = os.path.join(directory, "seen.bloom")
+    try:
+        seen = SeenUsers(path)
+        users = [f"viewer{i}" for i in range(args.lines)]
+        start = time.perf_counter()
+        for user in users:
+            seen.add("channel", user)
+        add_time = (time.perf_counter() - start) / len(users)
+        start = time.perf_counter()
+        missing = sum(1 for user in users if seen.lookup("channel", user) is None)
+        lookup_time = (time.perf_counter() - start) / len(users)
+        strangers = [f"stranger{i}" for i in range(100000)]
+        false_positives = sum(1 for user in strangers if seen.lookup("channel", user) is not None)
+        start = time.perf_counter()
+        seen.save()
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        reloaded = SeenUsers(path)
+        load_time = time.perf_counter() - start
+        still_known = all(reloaded.lookup("channel", user) is not None for user in users[:1000])
+        print(f"viewers:         {len(users):,} (filter sized for {1_000_000:,})")
+        print(f"filter memory:   {len(seen.bloom.array) / 1024 / 1024:.2f} MB, {seen.bloom.hashes} hashes, "
+              f"file {os.path.getsize(path) / 1024 / 1024:.2f} MB")
+        print(f"add / lookup:    {add_time * 1e6:.2f} / {lookup_time * 1e6:.2f} us per viewer ({missing} forgotten)")
+        print(f"false positives: {false_positives * 100 / len(strangers):.3f}% of {len(strangers):,} unseen names")
+        print(f"save / load:     {save_time * 1000:.1f} / {load_time * 1000:.1f} ms (survives restart: {still_known})")
+
+        # A simulated stream: the initial burst of JOINs for current viewers, a trickle of
+        # newcomers, then a 400-viewer raid in one second; the clock is driven by hand
+        now = [0.0]
+        welcomes = []
+        greeter = Greeter(lambda text, user: welcomes.append((now[0], text)), SeenUsers(),
+                          on_settled=lambda channel: welcomes.append((now[0], "(settled)")),
+                          clock=lambda: now[0])
+        greeter.watch("channel")
+        events = [(i * 4.0 / 300, f"current{i}") for i in range(300)]
+        events += [(20.0 + i * 7.0, f"newcomer{i}") for i in range(5)]
+        events += [(60.0 + i / 400, f"raider{i}") for i in range(400)]
+        events.sort()
+        arrivals = 0
+        for tick in range(int(90 / 0.25)):
+            now[0] = tick * 0.25
+            while arrivals < len(events) and events[arrivals][0] <= now[0]:
+                greeter.viewer_arrived("channel", events[arrivals][1])
+                arrivals += 1
+            greeter.process_arrivals()
+            with greeter.lock:
+                settled, ready = greeter.due(now[0])
+            for channel in settled:
+                greeter.on_settled(channel)
+            for batch in ready:
+                greeter.emit(batch.text(), batch.names[0])
+        print(f"simulated joins: {len(events)} (300 initial, 5 newcomers, 400 raiders) -> "
+              f"{sum(1 for _, text in welcomes if text != '(settled)')} welcomes")
+        for t, text in welcomes:
+            print(f"  {t:5.1f}s  {text}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+SPEECH_CHARS_PER_SECOND = 14.0  # Roughly 175 words per minute
+
+NOISY_LINES = [
+    "check this out https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+    "clip it clips.twitch.tv/FunnyClipName-AbCdEf123 KEKW",
+    "noooooooooooo waaaaaaay",
+    "hahahahahahahahahahaha",
+    "KEKW KEKW KEKW KEKW KEKW KEKW KEKW",
+    "gg\U000e0000",
+    "L\u0337\u0322U\u0338L\u0336 zalgo",
+    "\u28ff\u28ff\u28ff\u28ff\u28ff\u28ff\u28ff\u28ff ascii art",
+    "!!!!!!!!!!!!!!!!!!!",
+]
+
+
+def bench_normalize(args):
+    """Per-message cost of the text normalizer and how much less there is to speak."""
+    rng = random.Random(7)
+    if args.corpus:
+        messages = [(m.trailing, m.tag("emotes")) for m in map(parse_line, load_corpus(args.corpus, 0))
+                    if m and m.command == "PRIVMSG" and m.trailing]
+    else:
+        messages = []
+        for text in spam_burst(rng, args.lines // 2):
+            messages.append((text, None))
+        for _ in range(args.lines - len(messages)):
+            if rng.random() < 0.3:
+                messages.append((rng.choice(NOISY_LINES), None))
+            else:
+                messages.append(("Kappa " + " ".join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(1, 12))),
+                                 "25:0-4"))
+    normalizer = TextNormalizer()
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        spoken = [normalizer.normalize(text, emotes) for text, emotes in messages]
+        best = min(best, time.perf_counter() - start)
+    raw_chars = sum(len(text) for text, _ in messages)
+    spoken_chars = sum(map(len, spoken))
+    silent = sum(1 for text in spoken if not text)
+    print(f"messages:      {len(messages)}")
+    print(f"normalize:     {best / len(messages) * 1e6:.2f} us/message ({len(messages) / best:,.0f} messages/s)")
+    print(f"characters:    {raw_chars:,} -> {spoken_chars:,} ({spoken_chars * 100 / raw_chars:.0f}%)")
+    print(f"speech/msg:    {raw_chars / len(messages) / SPEECH_CHARS_PER_SECOND:.2f}s -> "
+          f"{spoken_chars / len(messages) / SPEECH_CHARS_PER_SECOND:.2f}s (estimated)")
+    print(f"nothing left:  {silent} messages ({silent * 100 / len(messages):.1f}%)")
+    for text in NOISY_LINES:
+        print(f"  {text[:50]!r} -> {normalizer.normalize(text)!r}")
+
+
+E2E_CHANNEL = "benchchannel"
+SCENARIOS = ("quiet", "busy", "raid")
+
+
+def poisson_times(rng, rate, start, end):
+    """Arrival times of a Poisson process with `rate` events per second in [start, end)."""
+    times = []
+    t = start + rng.expovariate(rate)
+    while t < end:
+        times.append(t)
+        t += rng.expovariate(rate)
+    return times
+
+
+def scenario_records(name, rng, channel=E2E_CHANNEL):
+    """Synthetic (offset, raw line) traffic for a named load scenario."""
+    records = []
+    if name == "quiet":
+        # A small stream: a message every couple of seconds, almost never repeated
+        for i, t in enumerate(poisson_times(rng, 0.5, 0.0, 20.0)):
+            user = rng.choice(CHATTERS[:50])
+            records.append((t, privmsg_line(channel, user, f"{rng.choice(CHAT_WORDS)} message {i}")))
+    elif name == "busy":
+        # A busy channel: steady chat with joins, parts and the odd PING
+        for t in poisson_times(rng, 25.0, 0.0, 20.0):
+            records.append((t, synthetic_line(rng, channel)))
+    elif name == "raid":
+        # Normal chat, then a raid: hundreds of joins in a second and a wave of copypasta and emote spam
+        for t in poisson_times(rng, 5.0, 0.0, 3.0):
+            records.append((t, synthetic_line(rng, channel)))
+        for i in range(400):
+            user = f"raider{i}"
+            records.append((3.0 + i / 400.0, f":{user}!{user}@{user}.tmi.twitch.tv JOIN #{channel}"))
+        spam = poisson_times(rng, 60.0, 3.5, 11.5)
+        for t, text in zip(spam, spam_burst(rng, len(spam))):
+            records.append((t, privmsg_line(channel, f"raider{rng.randrange(400)}", text)))
+        for t in poisson_times(rng, 10.0, 11.5, 20.0):
+            records.append((t, synthetic_line(rng, channel)))
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or 0.0 where it can't be read."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def wait_until(condition, timeout, interval=0.02):
+    """Polls `condition` until it is true or `timeout` seconds pass; returns its last value."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(interval)
+    return condition()
+
+
+def run_scenario(name, records, server, loop, args):
+    """Replays one scenario into a fresh ChatEngine and returns its results as a dict."""
+    speed = args.speed
+    scale = 1.0 / speed if speed > 0 else 0.0  # Simulated costs shrink with the replay speed
+    settings_dir = tempfile.mkdtemp(prefix="tts-bench-")
+    settings_file = os.path.join(settings_dir, "settings.json")
+    with open(settings_file, "w") as f:
+        json.dump({"history_file": os.path.join(settings_dir, "history.db"),
+                   "seen_users_file": os.path.join(settings_dir, "seen_users.bloom")}, f)
+    engine = ChatEngine(settings_file,
+                        backend=NullBackend(args.synth_cost * scale), player=NullPlayer(speed))
+    engine.update_settings({
+        "irc_server": server.host,
+        "irc_port": server.port,
+        "message_delay": args.delay * scale,
+        "coalesce_window": args.window * scale,
+        "tts_max_latency": args.max_latency * scale,
+        "max_queue_size": args.queue_size,
+        "synth_workers": args.workers,
+    })
+    metrics = engine.metrics.metrics
+    engine.connect([E2E_CHANNEL])
+    try:
+        if not wait_until(lambda: E2E_CHANNEL in server.joined_channels(), 10):
+            raise RuntimeError("the client never joined the benchmark channel")
+        received = metrics["irc_lines_received_total"]
+        wait_until(received.total, 5)
+        time.sleep(0.2)  # Let the rest of the handshake (353/366) arrive before counting replayed lines
+        baseline = received.total()
+
+        start = time.perf_counter()
+        sent = asyncio.run_coroutine_threadsafe(server.replay(records, speed, E2E_CHANNEL), loop).result()
+        wait_until(lambda: received.total() - baseline >= sent, 30)
+        replay_time = time.perf_counter() - start
+
+        # Wait for every utterance to be spoken or dropped
+        scheduler, coalescer, pipeline = engine.tts_queue, engine.coalescer, engine.tts_pipeline
+        spoken, errors = metrics["tts_spoken_total"], metrics["tts_errors_total"]
+
+        def settled():
+            if coalescer.groups:
+                return False
+            outcomes = spoken.total() + errors.total() + sum(scheduler.dropped.values())
+            return outcomes >= coalescer.utterances_out
+
+        drained = wait_until(settled, args.drain_timeout)
+        total_time = time.perf_counter() - start
+    finally:
+        engine.close()
+        shutil.rmtree(settings_dir, ignore_errors=True)
+
+    def percentiles(metric_name):
+        values = metrics[metric_name].percentiles((0.5, 0.95, 0.99), window=float("inf"))
+        return [round(value, 9) for value in values] if values else None
+
+    utterances = coalescer.utterances_out
+    dropped = dict(scheduler.dropped)
+    return {
+        "scenario": name,
+        "speed": speed,
+        "lines_sent": sent,
+        "lines_received": int(received.total() - baseline),
+        "replay_seconds": round(replay_time, 3),
+        "lines_per_second": round((received.total() - baseline) / max(replay_time, 1e-9), 1),
+        "parse_seconds": percentiles("irc_parse_seconds"),
+        "chat_messages": coalescer.messages_in,
+        "utterances": utterances,
+        "spoken": int(spoken.total()),
+        "errors": int(errors.total()),
+        "dropped": dropped,
+        "drop_rate": round(sum(dropped.values()) / utterances, 4) if utterances else 0.0,
+        "queue_wait_seconds": percentiles("tts_queue_wait_seconds"),
+        "end_to_end_seconds": percentiles("tts_end_to_end_seconds"),
+        "drained": drained,
+        "total_seconds": round(total_time, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def print_scenario(result):
+    """Prints one scenario's results as a readable block."""
+    def ms(values):
+        if not values:
+            return "--"
+        return " / ".join(f"{value * 1000:.1f}" for value in values) + " ms (p50/p95/p99)"
+
+    def us(values):
+        if not values:
+            return "--"
+        return " / ".join(f"{value * 1e6:.2f}" for value in values) + " us (p50/p95/p99)"
+
+    speed = "max speed" if not result["speed"] else f"{result['speed']:g}x"
+    drops = ", ".join(f"{reason} {count}" for reason, count in sorted(result["dropped"].items())) or "none"
+    print(f"== {result['scenario']} ({speed})")
+    print(f"   lines:         {result['lines_received']}/{result['lines_sent']} in {result['replay_seconds']:.2f}s "
+          f"({result['lines_per_second']:,.0f} lines/s)")
+    print(f"   parse:         {us(result['parse_seconds'])}")
+    print(f"   chat -> TTS:   {result['chat_messages']} messages -> {result['utterances']} utterances, "
+          f"{result['spoken']} spoken, {result['errors']} errors")
+    print(f"   drops:         {drops} (drop rate {result['drop_rate'] * 100:.1f}%)")
+    print(f"   queue wait:    {ms(result['queue_wait_seconds'])}")
+    print(f"   end to end:    {ms(result['end_to_end_seconds'])}")
+    print(f"   memory:        peak RSS {result['peak_rss_mb']:.1f} MB")
+    if not result["drained"]:
+        print(f"   (TTS was still busy when the run ended after {result['total_seconds']:.0f}s)")
+
+
+# Baseline comparisons: (result key, index of the p99 in its percentiles or None, lower is better, absolute slack)
+# The slack keeps tiny baselines (a 0% drop rate, microsecond latencies) from failing on noise
+E2E_COMPARED = (
+    ("lines_per_second", None, False, 0.0),
+    ("parse_seconds", 2, True, 20e-6),
+    ("end_to_end_seconds", 2, True, 0.005),
+    ("drop_rate", None, True, 0.02),
+    ("peak_rss_mb", None, True, 5.0),
+)
+
+
+def load_baseline(path):
+    """Reads results saved with `e2e --json`, by scenario."""
+    with open(path, "r", encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return {result["scenario"]: result for result in results}
+
+
+def result_value(result, key, index):
+    value = result.get(key)
+    if value is not None and index is not None:
+        value = value[index]
+    return value
+
+
+def check_scenario(result, args, baseline=None):
+    """Returns why a scenario run fails its limits or its baseline; an empty list if it passes."""
+    failures = []
+    if result["lines_received"] < result["lines_sent"]:
+        failures.append(f"received {result['lines_received']} of {result['lines_sent']} lines")
+    if result["errors"]:
+        failures.append(f"{result['errors']} TTS errors")
+    if not result["drained"]:
+        failures.append(f"TTS didn't drain within {args.drain_timeout:g}s")
+    p99 = result_value(result, "end_to_end_seconds", 2)
+    if args.max_p99 is not None and p99 is not None and p99 > args.max_p99:
+        failures.append(f"end-to-end p99 {p99 * 1000:.1f} ms is over {args.max_p99 * 1000:.1f} ms")
+    if args.max_drop_rate is not None and result["drop_rate"] > args.max_drop_rate:
+        failures.append(f"drop rate {result['drop_rate']:.1%} is over {args.max_drop_rate:.1%}")
+    if args.min_lines_per_second is not None and result["lines_per_second"] < args.min_lines_per_second:
+        failures.append(f"{result['lines_per_second']:,.0f} lines/s is under {args.min_lines_per_second:,.0f}")
+    if baseline is not None:
+        for key, index, lower_is_better, slack in E2E_COMPARED:
+            value, before = result_value(result, key, index), result_value(baseline, key, index)
+            if value is None or before is None:
+                continue
+            worse = (value > before * (1 + args.tolerance) + slack if lower_is_better
+                     else value < before * (1 - args.tolerance) - slack)
+            if worse:
+                label = key if index is None else f"{key} p99"
+                failures.append(f"{label} {value:g} is worse than the baseline's {before:g}")
+    return failures
+
+
+def bench_e2e(args):
+    """Replays load scenarios through the fake TMI server into a real engine with a null TTS backend.
+
+    Returns 1 if any scenario fails its checks (see `check_scenario`), else 0.
+    """
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(FakeTMIServer().start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    rng = random.Random(11)
+    if args.recording:
+        scenarios = [(os.path.basename(args.recording), list(read_recording(args.recording)))]
+    else:
+        names = SCENARIOS if args.scenario == "all" else [args.scenario]
+        scenarios = [(name, scenario_records(name, rng)) for name in names]
+    if args.write:
+        for name, records in scenarios:
+            path = args.write if len(scenarios) == 1 else f"{args.write}.{name}"
+            write_recording(path, records)
+            print(f"wrote {len(records)} lines of {name} to {path}")
+    baselines = load_baseline(args.baseline) if args.baseline else {}
+    failed = []
+    try:
+        for name, records in scenarios:
+            result = run_scenario(name, records, server, loop, args)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print_scenario(result)
+            if args.baseline and name not in baselines:
+                print(f"   (no baseline for {name} in {args.baseline})", file=sys.stderr)
+            for failure in check_scenario(result, args, baselines.get(name)):
+                failed.append(name)
+                print(f"   FAIL {name}: {failure}", file=sys.stderr)  # stderr keeps --json output parseable
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+    if failed:
+        print(f"e2e failed: {', '.join(dict.fromkeys(failed))}", file=sys.stderr)
+        return 1
+    return 0
+
+
+BENCHMARKS = {
+    "chunking": bench_chunking,
+    "coalesce": bench_coalesce,
+    "e2e": bench_e2e,
+    "greeter": bench_greeter,
+    "history": bench_history,
+    "normalize": bench_normalize,
+    "outbound": bench_outbound,
+    "parser": bench_parser,
+    "pipeline": bench_pipeline,
+    "receive": bench_receive,
+    "reconnect": bench_reconnect,
+    "scheduler": bench_scheduler,
+}
+
+
+def main():
+    """Parses the command line and runs the selected benchmark."""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    arg_parser.add_argument("--corpus", help="file of raw IRC lines to replay")
+    arg_parser.add_argument("--lines", type=int, default=200000, help="synthetic corpus size")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="passes per measurement")
+    arg_parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE, help="receive buffer size")
+    arg_parser.add_argument("--channels", type=int, default=6, help="channels to join")
+    arg_parser.add_argument("--shard-size", type=int, default=2, help="channels per connection")
+    arg_parser.add_argument("--drops", type=int, default=5, help="scheduled connection drops")
+    arg_parser.add_argument("--drop-interval", type=float, default=1.0, help="seconds between drops")
+    arg_parser.add_argument("--messages", type=int, default=20, help="TTS messages to speak")
+    arg_parser.add_argument("--synth-cost", type=float, default=0.3, help="simulated seconds per synthesis")
+    arg_parser.add_argument("--play-cost", type=float, default=0.3, help="simulated seconds per playback")
+    arg_parser.add_argument("--delay", type=float, default=0.0, help="message_delay between messages")
+    arg_parser.add_argument("--workers", type=int, default=1, help="synthesis workers")
+    arg_parser.add_argument("--engine", choices=sorted(BACKENDS), default="null", help="pipeline: speech engine")
+    arg_parser.add_argument("--processes", type=int, default=0, help="pipeline: engine worker processes")
+    arg_parser.add_argument("--char-cost", type=float, default=0.004, help="chunking: simulated synthesis seconds per character")
+    arg_parser.add_argument("--chunk-chars", type=int, default=120, help="chunking: chunk size to compare with whole messages")
+    arg_parser.add_argument("--play-speed", type=float, default=20.0, help="chunking: simulated playback speed-up")
+    arg_parser.add_argument("--time-scale", type=float, default=10.0, help="outbound: shorten Twitch's limit windows this many times")
+    arg_parser.add_argument("--duration", type=float, default=1800.0, help="simulated seconds of chat")
+    arg_parser.add_argument("--service-time", type=float, default=3.0, help="seconds to speak one message")
+    arg_parser.add_argument("--queue-size", type=int, default=10, help="TTS queue size")
+    arg_parser.add_argument("--max-latency", type=float, default=60.0, help="scheduler max latency")
+    arg_parser.add_argument("--rate", type=float, default=200.0, help="chat messages per second")
+    arg_parser.add_argument("--window", type=float, default=1.5, help="coalescing window in seconds")
+    arg_parser.add_argument("--scenario", choices=("all",) + SCENARIOS, default="all", help="e2e scenario to run")
+    arg_parser.add_argument("--recording", help="e2e: replay this recording instead of the synthetic scenarios")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="e2e replay speed, 0 for as fast as possible")
+    arg_parser.add_argument("--drain-timeout", type=float, default=30.0, help="e2e: seconds to wait for TTS to finish")
+    arg_parser.add_argument("--write", help="e2e: also save the scenario traffic as a recording file")
+    arg_parser.add_argument("--json", action="store_true", help="e2e: print one JSON line per scenario")
+    arg_parser.add_argument("--baseline", help="e2e: fail scenarios that are worse than in this saved --json output")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25, help="e2e: how much worse than the baseline is allowed, as a fraction")
+    arg_parser.add_argument("--max-p99", type=float, help="e2e: fail if end-to-end p99 latency is over this many seconds")
+    arg_parser.add_argument("--max-drop-rate", type=float, help="e2e: fail if more than this fraction of utterances is dropped")
+    arg_parser.add_argument("--min-lines-per-second", type=float, help="e2e: fail if the replay is received slower than this")
+    args = arg_parser.parse_args()
+    sys.exit(BENCHMARKS[args.benchmark](args))
+
+
+if __name__ == "__main__":
+    main()
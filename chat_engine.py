@@ -0,0 +1,793 @@
+"""GUI-free core of the chat TTS bot: IRC, TTS and settings.
+
+ChatEngine owns the IRC client, the coalescer, the TTS scheduler and
+pipeline, the audio cache, the viewer list and the settings file. Front-ends
+drive it through plain method calls (`connect`, `disconnect`,
+`update_settings`) and follow it through `subscribe`, which hands them a
+queue of `(type, content)` events: "status", "message", "latency",
+"tts_stats" and "connection". The Tk GUI and the local control API are both
+just clients of one engine.
+
+Run this module directly for headless (daemon) mode:
+
+    python chat_engine.py --channels somechannel --control-port 8765
+"""
+import argparse
+import functools
+import os
+import queue
+import re
+import signal
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from irc_client import TWITCH_IRC_HOST, TWITCH_IRC_PORT, IRCClient
+from irc_parser import CommandDispatcher
+from irc_reader import DEFAULT_BUFFER_SIZE
+from audio_cache import AudioCache, CachingBackend
+from chat_history import ChatHistory
+from greeter import Greeter, SeenUsers
+from coalescer import Coalescer
+from irc_recording import IRCRecorder
+from metrics import PARSE_BUCKETS, MetricsRegistry
+from sampling_profiler import SamplingProfiler
+from settings_store import SettingsSchema, SettingsStore
+from text_normalizer import URL_DOMAIN, URL_MODES, TextNormalizer, get_normalizer
+from tts_backends import BACKENDS, NullBackend, ProcessPoolBackend, create_backend
+from tts_pipeline import CAP_POLICIES, CAP_SKIP, CAP_TRUNCATE, NullPlayer, TTSPipeline, play_wav
+from tts_scheduler import DROP_LOWEST_PRIORITY, DROP_POLICIES, PRIORITY_GREETING, TTSScheduler, message_priority
+from viewer_list import ViewerTracker
+
+# --- EDIT THESE VALUES ---
+# Use the token you generated from the Twitch Developer console.
+OAUTH_TOKEN = os.environ.get("TWITCH_OAUTH_TOKEN", "oauth:YourOAuthTOKEN")
+# Use the name of your bot account.
+BOT_USERNAME = os.environ.get("TWITCH_BOT_USERNAME", "USERNAMEofYourBotsTwitchAccount")
+
+# --- Do not edit below this line unless you know what you are doing ---
+
+DEFAULT_SETTINGS_FILE = "tts_settings.json"
+
+# Every setting stored in the settings file, with its default
+DEFAULT_SETTINGS = {
+    "tts_enabled": True,  # Speak chat at all; moderators can switch it with "!tts on" / "!tts off"
+    "chat_commands": True,  # Moderators can control TTS from chat with !tts commands
+    "speech_engine": "pyttsx3",  # One of tts_backends.BACKENDS
+    "voice_id": None,
+    "rate": 175,
+    "volume": 1.0,
+    "voice_per_user": False,  # Read each chatter in a voice picked from their name
+    "user_voices": {},  # Voice ids for particular users (lowercase names); these win over voice_per_user
+    "synth_processes": 0,  # Worker processes with their own engine each; 0 synthesizes in this process
+    "espeak_command": "espeak-ng",
+    "piper_command": "piper",
+    "piper_model": "",  # Default Piper voice (.onnx file); other models in its directory are offered as voices
+    "max_queue_size": 10,  # Max messages to buffer for TTS
+    "tts_max_latency": 60.0,  # Messages waiting longer than this are skipped
+    "tts_drop_policy": DROP_LOWEST_PRIORITY,  # What to drop when the TTS queue is full
+    "tts_normalize": True,  # Shorten links, emote spam and stretched words before speaking (see text_normalizer)
+    "tts_url_mode": URL_DOMAIN,  # Links are read as "link to example.com", or removed
+    "emote_map_file": "",  # JSON object of extra emote name -> spoken text ("" to drop the emote)
+    "coalesce_window": 1.5,  # Seconds to collect repeats of a message before speaking it once
+    "coalesce_threshold": 0.6,  # Similarity at which two messages count as the same
+    "message_delay": 1.0,  # Delay in seconds between TTS messages
+    "tts_chunk_chars": 120,  # Long messages are rendered and played in chunks of about this size; 0 renders them whole
+    "tts_max_message_chars": 0,  # Longer messages are capped; 0 for no limit
+    "tts_max_message_seconds": 20.0,  # Longer messages are capped; 0 for no limit
+    "tts_cap_policy": CAP_TRUNCATE,  # What happens to a capped message: truncate or skip it
+    "max_chat_lines": 25,  # Lines kept in the GUI chat log
+    "gui_frame_budget_ms": 15,  # Time the GUI may spend draining messages per tick
+    "synth_workers": 1,  # Threads rendering messages ahead of playback
+    "synth_lookahead": 3,  # Messages rendered ahead of the one playing
+    "audio_cache_mb": 32,  # Memory for cached audio of repeated phrases
+    "audio_cache_dir": "",  # Directory for the on-disk audio cache; empty disables it
+    "audio_cache_disk_mb": 256,
+    "recv_buffer_size": DEFAULT_BUFFER_SIZE,  # Initial size of the IRC receive buffer
+    "channels_per_connection": 50,  # Channels sharded onto each IRC connection
+    "ping_interval": 30.0,  # Seconds between keepalive/latency PINGs
+    "irc_server": TWITCH_IRC_HOST,
+    "irc_port": TWITCH_IRC_PORT,
+    "last_channel": "",
+    "history_file": "chat_history.db",  # SQLite chat and viewer history (see chat_history); empty disables it
+    "greet_viewers": True,  # Welcome new viewers (and returning ones, see greet_welcome_back_hours) by TTS
+    "greet_batch_window": 3.0,  # Viewers arriving within this many seconds of each other are welcomed together
+    "greet_settle_rate": 1.0,  # After joining, greetings start once fewer joins per second than this arrive
+    "greet_welcome_back_hours": 12.0,  # Viewers away for longer are welcomed back; needs the chat history
+    "seen_users_file": "seen_users.bloom",  # Every viewer ever seen (see greeter); empty keeps them in memory only
+    "record_file": "",  # Raw IRC traffic is recorded here (see irc_recording) while connected; empty disables it
+    "control_host": "127.0.0.1",  # Interface the control API listens on
+    "control_port": 8765,  # Port of the control API; 0 disables it in headless mode
+    "control_token": "",  # If set, control API requests must carry this token
+}
+
+SUBSCRIBER_QUEUE_SIZE = 1000  # Events buffered per subscriber before new ones are dropped
+TTS_COMMAND = "!tts"
+TTS_COMMAND_USAGE = "Usage: !tts on | off | clear [user] | status"
+
+
+CHANNEL_NAME = re.compile(r"[a-z0-9_]{1,25}")  # A Twitch login, lowercased
+
+
+def parse_channels(channels):
+    """Turns a channel list (a comma or space separated string, or a list of names) into unique channel names.
+
+    Raises ValueError for anything that isn't a channel name, so nothing
+    from a front-end can smuggle raw IRC (a CR/LF and a command) into a JOIN.
+    """
+    if isinstance(channels, str):
+        channels = channels.replace(",", " ").split()
+    elif not isinstance(channels, (list, tuple)):
+        raise ValueError("Channels must be a list of names.")
+    names = []
+    for name in channels:
+        if not isinstance(name, str):
+            raise ValueError(f"Invalid channel name: {name!r}")
+        name = name.strip().lower().lstrip("#")
+        if not name:
+            continue
+        if not CHANNEL_NAME.fullmatch(name):
+            raise ValueError(f"Invalid channel name: {name!r}")
+        if name not in names:
+            names.append(name)
+    return names
+
+
+# The typed schema of the settings file: the defaults' types, the allowed values of the choices and number ranges
+SETTINGS_SCHEMA = SettingsSchema(DEFAULT_SETTINGS, choices={
+    "speech_engine": BACKENDS,
+    "tts_drop_policy": DROP_POLICIES,
+    "tts_cap_policy": CAP_POLICIES,
+    "tts_url_mode": URL_MODES,
+}, bounds={
+    "rate": (1, None),
+    "volume": (0.0, 1.0),
+    "synth_processes": (0, None),
+    "max_queue_size": (1, None),
+    "tts_max_latency": (0.0, None),  # 0 never skips
+    "coalesce_window": (0.0, None),
+    "coalesce_threshold": (0.0, 1.0),
+    "message_delay": (0.0, None),
+    "tts_chunk_chars": (0, None),
+    "tts_max_message_chars": (0, None),
+    "tts_max_message_seconds": (0.0, None),
+    "max_chat_lines": (1, None),
+    "gui_frame_budget_ms": (1, None),
+    "synth_workers": (1, None),
+    "synth_lookahead": (1, None),
+    "audio_cache_mb": (0, None),
+    "audio_cache_disk_mb": (0, None),
+    "recv_buffer_size": (1024, None),
+    "channels_per_connection": (1, None),
+    "ping_interval": (1.0, None),  # Shorter would flood the server with PINGs
+    "irc_port": (1, 65535),
+    "control_port": (0, 65535),
+    "greet_batch_window": (0.0, None),
+    "greet_settle_rate": (0.0, None),
+    "greet_welcome_back_hours": (0.0, None),
+})
+PIPELINE_SETTINGS = ("message_delay", "tts_chunk_chars", "tts_max_message_chars", "tts_max_message_seconds",
+                     "tts_cap_policy")
+ENGINE_SETTINGS = ("speech_engine", "synth_processes", "espeak_command", "piper_command", "piper_model")
+VOICE_SETTINGS = ("voice_id", "rate", "volume")
+
+
+class ChatEngine:
+    """IRC client, TTS pipeline and settings, without any GUI."""
+
+    def __init__(self, settings_file=DEFAULT_SETTINGS_FILE, token=OAUTH_TOKEN, username=BOT_USERNAME,
+                 backend=None, player=play_wav):
+        self.settings_file = settings_file
+        self.token = token
+        self.username = username
+
+        # Front-ends listening for events; each gets its own queue
+        self.listeners = []
+        self.listeners_lock = threading.Lock()
+
+        # Settings live in the store; each is mirrored as an attribute for reading, and changed with update_settings
+        self.settings_store = SettingsStore(settings_file, SETTINGS_SCHEMA,
+                                            on_error=lambda text: self.post("status", text),
+                                            on_reload=self.on_settings_reloaded)
+        self.settings_lock = self.settings_store.lock  # Also held while components apply changed settings
+        self.settings_store.subscribe(self.mirror_settings)
+        self.mirror_settings(self.settings_store.values)
+
+        # IRC and threading variables
+        self.irc_client = None
+        # Applies settings changed by chat commands, in order, so the IRC loop never waits for settings_lock,
+        # which disconnect() holds while it waits for the loop to stop
+        self.command_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-commands")
+        self.recorder = None
+        self.record_override = None  # Recording path for this run only, e.g. from --record
+        self.tts_pipeline = None
+        self.player = player
+        self.running = False
+        self.connected_channels = []
+        self.viewers = ViewerTracker()  # Who is in which channel, plus the changes front-ends haven't drawn yet
+        self.latency = None
+        self.tts_stats = "TTS: --"
+
+        self.voice_ids = None  # The engine's voices for voice_per_user; listed on first use
+
+        # Stage-by-stage metrics shared with every component, and a profiler that is off until asked for
+        self.metrics = MetricsRegistry()
+        self.profiler = SamplingProfiler()
+
+        self.settings_store.load()
+        self.normalizer = self.build_normalizer()
+        self.normalize_latency = self.metrics.histogram(
+            "text_normalize_seconds", "Time to normalize one chat message for speech", buckets=PARSE_BUCKETS)
+        self.text_chars = self.metrics.counter("tts_text_chars_total", "Characters of chat before and after normalization")
+        self.tts_queue = TTSScheduler(self.max_queue_size, self.tts_max_latency, self.tts_drop_policy,
+                                      on_drop=self.on_tts_drop,
+                                      metrics=self.metrics)  # Messages to be spoken, by priority and fairness
+        self.coalescer = Coalescer(
+            lambda item, user, priority: self.tts_queue.put(item, user=user, priority=priority),
+            window=self.coalesce_window,
+            threshold=self.coalesce_threshold,
+            on_error=lambda text: self.post("status", text),
+        )
+        self.audio_cache = AudioCache(
+            max_memory_bytes=self.audio_cache_mb * 1024 * 1024,
+            disk_dir=self.audio_cache_dir or None,
+            max_disk_bytes=self.audio_cache_disk_mb * 1024 * 1024,
+        )
+        self.history = self.open_history()
+        self.greeter = Greeter(self.welcome, self.open_seen_users(), on_settled=self.on_greeter_settled)
+        self.configure_greeter()
+        self.tts_backend = CachingBackend(backend or self.build_backend(), self.audio_cache, voice_for=self.voice_for)
+        self.register_metrics()
+        self.watch_settings()
+        self.settings_store.start()
+
+    def open_history(self):
+        """Opens the chat history database, or returns None if it is disabled or can't be opened."""
+        if not self.history_file:
+            return None
+        try:
+            return ChatHistory(self.history_file, metrics=self.metrics,
+                               on_error=lambda text: self.post("status", text))
+        except (OSError, sqlite3.Error) as e:
+            self.post("status", f"Chat history disabled, could not open {self.history_file}: {e}")
+            return None
+
+    def open_seen_users(self):
+        """Opens the seen-users filter, reporting file problems as status messages."""
+        return SeenUsers(self.seen_users_file, self.history, on_error=lambda text: self.post("status", text))
+
+    def search_history(self, text=None, user=None, channel=None, since=None, limit=100):
+        """Stored chat lines matching the filters, newest first; raises ValueError if there is no history."""
+        if self.history is None:
+            raise ValueError("Chat history is disabled.")
+        return self.history.search(text=text, user=user, channel=channel, since=since, limit=limit)
+
+    def register_metrics(self):
+        """Exposes counts the components already keep through the metrics registry."""
+        metrics = self.metrics
+        metrics.gauge("connected", "1 while connected to Twitch", callback=lambda: self.running)
+        metrics.gauge("channels", "Joined channels", callback=lambda: len(self.connected_channels))
+        metrics.gauge("viewers", "Known viewers across joined channels", callback=lambda: len(self.viewers))
+        metrics.gauge("irc_latency_seconds", "Worst PING round trip across connections", callback=lambda: self.latency or 0.0)
+        metrics.counter("coalescer_messages_total", "Chat messages offered to the coalescer",
+                        callback=lambda: self.coalescer.messages_in)
+        metrics.counter("coalescer_utterances_total", "TTS entries left after coalescing",
+                        callback=lambda: self.coalescer.utterances_out)
+        metrics.counter("audio_cache_memory_hits_total", "Audio served from the memory cache",
+                        callback=lambda: self.audio_cache.memory_hits)
+        metrics.counter("audio_cache_disk_hits_total", "Audio served from the disk cache",
+                        callback=lambda: self.audio_cache.disk_hits)
+        metrics.counter("audio_cache_misses_total", "Phrases that had to be synthesized",
+                        callback=lambda: self.audio_cache.misses)
+        metrics.gauge("audio_cache_memory_bytes", "Audio held in the memory cache",
+                      callback=lambda: self.audio_cache.memory_bytes)
+
+    # --- Events ---
+
+    def subscribe(self, listener=None):
+        """Registers a queue for engine events and returns it."""
+        if listener is None:
+            listener = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.listeners_lock:
+            self.listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        """Stops sending events to a queue returned by `subscribe`."""
+        with self.listeners_lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def post(self, message_type, content):
+        """Sends an event to every subscriber; a subscriber that has fallen behind misses it."""
+        with self.listeners_lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener.put_nowait((message_type, content))
+            except queue.Full:
+                pass
+
+    # --- Settings ---
+
+    def settings(self):
+        """Returns every setting as a dict."""
+        return self.settings_store.snapshot()
+
+    def update_settings(self, changes):
+        """Validates and applies a dict of setting changes, and saves them shortly after; returns the new settings.
+
+        Raises ValueError, changing nothing, for unknown settings or invalid values.
+        """
+        with self.settings_lock:
+            self.settings_store.update(changes)
+            return self.settings()
+
+    def mirror_settings(self, changes):
+        """Keeps each setting readable as an attribute of the engine."""
+        for key, value in changes.items():
+            setattr(self, key, value)
+
+    def watch_settings(self):
+        """Subscribes each component to the settings it uses, so changes apply without reconnecting."""
+        subscribe = self.settings_store.subscribe
+        subscribe(self.configure_queue, ("max_queue_size", "tts_max_latency", "tts_drop_policy"))
+        subscribe(self.configure_coalescer, ("coalesce_window", "coalesce_threshold"))
+        subscribe(self.configure_greeter, ("greet_batch_window", "greet_settle_rate", "greet_welcome_back_hours"))
+        subscribe(self.configure_running_pipeline, PIPELINE_SETTINGS)
+        subscribe(self.reopen_history, ("history_file",))
+        subscribe(self.reopen_seen_users, ("seen_users_file",))
+        subscribe(self.rebuild_normalizer, ("tts_url_mode", "emote_map_file"))
+        subscribe(self.configure_voice, ENGINE_SETTINGS + VOICE_SETTINGS)
+
+    def configure_queue(self, changes):
+        self.tts_queue.configure(self.max_queue_size, self.tts_max_latency, self.tts_drop_policy)
+
+    def configure_coalescer(self, changes):
+        self.coalescer.window = self.coalesce_window
+        self.coalescer.threshold = self.coalesce_threshold
+
+    def configure_running_pipeline(self, changes):
+        if self.tts_pipeline:
+            self.configure_pipeline(self.tts_pipeline)
+
+    def rebuild_normalizer(self, changes):
+        self.normalizer = self.build_normalizer()
+
+    def reopen_history(self, changes):
+        """Switches to the history database named by history_file."""
+        if self.history:
+            self.history.close()
+        self.history = self.open_history()
+        self.greeter.seen.history = self.history
+
+    def reopen_seen_users(self, changes):
+        """Saves the seen-users filter and switches to the one named by seen_users_file."""
+        self.greeter.seen.save()
+        self.greeter.seen = self.open_seen_users()
+
+    def configure_voice(self, changes):
+        """Rebuilds the speech engine if its settings changed, or else applies the new voice settings."""
+        if any(key in changes for key in ENGINE_SETTINGS):
+            self.tts_backend.set_backend(self.build_backend()).close()
+            self.voice_ids = None
+        else:
+            self.tts_backend.configure(self.voice_id, self.rate, self.volume)  # Also drops cached audio for the old voice
+
+    def on_settings_reloaded(self, changes):
+        """Called by the settings store after applying an outside edit of the settings file."""
+        self.post("status", f"Reloaded {', '.join(sorted(changes))} from {self.settings_file}.")
+
+    def build_normalizer(self):
+        """The shared text normalizer for the current settings; the defaults if the emote file can't be read."""
+        try:
+            return get_normalizer(self.emote_map_file, self.tts_url_mode)
+        except (OSError, ValueError) as e:
+            self.post("status", f"Could not load emote map {self.emote_map_file}: {e}")
+            return TextNormalizer(url_mode=self.tts_url_mode)
+
+    def speech_text(self, text, emotes_tag=None):
+        """The part of a chat message worth speaking, or "" if there is none."""
+        if not self.tts_normalize:
+            return text
+        start = time.perf_counter()
+        spoken = self.normalizer.normalize(text, emotes_tag)
+        self.normalize_latency.observe(time.perf_counter() - start)
+        self.text_chars.inc(len(text), stage="raw")
+        self.text_chars.inc(len(spoken), stage="spoken")
+        return spoken
+
+    # --- Voices ---
+
+    def build_backend(self):
+        """Creates the configured speech engine, in a process pool if synth_processes is set."""
+        options = {
+            "espeak-ng": {"command": self.espeak_command},
+            "piper": {"command": self.piper_command, "model": self.piper_model},
+        }.get(self.speech_engine, {})
+        if self.synth_processes > 0:
+            return ProcessPoolBackend(self.speech_engine, self.synth_processes,
+                                      self.voice_id, self.rate, self.volume, **options)
+        return create_backend(self.speech_engine, self.voice_id, self.rate, self.volume, **options)
+
+    def voices(self):
+        """Returns the speech engine's voices as a list of (id, name) pairs."""
+        return self.tts_backend.backend.voices()
+
+    def voice_for(self, item):
+        """The voice to read a queue entry in, or None for the default voice.
+
+        Users in `user_voices` get their own voice; with `voice_per_user` the
+        others get one picked from a hash of their name, so a chatter keeps the
+        same voice from message to message and across restarts.
+        """
+        user = getattr(item, "user", None)
+        if not user:
+            return None
+        user = user.lower()
+        voice_id = self.user_voices.get(user)
+        if voice_id or not self.voice_per_user:
+            return voice_id
+        if self.voice_ids is None:
+            try:
+                self.voice_ids = [voice_id for voice_id, _ in self.voices()]
+            except Exception as e:
+                self.voice_ids = []
+                self.post("status", f"Could not list voices for per-user voices: {e}")
+        if not self.voice_ids:
+            return None
+        return self.voice_ids[zlib.crc32(user.encode("utf-8")) % len(self.voice_ids)]
+
+    def test_voice(self, rate=None, volume=None, voice_id=None):
+        """Speaks a test sentence with the given (or current) settings on a background thread.
+
+        The sentence is synthesized by the pipeline's backend, which is safe
+        to call from any thread, and never enters the audio cache.
+        """
+        def speak():
+            try:
+                self.player(self.tts_backend.backend.synthesize(
+                    "This is a test of the current settings.", voice_id, rate, volume))
+            except Exception as e:
+                self.post("status", f"TTS test failed: {e}")
+        threading.Thread(target=speak, daemon=True).start()
+
+    # --- Connection ---
+
+    def connect(self, channels):
+        """Joins the given channels and starts the TTS pipeline; raises ValueError if it can't."""
+        channels = parse_channels(channels)
+        if not channels:
+            raise ValueError("Please enter a channel name.")
+        with self.settings_lock:
+            if self.running:
+                raise ValueError("Already connected.")
+            self.running = True
+            try:
+                self.start_session(channels)
+            except BaseException:
+                self.stop_session()  # Whatever did start; otherwise every later connect says "Already connected."
+                raise
+        self.post("connection", list(channels))
+
+    def start_session(self, channels):
+        """Starts the IRC client, the greeter and the TTS pipeline; caller holds settings_lock."""
+        self.connected_channels = channels
+        self.settings_store.update({"last_channel": ", ".join(channels)})  # Remembered for the next start
+        self.viewers.clear()  # Clear viewer list on new connection
+
+        record_file = self.record_override or self.record_file
+        if record_file:
+            self.recorder = IRCRecorder(record_file)
+
+        # Start the asyncio IRC client; its handlers hand results to front-ends through post()
+        self.irc_client = IRCClient(
+            self.token, self.username, channels,
+            dispatcher=self.build_dispatcher(),
+            status_callback=lambda text: self.post("status", text),
+            host=self.irc_server,
+            port=self.irc_port,
+            channels_per_connection=self.channels_per_connection,
+            buffer_size=self.recv_buffer_size,
+            latency_callback=self.on_latency,
+            ping_interval=self.ping_interval,
+            metrics=self.metrics,
+            recorder=self.recorder,
+        )
+        self.irc_client.start()
+        self.coalescer.start()
+        self.greeter.start()
+
+        # Start the TTS pipeline: synthesis runs ahead while the previous message plays
+        # With a process pool, one thread per worker process keeps every process busy
+        workers = max(self.synth_workers, self.synth_processes)
+        self.tts_pipeline = TTSPipeline(
+            self.tts_backend, self.tts_queue,
+            workers=workers,
+            lookahead=max(self.synth_lookahead, workers),
+            message_delay=self.message_delay,
+            player=self.player,
+            on_spoken=self.on_message_spoken,
+            on_error=self.on_tts_error,
+            metrics=self.metrics,
+            on_capped=self.on_tts_capped,
+        )
+        self.configure_pipeline(self.tts_pipeline)
+        self.tts_pipeline.start()
+
+    def disconnect(self):
+        """Stops the IRC client and the TTS pipeline."""
+        with self.settings_lock:
+            if not self.running:
+                return
+            self.stop_session()
+        self.post("connection", [])
+        self.post("status", "Disconnected")
+
+    def stop_session(self):
+        """Stops whatever start_session started; caller holds settings_lock."""
+        self.running = False
+        if self.irc_client:
+            self.irc_client.stop()
+            self.irc_client = None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+        self.coalescer.stop()
+        self.greeter.stop()  # Also saves the viewers seen this session
+        if self.tts_pipeline:
+            self.tts_pipeline.stop()
+            self.tts_pipeline = None
+        self.connected_channels = []
+        self.latency = None
+        self.viewers.clear()  # Clear viewer list on disconnect
+
+    def configure_pipeline(self, pipeline):
+        """Applies the settings a running pipeline picks up between messages."""
+        pipeline.message_delay = self.message_delay
+        pipeline.chunk_chars = self.tts_chunk_chars
+        pipeline.max_chars = self.tts_max_message_chars
+        pipeline.max_seconds = self.tts_max_message_seconds
+        pipeline.cap_policy = self.tts_cap_policy
+
+    def configure_greeter(self, changes=None):
+        """Applies the greeting settings to the greeter."""
+        self.greeter.batch_window = self.greet_batch_window
+        self.greeter.settle_rate = self.greet_settle_rate
+        self.greeter.welcome_back_after = self.greet_welcome_back_hours * 3600.0
+
+    def close(self):
+        """Disconnects and shuts down the speech engine's worker processes."""
+        self.disconnect()
+        self.command_runner.shutdown()  # Applies settings changes still waiting
+        self.tts_backend.backend.close()
+        self.greeter.seen.save()
+        if self.history:
+            self.history.close()
+            self.history = None
+        self.settings_store.close()  # Writes a pending save
+
+    def status(self):
+        """A snapshot of the engine's state for front-ends."""
+        return {
+            "running": self.running,
+            "channels": list(self.connected_channels),
+            "viewers": len(self.viewers),
+            "latency": self.latency,
+            "tts": self.tts_stats,
+            "queue": self.tts_queue.summary(),
+            "cache": self.audio_cache.summary(),
+            "coalescer": self.coalescer.summary(),
+            "greeter": {"welcomes": self.greeter.welcomes, "welcomed": self.greeter.welcomed},
+        }
+
+    def set_profiling(self, enabled, reset=False):
+        """Starts or stops the sampling profiler; returns its current report."""
+        if reset:
+            self.profiler.reset()
+        if enabled:
+            self.profiler.start()
+        else:
+            self.profiler.stop()
+        return self.profiler.summary()
+
+    # --- IRC handlers ---
+
+    def build_dispatcher(self):
+        """Builds the command table used for every joined channel."""
+        return CommandDispatcher({
+            "353": self.handle_names,
+            "366": self.handle_end_of_names,
+            "JOIN": self.handle_join,
+            "PART": self.handle_part,
+            "PRIVMSG": self.handle_privmsg,
+        })
+
+    def handle_names(self, message, channel):
+        """Loads a 353 NAMES reply into the viewer list in one batch."""
+        trailing = message.trailing
+        if trailing:
+            names = [name.lower() for name in trailing.split()]
+            new = self.viewers.bulk_load(names, channel)
+            self.greeter.names(channel, new)
+            if self.history:
+                for name in new:
+                    self.history.record_seen(channel, name)
+
+    def handle_end_of_names(self, message, channel):
+        """Handles the end of the NAMES list, which marks a completed JOIN."""
+        self.post("status", f"Successfully joined #{channel}. Waiting for the initial joins to settle...")
+        self.greeter.watch(channel)  # Greetings start once the burst of JOINs for current viewers dies down
+
+    def handle_join(self, message, channel):
+        """Adds a joining user to the viewer list and hands them to the greeter."""
+        username = message.nick
+        if not username or username == "jtv":
+            return
+        username = username.lower()
+        if not self.viewers.add(username, channel):
+            return  # Already here, e.g. re-announced after a reconnect
+        record = None
+        if self.history:
+            record = functools.partial(self.history.record_seen, channel, username, time.time())
+        self.greeter.viewer_arrived(channel, username, record=record)  # Recorded once their last visit is looked up
+
+    def welcome(self, text, username):
+        """Called by the greeter with a combined welcome for one or more viewers."""
+        if self.greet_viewers and self.tts_enabled:
+            self.tts_queue.put(text, user=username, priority=PRIORITY_GREETING)
+
+    def on_greeter_settled(self, channel):
+        """Called by the greeter when a channel's initial burst of joins is over."""
+        if self.running:
+            self.post("status", f"Initial joins in #{channel} settled. Greeter is now active!")
+
+    def handle_part(self, message, channel):
+        """Removes a departing user from the viewer list."""
+        username = message.nick
+        if not username:
+            return
+        self.viewers.discard(username.lower(), channel)
+
+    def handle_privmsg(self, message, channel):
+        """Publishes a chat message and queues it for TTS."""
+        username = message.tag("display-name") or message.nick
+        message_content = message.trailing
+        if not username or not message_content:
+            return
+
+        # Add user to the channel's viewers if they chat there for the first time; the greeter records that message
+        if self.viewers.add(username.lower(), channel):
+            record = None
+            if self.history:
+                record = functools.partial(self.history.record_message, channel, username, message_content, time.time())
+            self.greeter.viewer_arrived(channel, username, joined=False, record=record)
+        elif self.history:
+            self.history.record_message(channel, username, message_content)
+
+        # Publish the chat line, tagged with the channel when several are joined
+        if len(self.connected_channels) > 1:
+            self.post("message", f"[#{channel}] {username}: {message_content}")
+        else:
+            self.post("message", f"{username}: {message_content}")
+
+        if self.chat_commands and message_content.split(" ", 1)[0].lower() == TTS_COMMAND:
+            self.handle_tts_command(message, channel, message_content.split()[1:])
+            return
+        if not self.tts_enabled:
+            return
+
+        # Hand what is worth saying to the coalescer, which collapses repeats before they reach the TTS queue
+        spoken = self.speech_text(message_content, message.tag("emotes"))
+        if spoken:
+            self.coalescer.add(username, spoken, message_priority(message))
+
+    def handle_tts_command(self, message, channel, args):
+        """Runs a moderator's !tts command from chat and answers in chat; other users' commands are ignored."""
+        badges = message.tag("badges") or ""
+        if message.tag("mod") != "1" and "broadcaster/" not in badges:
+            return
+        action = args[0].lower() if args else "status"
+        if action in ("on", "off"):
+            self.command_runner.submit(self.update_settings, {"tts_enabled": action == "on"})
+            reply = f"TTS is {action}."
+        elif action == "clear":
+            user = args[1].lstrip("@") if len(args) > 1 else None
+            cleared = self.tts_queue.clear(user)
+            reply = f"Cleared {cleared} queued TTS message{'' if cleared == 1 else 's'}" + (f" from {user}." if user else ".")
+        elif action == "status":
+            reply = f"TTS is {'on' if self.tts_enabled else 'off'}, {self.tts_queue.summary()}."
+        else:
+            reply = TTS_COMMAND_USAGE
+        self.post("status", f"{message.nick} ran !tts {' '.join(args)}: {reply}")
+        if self.irc_client:
+            self.irc_client.say(channel, reply)  # Paced by the client's chat rate limit
+
+    def on_latency(self, seconds):
+        """Called by the IRC client with the latest PING round trip."""
+        self.latency = seconds
+        self.post("latency", seconds)
+
+    def on_tts_drop(self, entry, reason):
+        """Called by the TTS scheduler whenever it drops a message."""
+        if reason == "cleared":
+            return  # Reported by the !tts clear reply
+        if reason == "stale":
+            self.post("status", f"Skipped TTS message from {entry.user}: waited over {self.tts_max_latency:.0f}s.")
+        else:
+            self.post("status", f"TTS queue full, dropping message from {entry.user} ({reason}).")
+
+    def on_tts_error(self, stage, error):
+        """Called by the TTS pipeline when a message fails to synthesize or play."""
+        self.post("status", f"TTS {stage} error: {error}")
+
+    def on_tts_capped(self, item, policy):
+        """Called by the TTS pipeline for a message over the length caps."""
+        user = getattr(item, "user", None) or "a viewer"
+        action = "Skipped" if policy == CAP_SKIP else "Truncated"
+        self.post("status", f"{action} a long TTS message from {user}.")
+
+    def on_message_spoken(self, text, stats):
+        """Called on the player thread after each message; reports pipeline throughput."""
+        self.tts_stats = f"{stats.summary()}, {self.audio_cache.summary()}, {self.tts_queue.summary()}, {self.coalescer.summary()}"
+        self.post("tts_stats", self.tts_stats)
+
+
+def main():
+    """Runs the engine without a GUI, controlled through the local control API."""
+    parser = argparse.ArgumentParser(description="Twitch chat TTS without a GUI.")
+    parser.add_argument("--channels", help="channels to join at startup (default: the last used ones)")
+    parser.add_argument("--settings", default=DEFAULT_SETTINGS_FILE, help="settings file")
+    parser.add_argument("--control-host", help="interface for the control API (default: from settings)")
+    parser.add_argument("--control-port", type=int, help="port for the control API, 0 to disable (default: from settings)")
+    parser.add_argument("--quiet", action="store_true", help="only print status messages, not chat")
+    parser.add_argument("--record", help="record raw IRC traffic to this file (default: the record_file setting)")
+    parser.add_argument("--null-tts", action="store_true", help="don't speak; simulate synthesis and playback time")
+    args = parser.parse_args()
+
+    from control_api import ControlServer
+
+    backend = player = None
+    if args.null_tts:
+        backend, player = NullBackend(), NullPlayer()
+    engine = ChatEngine(args.settings, backend=backend, player=player or play_wav)
+    if args.record:
+        engine.record_override = args.record
+    events = engine.subscribe()
+    server = None
+    port = engine.control_port if args.control_port is None else args.control_port
+    if port:
+        server = ControlServer(engine, args.control_host or engine.control_host, port, token=engine.control_token)
+        server.start()
+        print(f"Control API listening on http://{server.host}:{server.port}")
+
+    try:
+        channels = parse_channels(args.channels if args.channels is not None else engine.last_channel)
+    except ValueError as e:
+        parser.error(str(e))
+    if channels:
+        engine.connect(channels)
+    elif server is None:
+        parser.error("no channels to join and the control API is disabled")
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    try:
+        while not stopping.is_set():
+            try:
+                message_type, content = events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if message_type == "status" or (message_type == "message" and not args.quiet):
+                print(content, flush=True)
+    finally:
+        engine.close()
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Persistent chat log and viewer history in SQLite.
+
+Every chat line and every viewer sighting is appended to a SQLite database
+in WAL mode, so searches and lookups read a consistent snapshot while the
+writer keeps appending. Callers on the IRC thread only put rows on a bounded
+queue; a writer thread takes them off in batches and commits each batch in
+one transaction. If the disk can't keep up, rows beyond the queue's size are
+dropped and counted rather than buffered without limit or allowed to stall
+the reader.
+
+Tables:
+
+    messages(id, ts, channel, user, text)            indexed on (user, ts), (channel, ts), (ts)
+    viewers(channel, user, first_seen, last_seen, messages)  keyed on (channel, user)
+"""
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import MetricsRegistry
+
+QUEUE_SIZE = 50000  # Rows waiting for the writer before new ones are dropped
+BATCH_SIZE = 1000  # Rows committed per transaction at most
+FLUSH_INTERVAL = 0.25  # Seconds the writer waits to fill a batch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    channel TEXT NOT NULL,
+    user TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (user, ts);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, ts);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+CREATE TABLE IF NOT EXISTS viewers (
+    channel TEXT NOT NULL,
+    user TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (channel, user)
+) WITHOUT ROWID;
+"""
+
+UPSERT_VIEWER = """
+INSERT INTO viewers (channel, user, first_seen, last_seen, messages) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (channel, user) DO UPDATE SET
+    last_seen = max(last_seen, excluded.last_seen),
+    messages = messages + excluded.messages
+"""
+
+
+def connect(path):
+    """Opens the database in WAL mode, creating the tables if needed."""
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # With WAL, only a power cut can lose the last commits
+    db.executescript(SCHEMA)
+    return db
+
+
+class ChatHistory:
+    """Append-only chat and viewer history; recording never blocks, reads are thread-safe."""
+
+    def __init__(self, path, metrics=None, queue_size=QUEUE_SIZE, on_error=None):
+        self.path = path
+        self.on_error = on_error  # Called with a message, from the writer thread, when a batch can't be stored
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.reader = connect(path)
+        self.reader_lock = threading.Lock()
+        metrics = metrics or MetricsRegistry()
+        self.written = metrics.counter("history_rows_written_total", "Chat lines and viewer sightings stored")
+        self.dropped = metrics.counter("history_rows_dropped_total", "Rows dropped because the writer fell behind")
+        self.batch_latency = metrics.histogram("history_batch_seconds", "Time to commit one batch of history rows")
+        metrics.gauge("history_queue_depth", "Rows waiting for the history writer", callback=self.queue.qsize)
+        self.running = True
+        self.thread = threading.Thread(target=self.write_loop, name="history-writer", daemon=True)
+        self.thread.start()
+
+    # --- Recording (any thread, never blocks) ---
+
+    def record_message(self, channel, user, text, ts=None):
+        """Queues a chat line; the user also counts as seen."""
+        self.enqueue(("message", ts or time.time(), channel, user.lower(), text))
+
+    def record_seen(self, channel, user, ts=None):
+        """Queues a viewer sighting, e.g. a JOIN or a NAMES entry."""
+        self.enqueue(("seen", ts or time.time(), channel, user.lower(), None))
+
+    def enqueue(self, row):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped.inc()
+
+    # --- Writer thread ---
+
+    def write_loop(self):
+        """Commits queued rows in batches until closed, then commits what is left."""
+        db = connect(self.path)
+        try:
+            while self.running or not self.queue.empty():
+                try:
+                    batch = [self.queue.get(timeout=FLUSH_INTERVAL)]
+                except queue.Empty:
+                    continue
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                self.write_batch(db, batch)
+                for _ in batch:
+                    self.queue.task_done()
+        finally:
+            db.close()
+
+    def write_batch(self, db, batch):
+        """Inserts one batch of rows in a single transaction."""
+        start = time.perf_counter()
+        messages = [(ts, channel, user, text) for kind, ts, channel, user, text in batch if kind == "message"]
+        viewers = {}  # (channel, user) -> [first, last, messages]; one upsert per viewer per batch
+        for kind, ts, channel, user, _ in batch:
+            seen = viewers.get((channel, user))
+            if seen is None:
+                seen = viewers[(channel, user)] = [ts, ts, 0]
+            seen[0] = min(seen[0], ts)
+            seen[1] = max(seen[1], ts)
+            if kind == "message":
+                seen[2] += 1
+        try:
+            with db:
+                db.executemany("INSERT INTO messages (ts, channel, user, text) VALUES (?, ?, ?, ?)", messages)
+                db.executemany(UPSERT_VIEWER, [(channel, user, first, last, count)
+                                               for (channel, user), (first, last, count) in viewers.items()])
+        except sqlite3.Error as e:
+            self.dropped.inc(len(batch))
+            self.report(f"Chat history write failed: {e}")
+            return
+        self.written.inc(len(batch))
+        self.batch_latency.observe(time.perf_counter() - start)
+
+    def report(self, text):
+        if self.on_error:
+            self.on_error(text)
+        else:
+            print(text)
+
+    def flush(self, timeout=5.0):
+        """Waits until every row queued so far has been committed (for tests and benchmarks)."""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        """Commits whatever is queued and closes the database."""
+        self.running = False
+        self.thread.join(timeout=10)
+        with self.reader_lock:
+            self.reader.close()
+
+    # --- Queries (any thread) ---
+
+    def query(self, sql, params=()):
+        with self.reader_lock:
+            return self.reader.execute(sql, params).fetchall()
+
+    def last_seen(self, channel, user):
+        """When a viewer was last seen in a channel (Unix time), or None if never; one primary key lookup."""
+        rows = self.query("SELECT last_seen FROM viewers WHERE channel = ? AND user = ?", (channel, user.lower()))
+        return rows[0][0] if rows else None
+
+    def viewer(self, channel, user):
+        """A viewer's first and last sighting and message count in a channel, or None."""
+        rows = self.query("SELECT first_seen, last_seen, messages FROM viewers WHERE channel = ? AND user = ?",
+                          (channel, user.lower()))
+        if not rows:
+            return None
+        first_seen, last_seen, messages = rows[0]
+        return {"channel": channel, "user": user.lower(), "first_seen": first_seen,
+                "last_seen": last_seen, "messages": messages}
+
+    def viewer_keys(self):
+        """Yields (channel, user) for every viewer ever seen, streamed from the table rather than loaded at once."""
+        with contextlib.closing(sqlite3.connect(self.path)) as db:
+            yield from db.execute("SELECT channel, user FROM viewers")
+
+    def search(self, text=None, user=None, channel=None, since=None, until=None, limit=100):
+        """Chat lines matching every given filter, newest first, as dicts.
+
+        `user`, `channel` and the time range use the indexes; `text` is a
+        case-insensitive substring match over what those filters leave. A
+        search gets its own connection, so a slow one never holds up the
+        viewer lookups the greeter makes from its own thread.
+        """
+        clauses, params = [], []
+        if user:
+            clauses.append("user = ?")
+            params.append(user.lower().lstrip("@"))
+        if channel:
+            clauses.append("channel = ?")
+            params.append(channel.lower().lstrip("#"))
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if text:
+            clauses.append("text LIKE ? ESCAPE '\\'")
+            params.append("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with contextlib.closing(sqlite3.connect(self.path)) as db:
+            rows = db.execute(f"SELECT ts, channel, user, text FROM messages{where} ORDER BY ts DESC LIMIT ?",
+                              params + [int(limit)]).fetchall()
+        return [{"ts": ts, "channel": channel, "user": user, "text": text} for ts, channel, user, text in rows]
+
+    def counts(self):
+        """Total stored messages and viewers."""
+        messages = self.query("SELECT count(*) FROM messages")[0][0]
+        viewers = self.query("SELECT count(*) FROM viewers")[0][0]
+        return {"messages": messages, "viewers": viewers}
@@ -0,0 +1,230 @@
+"""Collapses duplicate and near-duplicate chat lines before they reach TTS.
+
+Messages are held for a short window. Copies of the same line (after
+normalization) join one group through an exact hash index. Slightly varied
+copies, such as copypasta with an extra emote or a typo, join through MinHash
+signatures over shingles, bucketed with LSH bands. When a group's window ends
+it is emitted once: as the original message if nobody repeated it, or as
+"5 people said gg" otherwise. The number of open groups is bounded, so memory
+stays flat during a spam storm.
+"""
+import random
+import re
+import threading
+import time
+
+from tts_pipeline import Utterance
+
+NORMALIZE_PUNCTUATION = re.compile(r"[^\w\s]+")
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def normalize(text):
+    """Lowercases and strips punctuation and extra whitespace."""
+    return " ".join(NORMALIZE_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def shingles(normalized):
+    """Word bigrams for longer lines, character trigrams for short ones."""
+    words = normalized.split()
+    if len(words) >= 4:
+        return {f"{a} {b}" for a, b in zip(words, words[1:])}
+    if len(normalized) < 3:
+        return {normalized}
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+class MinHasher:
+    """Computes MinHash signatures and splits them into LSH band keys."""
+
+    def __init__(self, num_hashes=32, bands=16, seed=1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_hashes)]
+        self.bands = bands
+        self.rows = num_hashes // bands
+
+    def signature(self, shingle_set):
+        """The MinHash signature (one minimum per hash function)."""
+        hashes = [hash(s) & MAX_HASH for s in shingle_set]
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.params)
+
+    def band_keys(self, signature):
+        """LSH bucket keys; similar signatures share at least one with high probability."""
+        rows = self.rows
+        return [(i, signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class MessageGroup:
+    """Copies of one message collected during the coalescing window."""
+    __slots__ = ("text", "first_user", "users", "count", "priority", "deadline", "received_at",
+                 "normalized", "signature", "band_keys")
+
+    def __init__(self, text, user, priority, deadline, normalized, received_at):
+        self.text = text
+        self.first_user = user
+        self.users = {user.lower()}
+        self.count = 1
+        self.priority = priority
+        self.deadline = deadline
+        self.received_at = received_at
+        self.normalized = normalized
+        self.signature = None
+        self.band_keys = ()
+
+
+class Coalescer:
+    """Time-windowed duplicate collapsing between the IRC reader and the TTS queue.
+
+    `emit(item, user, priority)` is called from the coalescer's own thread
+    with a TTS queue entry for every finished group. If it raises, the
+    error is passed to `on_error` as a message and the thread carries on.
+    """
+
+    def __init__(self, emit, window=1.5, threshold=0.6, max_groups=500, clock=time.monotonic, on_error=None):
+        self.emit = emit
+        self.on_error = on_error
+        self.window = window
+        self.threshold = threshold
+        self.max_groups = max_groups
+        self.clock = clock
+        self.hasher = MinHasher()
+        self.groups = {}  # normalized text -> MessageGroup, in deadline order
+        self.buckets = {}  # LSH band key -> set of normalized texts
+        self.lock = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.messages_in = 0
+        self.utterances_out = 0
+
+    def start(self):
+        """Starts the thread that emits groups as their windows close."""
+        self.running = True
+        self.thread = threading.Thread(target=self.flush_worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the flush thread; groups still open are discarded."""
+        with self.lock:
+            self.running = False
+            self.groups.clear()
+            self.buckets.clear()
+            self.lock.notify_all()
+        if self.thread:
+            self.thread.join(timeout=1)
+
+    def add(self, user, text, priority):
+        """Offers one chat message; it is emitted (possibly merged) when its window closes."""
+        if self.window <= 0:
+            self.messages_in += 1
+            self.utterances_out += 1
+            self.emit(Utterance((f"{user} says", text), time.monotonic(), user), user, priority)
+            return
+        normalized = normalize(text) or text
+        ready = []
+        with self.lock:
+            self.messages_in += 1
+            group = self.groups.get(normalized)
+            signature = None
+            if group is None:
+                signature = self.hasher.signature(shingles(normalized))
+                group = self.find_similar(signature)
+            if group is not None:
+                group.count += 1
+                group.users.add(user.lower())
+                group.priority = min(group.priority, priority)
+                return
+            group = MessageGroup(text, user, priority, self.clock() + self.window, normalized, time.monotonic())
+            self.index(group, signature)
+            if len(self.groups) > self.max_groups:
+                ready.append(self.pop_group(next(iter(self.groups))))
+            self.lock.notify()
+        self.emit_groups(ready)
+
+    def find_similar(self, signature):
+        """Looks up an open group whose text is a near-duplicate of the signature's."""
+        candidates = set()
+        for key in self.hasher.band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            group = self.groups[candidate]
+            score = self.hasher.similarity(signature, group.signature)
+            if score >= best_score:
+                best, best_score = group, score
+        return best
+
+    def index(self, group, signature):
+        """Adds a new group to the exact and LSH indexes."""
+        group.signature = signature
+        group.band_keys = self.hasher.band_keys(group.signature)
+        self.groups[group.normalized] = group
+        for key in group.band_keys:
+            self.buckets.setdefault(key, set()).add(group.normalized)
+
+    def pop_group(self, normalized):
+        """Removes a group from both indexes and returns it."""
+        group = self.groups.pop(normalized)
+        for key in group.band_keys:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(normalized)
+                if not bucket:
+                    del self.buckets[key]
+        return group
+
+    def due_groups(self):
+        """Removes and returns every group whose window has closed; caller holds the lock."""
+        now = self.clock()
+        due = []
+        # Groups are created in deadline order, so stop at the first open one
+        for normalized, group in self.groups.items():
+            if group.deadline > now:
+                break
+            due.append(normalized)
+        return [self.pop_group(normalized) for normalized in due]
+
+    def flush_worker(self):
+        """Emits groups as their windows close."""
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                ready = self.due_groups()
+                if not ready:
+                    timeout = None
+                    if self.groups:
+                        timeout = max(0.0, next(iter(self.groups.values())).deadline - self.clock())
+                    self.lock.wait(timeout)
+                    continue
+            self.emit_groups(ready)
+
+    def emit_groups(self, groups):
+        """Turns finished groups into TTS entries."""
+        for group in groups:
+            self.utterances_out += 1
+            if len(group.users) > 1:
+                phrases, voice_user = (f"{len(group.users)} people said", group.text), None
+            else:
+                phrases, voice_user = (f"{group.first_user} says", group.text), group.first_user
+            try:
+                self.emit(Utterance(phrases, group.received_at, voice_user), group.first_user, group.priority)
+            except Exception as e:
+                self.report(f"Couldn't queue a message for TTS: {e}")
+
+    def report(self, text):
+        if self.on_error:
+            self.on_error(text)
+        else:
+            print(text)
+
+    def summary(self):
+        """A short description of how much chat was collapsed."""
+        if not self.messages_in:
+            return "coalesced 0"
+        return f"coalesced {self.messages_in}->{self.utterances_out}"
@@ -0,0 +1,303 @@
+"""Local HTTP/WebSocket control and metrics API for a ChatEngine.
+
+Endpoints (JSON in and out unless noted):
+
+    GET  /status       connection state, viewer count, TTS and queue summaries
+    GET  /metrics      every metric in the Prometheus text format (not JSON)
+    GET  /stats        counter totals, gauges and recent latency percentiles
+    GET  /profile      the sampling profiler's report as text; ?format=folded
+                       gives folded stacks for flame graph tools
+    POST /profile      {"enabled": true, "reset": false}; starts or stops it
+    GET  /history      stored chat, newest first; ?q=text&user=&channel=&since=<unix time>&limit=100
+    GET  /viewer       ?channel=&user=; when a viewer was first and last seen, and how often they chatted
+    GET  /settings     every setting
+    POST /settings     {"rate": 200, ...}; applies and saves the given settings
+    POST /connect      {"channels": ["a", "b"]} or {"channels": "a, b"}
+    POST /disconnect
+    GET  /events       live engine events (chat, status, latency, TTS stats),
+                       as a WebSocket when the request asks for an upgrade,
+                       otherwise as a Server-Sent Events stream
+
+The server only listens on localhost by default. If a control token is set,
+every request must carry it as "Authorization: Bearer <token>" or, for
+browser WebSockets that cannot set headers, as "?token=<token>".
+
+Without a token, any web page open in a browser on the same machine could
+otherwise reach the API, so:
+
+* POST bodies must be sent as application/json, which a page can't send to
+  another origin without a CORS preflight (which this server never answers);
+* the Host and Origin headers, when present, must name localhost, which
+  stops pages on other sites and DNS rebinding to 127.0.0.1;
+* settings that name files or commands (HTTP_LOCKED_SETTINGS) can't be
+  changed over HTTP at all; they are changed in the settings file or GUI.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import queue
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+KEEPALIVE_INTERVAL = 15.0  # Seconds of silence before an event stream is pinged
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+# Settings that name files to write or commands to run, or that redirect the connection or the API itself
+HTTP_LOCKED_SETTINGS = frozenset({
+    "seen_users_file", "record_file", "history_file", "emote_map_file", "audio_cache_dir",
+    "espeak_command", "piper_command", "piper_model",
+    "irc_server", "irc_port", "control_host", "control_port", "control_token",
+})
+
+
+def host_name(value):
+    """The host part of a Host header or an Origin URL, lowercased and without the port or IPv6 brackets."""
+    if "://" in value:
+        value = urlsplit(value).netloc
+    if value.startswith("["):
+        return value[1:].partition("]")[0].lower()
+    return value.rpartition(":")[0].lower() if value.count(":") == 1 else value.lower()
+
+
+def websocket_accept(key):
+    """The Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key."""
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def websocket_frame(payload, opcode=0x1):
+    """An unmasked, unfragmented server-to-client WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """Routes control API requests to the server's engine."""
+    server_version = "TwitchChatTTS"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for chat and status lines
+
+    @property
+    def engine(self):
+        return self.server.engine
+
+    def authorized(self):
+        """True if no token is configured or the request carries the right one."""
+        token = self.server.token
+        if not token:
+            return True
+        supplied = self.headers.get("Authorization", "")
+        if supplied.startswith("Bearer "):
+            supplied = supplied[len("Bearer "):]
+        else:
+            supplied = parse_qs(urlsplit(self.path).query).get("token", [""])[0]
+        return hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8"))
+
+    def local_request(self):
+        """True if the Host and Origin headers (when sent) both name localhost.
+
+        A request carrying the right token may come from anywhere it was
+        given to, so the check only applies when no token is configured.
+        """
+        if self.server.token:
+            return True
+        for header in ("Host", "Origin"):
+            value = self.headers.get(header)
+            if value is not None and host_name(value) not in LOCAL_HOSTS:
+                return False
+        return True
+
+    def check_request(self):
+        """Sends an error and returns False if the request may not be served."""
+        if not self.authorized():
+            self.send_error_json(401, "Missing or wrong control token.")
+            return False
+        if not self.local_request():
+            self.send_error_json(403, "Requests must come from localhost.")
+            return False
+        return True
+
+    def send_json(self, data, status=200):
+        """Writes a JSON response."""
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, text, content_type="text/plain; charset=utf-8"):
+        """Writes a plain-text response."""
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        """Writes a JSON error response."""
+        self.send_json({"error": message}, status)
+
+    def read_json(self):
+        """Reads the request body as a JSON object; an empty body is an empty object."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""  # Read even if refused, to keep the connection usable
+        content_type = self.headers.get("Content-Type", "").partition(";")[0].strip().lower()
+        if content_type != "application/json":
+            raise ValueError("Content-Type must be application/json.")
+        if not body:
+            return {}
+        data = json.loads(body)
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object.")
+        return data
+
+    def do_GET(self):
+        if not self.check_request():
+            return
+        path = urlsplit(self.path).path
+        if path == "/status":
+            self.send_json(self.engine.status())
+        elif path == "/metrics":
+            self.send_text(self.engine.metrics.render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/stats":
+            self.send_json(self.engine.metrics.snapshot())
+        elif path == "/profile":
+            if parse_qs(urlsplit(self.path).query).get("format") == ["folded"]:
+                self.send_text(self.engine.profiler.folded())
+            else:
+                self.send_text(self.engine.profiler.summary() + "\n")
+        elif path == "/settings":
+            self.send_json(self.engine.settings())
+        elif path == "/history":
+            self.send_history(parse_qs(urlsplit(self.path).query))
+        elif path == "/viewer":
+            self.send_viewer(parse_qs(urlsplit(self.path).query))
+        elif path == "/events":
+            self.stream_events()
+        else:
+            self.send_error_json(404, f"No such endpoint: {path}")
+
+    def do_POST(self):
+        if not self.check_request():
+            return
+        path = urlsplit(self.path).path
+        try:
+            body = self.read_json()
+            if path == "/settings":
+                locked = sorted(HTTP_LOCKED_SETTINGS.intersection(body))
+                if locked:
+                    return self.send_error_json(403, f"Can't change {', '.join(locked)} over HTTP.")
+                self.send_json(self.engine.update_settings(body))
+            elif path == "/connect":
+                self.engine.connect(body.get("channels", ""))
+                self.send_json(self.engine.status())
+            elif path == "/profile":
+                report = self.engine.set_profiling(bool(body.get("enabled", True)), bool(body.get("reset", False)))
+                self.send_text(report + "\n")
+            elif path == "/disconnect":
+                self.engine.disconnect()
+                self.send_json(self.engine.status())
+            else:
+                self.send_error_json(404, f"No such endpoint: {path}")
+        except (TypeError, ValueError) as e:  # json.JSONDecodeError is a ValueError
+            self.send_error_json(400, str(e))
+
+    def send_history(self, query):
+        """Answers a history search."""
+        first = lambda name: query.get(name, [None])[0]
+        try:
+            since = first("since")
+            rows = self.engine.search_history(text=first("q"), user=first("user"), channel=first("channel"),
+                                              since=float(since) if since else None,
+                                              limit=min(1000, int(first("limit") or 100)))
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        self.send_json(rows)
+
+    def send_viewer(self, query):
+        """Answers a returning-viewer lookup."""
+        channel = query.get("channel", [""])[0].lower().lstrip("#")
+        user = query.get("user", [""])[0]
+        if not channel or not user:
+            return self.send_error_json(400, "channel and user are required.")
+        if self.engine.history is None:
+            return self.send_error_json(400, "Chat history is disabled.")
+        viewer = self.engine.history.viewer(channel, user)
+        if viewer is None:
+            return self.send_error_json(404, f"{user} has not been seen in #{channel}.")
+        self.send_json(viewer)
+
+    def stream_events(self):
+        """Streams engine events until the client goes away or the server stops."""
+        websocket = self.headers.get("Upgrade", "").lower() == "websocket"
+        if websocket:
+            key = self.headers.get("Sec-WebSocket-Key")
+            if not key:
+                return self.send_error_json(400, "Missing Sec-WebSocket-Key.")
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", websocket_accept(key))
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+        self.close_connection = True
+        events = self.engine.subscribe()
+        try:
+            while not self.server.stopping.is_set():
+                try:
+                    message_type, content = events.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    self.wfile.write(websocket_frame(b"", opcode=0x9) if websocket else b": keepalive\n\n")
+                    continue
+                payload = json.dumps({"type": message_type, "data": content, "time": time.time()})
+                if websocket:
+                    self.wfile.write(websocket_frame(payload.encode("utf-8")))
+                else:
+                    self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except OSError:
+            pass  # Client disconnected
+        finally:
+            self.engine.unsubscribe(events)
+
+
+class ControlServer(ThreadingHTTPServer):
+    """The control API server, run on a background thread."""
+    daemon_threads = True
+
+    def __init__(self, engine, host="127.0.0.1", port=8765, token=""):
+        super().__init__((host, port), ControlRequestHandler)
+        self.engine = engine
+        self.token = token
+        self.host, self.port = self.server_address[:2]
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Starts serving on a daemon thread."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops serving and closes the listening socket; open event streams end within a keepalive interval."""
+        self.stopping.set()
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,298 @@
+"""A local fake Twitch IRC (TMI) server for exercising the client without Twitch.
+
+It accepts PASS/NICK/CAP/JOIN/PART/PING like TMI does, answers JOINs with the
+usual JOIN echo, 353 NAMES and 366 replies, and can push chat traffic into
+joined channels. It can also drop connections on a schedule to exercise the
+client's reconnect logic, and replay traffic captured with
+irc_recording.IRCRecorder at its original pace, N times faster, or as fast as
+the client will take it. With `enforce_limits` it enforces Twitch's JOIN and
+chat limits the way TMI does: a line over the limit is dropped, answered
+with a NOTICE and counted in `limit_violations`. The limits are written out
+here rather than taken from irc_writer, so the client is checked against
+Twitch's numbers and not against its own. Run it standalone with
+`python fake_tmi.py --port 6667` and point the client's `irc_server`/`irc_port`
+settings at it.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import random
+import re
+
+from irc_recording import read_recording
+CHANNEL_PARAM = re.compile(r" #([^\s,]+)")
+REPLAY_DRAIN_EVERY = 200  # Lines written between flow-control waits at max speed
+
+# (lines, per seconds) of each of TMI's sliding windows for a regular account
+TMI_WINDOWS = {
+    "join": (20, 10.0),
+    "chat": (20, 30.0),  # Chat in channels where the account isn't a moderator
+    "chat_all": (100, 30.0),  # All chat, moderated channels included
+}
+
+
+def privmsg_line(channel, user, text, tags=None):
+    """Builds a tagged PRIVMSG line the way TMI sends it."""
+    tag_items = {"display-name": user, "user-id": str(abs(hash(user)) % 10**8)}
+    tag_items.update(tags or {})
+    tag_str = ";".join(f"{k}={v}" for k, v in tag_items.items())
+    return f"@{tag_str} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{text}"
+
+
+class FakeClient:
+    """Server-side state for one connected client."""
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.nick = None
+        self.channels = set()
+
+    def send(self, line):
+        """Writes one line to the client."""
+        if not self.writer.is_closing():
+            self.writer.write(line.encode("utf-8") + b"\r\n")
+
+    async def handle(self):
+        """Reads commands from the client until it disconnects."""
+        try:
+            while True:
+                raw = await self.reader.readline()
+                if not raw:
+                    break
+                line = raw.decode("utf-8", errors="ignore").rstrip("\r\n")
+                if line:
+                    self.server.lines_received.append(line)
+                    self.handle_line(line)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.server.clients.discard(self)
+            self.writer.close()
+
+    def handle_line(self, line):
+        """Answers a single client command."""
+        command, _, rest = line.partition(" ")
+        command = command.upper()
+        if command == "NICK":
+            self.nick = rest.strip().lower()
+            self.send(f":tmi.twitch.tv 001 {self.nick} :Welcome, GLHF!")
+            self.send(f":tmi.twitch.tv 376 {self.nick} :>")
+        elif command == "CAP":
+            self.send(f":tmi.twitch.tv CAP * ACK :{rest.partition(':')[2]}")
+        elif command == "PING":
+            if self.server.answer_pings:
+                self.send(f":tmi.twitch.tv PONG tmi.twitch.tv {rest}")
+        elif command == "JOIN":
+            for channel in rest.strip().split(","):
+                if self.server.allow(("join",), self, channel.lstrip("#").lower()):
+                    self.join(channel.lstrip("#").lower())
+        elif command == "PRIVMSG":
+            target, _, text = rest.partition(" ")
+            channel = target.lstrip("#").lower()
+            windows = ("chat_all",) if channel in self.server.moderators else ("chat", "chat_all")
+            if self.server.allow(windows, self, channel):
+                self.server.chat_received.append((channel, text[1:] if text.startswith(":") else text))
+        elif command == "PART":
+            for channel in rest.strip().split(","):
+                channel = channel.lstrip("#").lower()
+                self.channels.discard(channel)
+                self.send(f":{self.nick}!{self.nick}@{self.nick}.tmi.twitch.tv PART #{channel}")
+
+    def join(self, channel):
+        """Joins a channel and replays the JOIN/NAMES handshake."""
+        self.channels.add(channel)
+        nick = self.nick or "justinfan"
+        self.send(f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}")
+        names = " ".join(sorted(self.server.viewers.get(channel, ())) or [nick])
+        self.send(f":{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{names}")
+        self.send(f":{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list")
+        moderator = channel in self.server.moderators
+        self.send(f"@badges={'moderator/1' if moderator else ''};mod={int(moderator)} "
+                  f":tmi.twitch.tv USERSTATE #{channel}")
+
+
+class FakeTMIServer:
+    """An asyncio TMI stand-in bound to localhost."""
+
+    def __init__(self, host="127.0.0.1", port=0, answer_pings=True, enforce_limits=False, limit_scale=1.0):
+        self.host = host
+        self.port = port
+        self.answer_pings = answer_pings  # False simulates a half-dead connection
+        self.enforce_limits = enforce_limits
+        self.limit_scale = limit_scale  # TMI's windows are shortened this many times, for quick tests
+        self.sent_at = collections.defaultdict(collections.deque)  # window -> times of accepted lines
+        self.limit_violations = collections.Counter()  # window -> lines rejected
+        self.moderators = set()  # Channels where the connecting bot is told it is a moderator
+        self.chat_received = []  # (channel, text) of chat the client sent
+        self.server = None
+        self.clients = set()
+        self.connections_accepted = 0
+        self.viewers = {}  # channel -> usernames reported in NAMES
+        self.lines_received = []
+
+    def allow(self, windows, client, channel):
+        """Checks a line against the account-wide windows it counts toward; rejects it with a NOTICE if over."""
+        if not self.enforce_limits:
+            return True
+        now = asyncio.get_running_loop().time()
+        for name in windows:
+            lines, seconds = TMI_WINDOWS[name]
+            sent = self.sent_at[name]
+            while sent and sent[0] <= now - seconds / self.limit_scale:
+                sent.popleft()
+            if len(sent) >= lines:
+                self.limit_violations[name] += 1
+                client.send(f"@msg-id=msg_ratelimit :tmi.twitch.tv NOTICE #{channel} "
+                            f":You are sending messages too quickly.")
+                return False
+        for name in windows:
+            self.sent_at[name].append(now)
+        return True
+
+    async def start(self):
+        """Starts listening; `port` is filled in when an ephemeral port was asked for."""
+        self.server = await asyncio.start_server(self.accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def accept(self, reader, writer):
+        client = FakeClient(self, reader, writer)
+        self.clients.add(client)
+        self.connections_accepted += 1
+        await client.handle()
+
+    def broadcast(self, channel, line):
+        """Sends a raw line to every client joined to `channel`."""
+        for client in list(self.clients):
+            if channel in client.channels:
+                client.send(line)
+
+    def say(self, channel, user, text, tags=None):
+        """Delivers a chat message from `user` to `channel`."""
+        self.broadcast(channel, privmsg_line(channel, user, text, tags))
+
+    def user_join(self, channel, user):
+        """Announces that `user` joined `channel`."""
+        self.viewers.setdefault(channel, set()).add(user)
+        self.broadcast(channel, f":{user}!{user}@{user}.tmi.twitch.tv JOIN #{channel}")
+
+    def user_part(self, channel, user):
+        """Announces that `user` left `channel`."""
+        self.viewers.get(channel, set()).discard(user)
+        self.broadcast(channel, f":{user}!{user}@{user}.tmi.twitch.tv PART #{channel}")
+
+    def joined_channels(self):
+        """Returns the channels any connected client is currently in."""
+        return set(itertools.chain.from_iterable(c.channels for c in self.clients))
+
+    async def chatter(self, rate, words=("lol", "gg", "hello", "KEKW", "nice play")):
+        """Generates random chat in every joined channel at `rate` messages per second."""
+        rng = random.Random()
+        while True:
+            await asyncio.sleep(1.0 / rate)
+            channels = self.joined_channels()
+            if channels:
+                channel = rng.choice(sorted(channels))
+                self.say(channel, f"viewer{rng.randint(1, 500)}", rng.choice(words))
+
+    async def replay(self, records, speed=1.0, channel=None):
+        """Sends recorded (offset, line) traffic to joined clients; returns the number of lines sent.
+
+        `speed` scales the recorded pace (2.0 is twice as fast); 0 sends as
+        fast as the clients read. With `channel`, every line is retargeted to
+        that channel so any recording can be replayed into the channel under
+        test. Connection-level lines (welcome numerics, CAP, the recording
+        bot's own handshake) are skipped because the server does its own;
+        PINGs are kept.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        sent = 0
+        for offset, line in records:
+            if speed > 0:
+                delay = start + offset / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif sent % REPLAY_DRAIN_EVERY == 0:
+                await self.drain_clients()
+            match = CHANNEL_PARAM.search(line)
+            if match is None:
+                if line.startswith("PING"):
+                    for client in list(self.clients):
+                        client.send(line)
+                    sent += 1
+                continue
+            if channel:
+                line = line[:match.start(1)] + channel + line[match.end(1):]
+            self.broadcast(channel or match.group(1).lower(), line)
+            sent += 1
+        await self.drain_clients()
+        return sent
+
+    async def drain_clients(self):
+        """Waits until every client's send buffer has been flushed."""
+        await asyncio.gather(*(c.writer.drain() for c in list(self.clients)), return_exceptions=True)
+
+    def drop_connections(self):
+        """Abruptly closes every client connection, as a network failure would."""
+        for client in list(self.clients):
+            client.writer.transport.abort()
+
+    async def dropper(self, interval):
+        """Drops every connection each `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            self.drop_connections()
+
+    async def stop(self):
+        """Disconnects every client and stops listening."""
+        for client in list(self.clients):
+            client.writer.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def serve(args):
+    """Runs the fake server until interrupted."""
+    server = await FakeTMIServer(args.host, args.port, enforce_limits=args.enforce_limits).start()
+    print(f"Fake TMI listening on {server.host}:{server.port}")
+    if args.chat_rate > 0:
+        asyncio.get_running_loop().create_task(server.chatter(args.chat_rate))
+    if args.drop_every > 0:
+        asyncio.get_running_loop().create_task(server.dropper(args.drop_every))
+    if args.replay:
+        print(f"Waiting for a client to join a channel before replaying {args.replay}...")
+        while not server.joined_channels():
+            await asyncio.sleep(0.1)
+        started = asyncio.get_running_loop().time()
+        sent = await server.replay(read_recording(args.replay), args.speed, args.channel)
+        elapsed = asyncio.get_running_loop().time() - started
+        print(f"Replayed {sent} lines in {elapsed:.1f}s ({sent / max(elapsed, 1e-9):,.0f} lines/s)")
+    await asyncio.Event().wait()
+
+
+def main():
+    """Parses the command line and runs the server."""
+    arg_parser = argparse.ArgumentParser(description="Local fake Twitch IRC server")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=6667)
+    arg_parser.add_argument("--chat-rate", type=float, default=0.0, help="random chat messages per second")
+    arg_parser.add_argument("--drop-every", type=float, default=0.0, help="drop all connections every N seconds")
+    arg_parser.add_argument("--replay", help="recording (or file of raw IRC lines) to replay once a client joins")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier, 0 for as fast as possible")
+    arg_parser.add_argument("--channel", help="replay every line into this channel instead of the recorded one")
+    arg_parser.add_argument("--enforce-limits", action="store_true", help="reject JOINs and chat over Twitch's rate limits")
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Welcomes new and returning viewers without flooding the TTS queue.
+
+SeenUsers remembers every (channel, viewer) pair ever seen in a Bloom filter
+saved next to the settings, so it survives restarts and uses the same few
+megabytes of memory for a hundred or a million viewers. A "no" from the
+filter is certain; a "yes" is confirmed against the chat history (when it is
+enabled), which also says when the viewer was last here. That is a database
+query, so arrivals are only queued by the IRC side and looked up on the
+greeter's own thread.
+
+The Greeter decides when and how to speak:
+
+* After joining a channel, the NAMES list and the first wave of JOINs are
+  the people already watching, not newcomers. Instead of waiting a fixed
+  time, each channel stays quiet until its join rate falls below
+  `settle_rate` (or `max_settle` seconds pass in a channel that never calms
+  down).
+* New viewers, and viewers back after `welcome_back_after` seconds, are
+  collected per channel and welcomed together once joins pause for
+  `batch_window` seconds: "Welcome to the stream, ann, bob, cat and 297
+  others!" A raid becomes one message instead of three hundred. A batch
+  keeps only a few names and two counts, so memory stays flat.
+"""
+import collections
+import hashlib
+import math
+import os
+import struct
+import threading
+import time
+
+BLOOM_MAGIC = b"BLOOM1"
+BLOOM_HEADER = struct.Struct("<6sQII")  # magic, bits, hashes, approximate count
+NAMES_PER_WELCOME = 3  # Viewers named in a combined welcome; the rest are counted
+SAVE_INTERVAL = 60.0  # Seconds between saves of a changed seen-users filter
+TICK = 0.25  # Seconds between the greeter thread's checks
+
+
+def viewer_key(channel, user):
+    """The filter key for a viewer in a channel; names are case-insensitive, as in the history."""
+    return f"{channel} {user.lower()}"
+
+
+class BloomFilter:
+    """A fixed-size set of strings that can answer "definitely not" or "probably" in constant memory."""
+
+    def __init__(self, bits, hashes, data=None, count=0):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+        self.count = count  # Keys added (approximately: re-adding a key that collides counts again)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """A filter holding `capacity` keys with about `error_rate` false positives."""
+        bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes)
+
+    def positions(self, key):
+        """Bit positions for a key, by double hashing one 128-bit digest."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        """Adds a key; returns True if it was definitely not there before."""
+        new = False
+        array = self.array
+        for position in self.positions(key):
+            byte, bit = divmod(position, 8)
+            if not array[byte] & (1 << bit):
+                array[byte] |= 1 << bit
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key):
+        array = self.array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    def save(self, path):
+        """Writes the filter to `path` atomically."""
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.bits, self.hashes, self.count))
+            f.write(self.array)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a filter written by `save`; raises ValueError if the file isn't one."""
+        with open(path, "rb") as f:
+            header = f.read(BLOOM_HEADER.size)
+            if len(header) != BLOOM_HEADER.size:
+                raise ValueError(f"{path} is not a seen-users file")
+            magic, bits, hashes, count = BLOOM_HEADER.unpack(header)
+            data = f.read()
+        if magic != BLOOM_MAGIC or len(data) != (bits + 7) // 8:
+            raise ValueError(f"{path} is not a seen-users file")
+        return cls(bits, hashes, data, count)
+
+
+class SeenUsers:
+    """Every (channel, viewer) pair ever seen, persisted as a Bloom filter and confirmed by the chat history."""
+
+    def __init__(self, path="", history=None, capacity=1_000_000, error_rate=0.01, on_error=None):
+        self.path = path
+        self.history = history
+        self.on_error = on_error  # Called with a message when the file can't be read or saved
+        self.lock = threading.Lock()
+        self.changed = False
+        self.bloom = None
+        if path and os.path.exists(path):
+            try:
+                self.bloom = BloomFilter.load(path)
+            except (OSError, ValueError) as e:
+                self.report(f"Could not read seen users from {path} ({e}); starting a new list.")
+                self.bloom = None
+        if self.bloom is None:
+            self.bloom = BloomFilter.for_capacity(capacity, error_rate)
+            if history is not None:
+                # First run with a filter: learn everyone the history already knows
+                for channel, user in history.viewer_keys():
+                    self.bloom.add(viewer_key(channel, user))
+                self.changed = True
+
+    def lookup(self, channel, user):
+        """None if the viewer has never been seen in the channel; otherwise when they were last seen.
+
+        The time is Unix time from the history, or 0.0 when only the filter
+        knows them (no history, or history written before it was enabled).
+        Queries the history: call it off the IRC loop.
+        """
+        with self.lock:
+            if viewer_key(channel, user) not in self.bloom:
+                return None
+        if self.history is None:
+            return 0.0
+        try:
+            return self.history.last_seen(channel, user)  # None: a false positive of the filter
+        except Exception:
+            return 0.0
+
+    def add(self, channel, user):
+        """Remembers a viewer; returns True if they were definitely new."""
+        with self.lock:
+            new = self.bloom.add(viewer_key(channel, user))
+            self.changed = self.changed or new
+            return new
+
+    def save(self):
+        """Writes the filter if it changed since the last save."""
+        if not self.path:
+            return
+        with self.lock:
+            if not self.changed:
+                return
+            self.changed = False
+            data = BloomFilter(self.bloom.bits, self.bloom.hashes, self.bloom.array, self.bloom.count)
+        try:
+            data.save(self.path)
+        except OSError as e:
+            self.changed = True
+            self.report(f"Could not save seen users to {self.path}: {e}")
+
+    def report(self, text):
+        if self.on_error:
+            self.on_error(text)
+        else:
+            print(text)
+
+
+class JoinRate:
+    """JOINs per second over a sliding window, counted in one-second buckets."""
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self.buckets = collections.deque()  # [second, joins], oldest first; at most `window` of them
+
+    def add(self, now):
+        second = int(now)
+        if self.buckets and self.buckets[-1][0] == second:
+            self.buckets[-1][1] += 1
+        else:
+            self.buckets.append([second, 1])
+        self.expire(now)
+
+    def expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            self.buckets.popleft()
+
+    def rate(self, now):
+        """Joins per second over the last window."""
+        self.expire(now)
+        return sum(joins for _, joins in self.buckets) / self.window
+
+
+class WelcomeBatch:
+    """Viewers waiting to be welcomed together in one channel."""
+    __slots__ = ("names", "new", "returning", "started", "last")
+
+    def __init__(self, now):
+        self.names = []  # The first few, for the message
+        self.new = 0
+        self.returning = 0
+        self.started = now
+        self.last = now
+
+    def add(self, user, returning, now):
+        if len(self.names) < NAMES_PER_WELCOME:
+            self.names.append(user)
+        if returning:
+            self.returning += 1
+        else:
+            self.new += 1
+        self.last = now
+
+    def text(self):
+        """The combined welcome."""
+        total = self.new + self.returning
+        opening = "Welcome back" if self.new == 0 else "Welcome to the stream"
+        names = list(self.names)
+        if total > len(names):
+            others = total - len(names)
+            names.append(f"{others} other" if others == 1 else f"{others} others")
+        if len(names) == 1:
+            return f"{opening}, {names[0]}!"
+        return f"{opening}, {', '.join(names[:-1])} and {names[-1]}!"
+
+
+class ChannelState:
+    """Greeter state for one joined channel."""
+    __slots__ = ("joined_at", "settled", "rate", "batch")
+
+    def __init__(self, now, window):
+        self.joined_at = now
+        self.settled = False
+        self.rate = JoinRate(window)
+        self.batch = None
+
+
+class Greeter:
+    """Batches welcomes for new and returning viewers and holds them back during the initial join burst.
+
+    `emit(text, user)` is called from the greeter's own thread for every
+    combined welcome; `on_settled(channel)` when a channel's initial burst is over.
+    """
+
+    def __init__(self, emit, seen, batch_window=3.0, max_batch_wait=10.0, settle_rate=1.0,
+                 settle_window=10.0, min_settle=5.0, max_settle=60.0, welcome_back_after=12 * 3600.0,
+                 on_settled=None, clock=time.monotonic, wall_clock=time.time):
+        self.emit = emit
+        self.seen = seen
+        self.batch_window = batch_window
+        self.max_batch_wait = max_batch_wait
+        self.settle_rate = settle_rate
+        self.settle_window = settle_window
+        self.min_settle = min_settle
+        self.max_settle = max_settle
+        self.welcome_back_after = welcome_back_after
+        self.on_settled = on_settled
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.channels = {}  # channel -> ChannelState
+        self.arrivals = collections.deque()  # (channel, user, joined, clock time, record) for the greeter thread
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()  # Set when arrivals are queued or the greeter stops
+        self.running = False
+        self.thread = None
+        self.last_save = clock()
+        self.welcomed = 0
+        self.welcomes = 0
+
+    def start(self):
+        """Starts the thread that settles channels and sends batched welcomes."""
+        self.running = True
+        self.thread = threading.Thread(target=self.tick_loop, name="greeter", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the thread, drops unsent welcomes and saves the seen users."""
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+            self.thread = None
+        while self.arrivals:
+            channel, user, _, _, record = self.arrivals.popleft()
+            self.remember(channel, user, record)  # Too late to greet, not to remember
+        with self.lock:
+            self.channels.clear()
+        self.seen.save()
+
+    def watch(self, channel):
+        """Starts watching a channel that was just joined; it stays quiet until its join burst settles."""
+        with self.lock:
+            self.channels[channel] = ChannelState(self.clock(), self.settle_window)
+
+    def state(self, channel):
+        state = self.channels.get(channel)
+        if state is None:
+            state = self.channels[channel] = ChannelState(self.clock(), self.settle_window)
+        return state
+
+    def names(self, channel, users):
+        """Remembers the viewers listed in a NAMES reply; they were already here, so nobody is greeted."""
+        for user in users:
+            self.seen.add(channel, user)
+
+    def viewer_arrived(self, channel, user, joined=True, record=None):
+        """Queues a viewer seen for the first time this session, by JOIN or by chatting; never blocks on the history.
+
+        `record`, if given, writes this visit to the history. It is called on
+        the greeter's thread once the previous visit has been looked up, so
+        the lookup can't find this visit instead.
+        """
+        self.arrivals.append((channel, user, joined, self.clock(), record))
+        self.wakeup.set()
+
+    def remember(self, channel, user, record):
+        self.seen.add(channel, user)
+        if record:
+            record()
+
+    def process_arrivals(self):
+        """Looks up the queued arrivals' previous visits and adds them to their channels' join rates and batches."""
+        while self.arrivals:
+            channel, user, joined, now, record = self.arrivals.popleft()
+            last_seen = self.seen.lookup(channel, user)
+            self.remember(channel, user, record)
+            with self.lock:
+                state = self.state(channel)
+                if joined:
+                    state.rate.add(now)
+                if not state.settled:
+                    continue  # Part of the initial burst: remembered, not greeted
+                if last_seen is not None and (not last_seen or self.wall_clock() - last_seen < self.welcome_back_after):
+                    continue  # Seen recently (or we can't tell when); no need to say hello again
+                if state.batch is None:
+                    state.batch = WelcomeBatch(now)
+                state.batch.add(user, last_seen is not None, now)
+
+    def due(self, now):
+        """Settles quiet channels and takes the batches ready to send; caller holds the lock."""
+        settled, ready = [], []
+        for channel, state in self.channels.items():
+            if not state.settled:
+                elapsed = now - state.joined_at
+                if ((elapsed >= self.min_settle and state.rate.rate(now) < self.settle_rate)
+                        or elapsed >= self.max_settle):
+                    state.settled = True
+                    settled.append(channel)
+            batch = state.batch
+            if batch and (now - batch.last >= self.batch_window or now - batch.started >= self.max_batch_wait):
+                state.batch = None
+                ready.append(batch)
+        return settled, ready
+
+    def tick_loop(self):
+        """Handles arrivals as they come and runs `due` every tick, handing the results on outside the lock."""
+        while self.running:
+            self.wakeup.clear()
+            self.process_arrivals()
+            now = self.clock()
+            with self.lock:
+                settled, ready = self.due(now)
+            for channel in settled:
+                if self.on_settled:
+                    self.on_settled(channel)
+            for batch in ready:
+                self.welcomes += 1
+                self.welcomed += batch.new + batch.returning
+                self.emit(batch.text(), batch.names[0])
+            if now - self.last_save >= SAVE_INTERVAL:
+                self.last_save = now
+                self.seen.save()
+            self.wakeup.wait(TICK)
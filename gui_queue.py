@@ -0,0 +1,64 @@
+"""Timestamped GUI message queue and a time-budgeted drain for the Tk loop.
+
+Producers keep calling `put(("status", text))` as before; the queue records
+when each item arrived so the GUI can report how far behind it is. The drain
+takes items until the queue is empty or the frame budget is spent, and folds
+them into one batch: all chat lines together, and only the latest value of
+each status-like message.
+"""
+import queue
+import time
+
+
+class GuiMessageQueue(queue.Queue):
+    """A queue.Queue that remembers when each item was put."""
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def _get(self):
+        return self.queue.popleft()
+
+    def oldest_age(self):
+        """Seconds the oldest waiting item has been queued, or 0.0 if empty."""
+        with self.mutex:
+            if not self.queue:
+                return 0.0
+            return time.monotonic() - self.queue[0][0]
+
+
+class DrainBatch:
+    """Everything taken from the queue in one GUI tick."""
+    __slots__ = ("chat_lines", "latest", "count", "depth", "oldest_age", "lag", "elapsed")
+
+    def __init__(self):
+        self.chat_lines = []
+        self.latest = {}  # message type -> most recent content, for everything but chat lines
+        self.count = 0
+        self.depth = 0
+        self.oldest_age = 0.0
+        self.lag = 0.0  # How long the first (oldest) item taken this tick had waited
+        self.elapsed = 0.0  # Time spent draining
+
+
+def drain(message_queue, budget, chat_type="message"):
+    """Takes messages for at most `budget` seconds and returns them as a DrainBatch."""
+    batch = DrainBatch()
+    start = time.perf_counter()
+    deadline = start + budget
+    while time.perf_counter() < deadline:
+        try:
+            queued_at, (message_type, content) = message_queue.get_nowait()
+        except queue.Empty:
+            break
+        if not batch.count:
+            batch.lag = time.monotonic() - queued_at
+        batch.count += 1
+        if message_type == chat_type:
+            batch.chat_lines.append(content)
+        else:
+            batch.latest[message_type] = content
+    batch.depth = message_queue.qsize()
+    batch.oldest_age = message_queue.oldest_age()
+    batch.elapsed = time.perf_counter() - start
+    return batch
@@ -0,0 +1,272 @@
+"""Single-pass IRCv3 message parser for Twitch chat lines.
+
+Lines are parsed at the bytes level, as framed by irc_reader. Parsing only
+cuts the line into its sections and decodes the command; the tags, prefix,
+middle params and trailing text stay raw bytes until a handler reads them.
+"""
+
+from operator import itemgetter
+
+# Escape sequences allowed in IRCv3 tag values
+TAG_ESCAPES = {
+    ":": ";",
+    "s": " ",
+    "\\": "\\",
+    "r": "\r",
+    "n": "\n",
+}
+
+
+def decode(data):
+    """Decodes raw IRC bytes the same forgiving way the reader always has."""
+    return data.decode("utf-8", errors="ignore")
+
+
+def unescape_tag_value(value):
+    """Turns an escaped IRCv3 tag value back into plain text."""
+    if "\\" not in value:
+        return value
+    out = []
+    i = 0
+    length = len(value)
+    while i < length:
+        char = value[i]
+        if char == "\\":
+            i += 1
+            if i < length:
+                # Unknown escapes drop the backslash, per the spec
+                out.append(TAG_ESCAPES.get(value[i], value[i]))
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def parse_tags(raw):
+    """Parses the tag section of a line (without the leading '@') into a dict."""
+    if isinstance(raw, (bytes, bytearray)):
+        raw = decode(raw)
+    tags = {}
+    for item in raw.split(";"):
+        key, _, value = item.partition("=")
+        tags[key] = unescape_tag_value(value) if "\\" in value else value
+    return tags
+
+
+class IRCMessage(tuple):
+    """A parsed IRC line: tags, prefix, command, middle params and trailing text.
+
+    A message is the tuple (tag section, prefix, command, rest) of raw bytes
+    sections of the line, with only the command decoded. Being a tuple, it
+    is built in one C call with no `__init__` to run, which matters at a
+    hundred thousand lines a second. Everything else is sliced out and
+    decoded when read, and not cached, so read `trailing` or `tags` into a
+    local when it is used more than once; `tag()` looks up a single key
+    without building the whole dict.
+    """
+    __slots__ = ()
+
+    tag_section = property(itemgetter(0), doc="b'@key=value;...' or None")
+    raw_prefix = property(itemgetter(1), doc="b':nick!user@host' or None")
+    command = property(itemgetter(2), doc="The command, uppercased")
+    rest = property(itemgetter(3), doc="Everything after the command and its space")
+
+    @property
+    def raw_tags(self):
+        """The tag section as raw bytes (without the '@'), or None."""
+        return self[0][1:] if self[0] else None
+
+    @property
+    def tags(self):
+        """All tags as a dict."""
+        return parse_tags(self[0][1:]) if self[0] else {}
+
+    def tag(self, key, default=None):
+        """Returns a single tag value without parsing the full tag section."""
+        section = self[0]
+        if section is None:
+            return default
+        needle = TAG_NEEDLES.get(key) or tag_needle(key)  # b";key="
+        _, found, after = section.partition(needle)
+        if not found:
+            if not section.startswith(needle[1:], 1):
+                return default
+            after = section[len(needle):]  # The first tag follows the "@" rather than a ";"
+        raw = after.partition(b";")[0]
+        try:
+            value = raw.decode()  # Much faster without an error handler; nearly every value is valid
+        except UnicodeDecodeError:
+            value = decode(raw)
+        return unescape_tag_value(value) if "\\" in value else value
+
+    @property
+    def prefix(self):
+        """The prefix (without the ':'), or None for lines without one."""
+        return decode(self[1][1:]) if self[1] else None
+
+    def trailing_start(self):
+        """Offset in `rest` of the trailing text, or -1 if the line has none."""
+        rest = self[3]
+        if rest[:1] == b":":
+            return 1
+        start = rest.find(b" :")
+        return start if start == -1 else start + 2
+
+    @property
+    def params(self):
+        """The middle params as a list of strings."""
+        start = self.trailing_start()
+        return decode(self[3] if start == -1 else self[3][:start - 1]).split()
+
+    @property
+    def raw_trailing(self):
+        """The trailing parameter as raw bytes, or None if the line had none."""
+        start = self.trailing_start()
+        return None if start == -1 else self[3][start:]
+
+    @property
+    def trailing(self):
+        """The trailing parameter as text, or None if the line had none."""
+        rest = self[3]
+        if rest[:1] == b":":  # trailing_start, inlined: chat handlers read this for every line
+            raw = rest[1:]
+        else:
+            _, found, raw = rest.partition(b" :")
+            if not found:
+                return None
+        try:
+            return raw.decode()
+        except UnicodeDecodeError:
+            return decode(raw)
+
+    @property
+    def nick(self):
+        """The nickname part of the prefix, or None for server messages."""
+        raw = self[1]
+        if not raw:
+            return None
+        bang = raw.find(b"!")
+        return decode(raw[1:] if bang == -1 else raw[1:bang])
+
+    @property
+    def channel(self):
+        """The channel name (without '#') this message targets, if any.
+
+        Numerics such as 353/366 carry the channel after the nick, so the
+        first '#' param is used rather than always the first one.
+        """
+        for param in self.params:
+            if param.startswith("#"):
+                return param[1:]
+        return None
+
+    def __repr__(self):
+        return (f"IRCMessage(command={self.command!r}, prefix={self.prefix!r}, "
+                f"params={self.params!r}, trailing={self.trailing!r})")
+
+
+# Tag keys as searched for in the raw tag section, e.g. "mod" -> b";mod="
+TAG_NEEDLES = {}
+
+
+def tag_needle(key):
+    needle = TAG_NEEDLES[key] = b";" + key.encode("ascii") + b"="
+    return needle
+
+
+# Decoded, uppercased commands by their raw bytes; Twitch sends a few dozen distinct ones
+COMMANDS = {}
+MAX_COMMANDS = 256
+
+
+def command_name(raw):
+    """The command as an uppercase string, decoded once per distinct command."""
+    command = COMMANDS.get(raw)
+    if command is None:
+        command = decode(raw).upper()
+        if len(COMMANDS) < MAX_COMMANDS:
+            COMMANDS[raw] = command
+    return command
+
+
+def parse_line(line):
+    """Parses a single IRC line (bytes or str, without the CRLF). Returns None for blank lines.
+
+    The line is cut at its first three spaces in one `split`, which separates
+    the tags, prefix and command of a well-formed line; nothing else is
+    decoded until a handler reads it. Lines with runs of spaces between those
+    sections go through `scan_line`.
+    """
+    try:
+        parts = line.split(b" ", 3)
+    except TypeError:  # A str line
+        line = line.encode("utf-8")
+        parts = line.split(b" ", 3)
+    first = parts[0][:1]
+    if first == b"@":
+        if len(parts) > 2 and parts[1][:1] == b":" and parts[2]:
+            if len(parts) == 3:
+                parts.append(b"")
+            parts[2] = COMMANDS.get(parts[2]) or command_name(parts[2])
+            return IRCMessage(parts)
+    elif first == b":":
+        if len(parts) > 1 and parts[1]:
+            return IRCMessage((None, parts[0], COMMANDS.get(parts[1]) or command_name(parts[1]),
+                               line[len(parts[0]) + len(parts[1]) + 2:]))
+    elif first:
+        return IRCMessage((None, None, COMMANDS.get(parts[0]) or command_name(parts[0]),
+                           line[len(parts[0]) + 1:]))
+    return scan_line(line)
+
+
+def scan_line(line):
+    """Parses a line of any shape, skipping runs of spaces between its sections."""
+    pos = 0
+    tag_section = None
+    raw_prefix = None
+
+    if line[:1] == b"@":
+        end = line.find(b" ", 1)
+        if end == -1:
+            return None
+        tag_section = line[:end]
+        pos = end + 1
+        while line.startswith(b" ", pos):
+            pos += 1
+
+    if line.startswith(b":", pos):
+        end = line.find(b" ", pos)
+        if end == -1:
+            return None
+        raw_prefix = line[pos:end]
+        pos = end + 1
+        while line.startswith(b" ", pos):
+            pos += 1
+
+    end = line.find(b" ", pos)
+    if end == -1:
+        end = len(line)
+    if end == pos:
+        return None
+    return IRCMessage((tag_section, raw_prefix, command_name(line[pos:end]), line[end + 1:]))
+
+
+class CommandDispatcher:
+    """Routes parsed messages to handlers through a command -> callable table."""
+
+    def __init__(self, handlers=None, default=None):
+        self.handlers = dict(handlers or {})
+        self.default = default
+
+    def register(self, command, handler):
+        """Registers a handler for an IRC command (e.g. "PRIVMSG" or "366")."""
+        self.handlers[command.upper()] = handler
+
+    def dispatch(self, message, *args):
+        """Calls the handler for the message's command, if one is registered."""
+        handler = self.handlers.get(message.command, self.default)
+        if handler is None:
+            return None
+        if args:
+            return handler(message, *args)
+        return handler(message)  # A plain call; CPython inlines it, unlike a call with *args
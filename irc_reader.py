@@ -0,0 +1,122 @@
+"""Bytes-level line framing for the IRC receive path.
+
+Data is received straight into a reusable bytearray with `recv_into`, and
+complete CRLF-terminated frames are sliced out of it without decoding. Only
+the unterminated tail of each read is moved, so a burst of traffic costs one
+copy per line instead of re-splitting an ever-growing string buffer.
+
+A peer that never sends a line ending can't make the buffer grow without
+bound: an unterminated line longer than MAX_LINE_LENGTH is dropped, along
+with the rest of it up to the next CRLF.
+"""
+DEFAULT_BUFFER_SIZE = 65536
+LINE_TERMINATOR = b"\r\n"
+MAX_LINE_LENGTH = 8192 + 512  # IRCv3 allows 8191 bytes of tags plus "@" and a space, then a 512-byte line
+
+
+class LineFramer:
+    """A growable receive buffer that splits incoming bytes into IRC lines."""
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, max_line_length=MAX_LINE_LENGTH):
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte of the oldest unconsumed line
+        self.end = 0  # One past the last received byte
+        self.max_line_length = max_line_length
+        self.discarding = False  # Skipping the rest of an overlong line up to its CRLF
+        self.dropped = 0  # Overlong lines dropped since the owner last reset this
+
+    def free_space(self):
+        """Returns a writable memoryview of the unused end of the buffer."""
+        if self.start and self.end == len(self.buffer):
+            self.compact()
+        if self.end == len(self.buffer):
+            self.grow()
+        return self.view[self.end:]
+
+    def compact(self):
+        """Moves the partial tail line to the front of the buffer."""
+        remaining = self.end - self.start
+        self.buffer[:remaining] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = remaining
+
+    def grow(self):
+        """Doubles the buffer when a single line does not fit in it."""
+        remaining = self.end - self.start
+        buffer = bytearray(len(self.buffer) * 2)
+        buffer[:remaining] = self.view[self.start:self.end]
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.start = 0
+        self.end = remaining
+
+    def commit(self, count):
+        """Records that `count` bytes were written into `free_space()`."""
+        self.end += count
+
+    def feed(self, data):
+        """Copies `data` into the buffer; for callers that don't own a socket."""
+        data = memoryview(data)
+        while data:
+            space = self.free_space()
+            count = min(len(space), len(data))
+            space[:count] = data[:count]
+            self.commit(count)
+            data = data[count:]
+
+    def lines(self):
+        """Returns every complete line received so far as bytes (without CRLF)."""
+        if self.discarding:
+            first = self.buffer.find(LINE_TERMINATOR, self.start, self.end)
+            if first == -1:
+                self.drop_pending()
+                return []
+            self.start = first + 2
+            self.discarding = False
+        lines = []
+        last = self.buffer.rfind(LINE_TERMINATOR, self.start, self.end)
+        if last != -1:
+            # One copy of the completed region, then a C-level split into frames
+            lines = bytes(self.view[self.start:last]).split(LINE_TERMINATOR)
+            if last + 2 == self.end:
+                # Nothing pending, so the next read can start at the front again
+                self.start = self.end = 0
+            else:
+                self.start = last + 2
+            if b"" in lines:
+                lines = [line for line in lines if line]
+        if self.end - self.start > self.max_line_length:
+            self.dropped += 1
+            self.discarding = True
+            self.drop_pending()
+        return lines
+
+    def drop_pending(self):
+        """Throws away the unterminated tail, keeping a final CR whose LF may come in the next read."""
+        if self.end > self.start and self.buffer[self.end - 1] == LINE_TERMINATOR[0]:
+            self.buffer[0] = LINE_TERMINATOR[0]
+            self.start, self.end = 0, 1
+        else:
+            self.start = self.end = 0
+
+
+class IRCReader:
+    """Reads CRLF-framed lines from a socket with `recv_into`."""
+
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.sock = sock
+        self.framer = LineFramer(buffer_size)
+
+    def read_lines(self):
+        """Blocks for one read and returns the complete lines it finished.
+
+        Returns None once the peer has closed the connection. Socket timeouts
+        are passed through to the caller.
+        """
+        count = self.sock.recv_into(self.framer.free_space())
+        if not count:
+            return None
+        self.framer.commit(count)
+        return self.framer.lines()
+
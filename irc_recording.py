@@ -0,0 +1,92 @@
+"""Compact timestamped recordings of raw IRC traffic.
+
+A recording is a gzip-compressed text file with one received line per row:
+the time since the previous row in microseconds, a tab, and the raw line as
+it came off the socket (without CRLF). Lines that arrived in the same read
+share a timestamp, so a busy capture costs a few bytes per line on top of
+gzip'd IRC text, and `zcat` is enough to inspect one.
+
+`read_recording` also accepts a plain file of raw IRC lines (such as the
+corpus files `benchmarks.py` takes); every line then has offset 0, which
+replays it as fast as possible.
+"""
+import gzip
+import threading
+import time
+
+MAGIC = "#irc-recording v1"
+
+
+class IRCRecorder:
+    """Appends raw IRC lines with timestamps to a recording file; thread-safe."""
+
+    def __init__(self, path, clock=time.monotonic):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, "wt", encoding="utf-8", newline="\n", compresslevel=6)
+        self.file.write(MAGIC + "\n")
+        self.started = None
+        self.previous = 0  # Microseconds since `started` of the last row written
+        self.lines = 0
+
+    def record_lines(self, lines):
+        """Records a batch of raw lines (bytes or str) received at the same moment."""
+        now = self.clock()
+        with self.lock:
+            if self.file is None:
+                return
+            if self.started is None:
+                self.started = now
+            micros = int((now - self.started) * 1e6)
+            delta, self.previous = micros - self.previous, micros
+            rows = []
+            for line in lines:
+                if isinstance(line, (bytes, bytearray, memoryview)):
+                    line = bytes(line).decode("utf-8", errors="replace")
+                rows.append(f"{delta}\t{line}\n")
+                delta = 0
+            self.file.write("".join(rows))
+            self.lines += len(rows)
+
+    def close(self):
+        """Flushes and closes the file."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_recording(path):
+    """Yields (seconds since the first line, raw line) from a recording or a plain line file."""
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(path, "rt", encoding="utf-8", errors="replace", newline="\n") as f:
+        first = f.readline().rstrip("\r\n")
+        if first != MAGIC:
+            # A plain corpus: no timing, replay everything at once
+            if first:
+                yield 0.0, first
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line:
+                    yield 0.0, line
+            return
+        offset = 0
+        for row in f:
+            delta, _, line = row.rstrip("\n").partition("\t")
+            offset += int(delta)
+            if line:
+                yield offset / 1e6, line
+
+
+def write_recording(path, records):
+    """Writes (offset seconds, raw line) pairs as a recording, e.g. for a synthetic scenario."""
+    with gzip.open(path, "wt", encoding="utf-8", newline="\n") as f:
+        f.write(MAGIC + "\n")
+        previous = 0
+        for offset, line in records:
+            micros = int(round(offset * 1e6))
+            f.write(f"{micros - previous}\t{line}\n")
+            previous = micros
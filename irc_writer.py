@@ -0,0 +1,224 @@
+"""Paces and batches everything the client writes to Twitch.
+
+Twitch silently drops commands sent faster than its limits allow, and locks
+out accounts that keep doing it. The limits are per account, across all of
+its connections: JOINs, chat messages in channels where the bot is an
+ordinary user, and all chat messages (the higher limit for channels it
+moderates). One RateLimiter holds a token bucket for each of those limit
+classes and is shared by every connection of an IRCClient.
+
+Each connection has an IRCWriter. Lines passed to it are queued by kind:
+
+* urgent (PING/PONG) are written before anything else, so a queue of chat
+  replies can never delay a keepalive answer into a disconnect;
+* other unlimited lines (PASS, NICK, CAP, PART) follow in order;
+* JOIN and PRIVMSG wait in per-class queues until their buckets allow them.
+
+Everything sendable is written in one `transport.write` per event loop pass,
+so a batch of JOINs or replies costs one send instead of one per line.
+"""
+import collections
+import time
+
+from metrics import MetricsRegistry
+
+LIMIT_JOIN = "join"
+LIMIT_PRIVMSG = "privmsg"  # Chat in channels the bot doesn't moderate
+LIMIT_PRIVMSG_MOD = "privmsg_mod"  # All chat, including channels the bot moderates
+
+# (lines, per seconds) for each limit class, as Twitch documents them for a regular account
+TWITCH_LIMITS = {
+    LIMIT_JOIN: (20, 10.0),
+    LIMIT_PRIVMSG: (20, 30.0),
+    LIMIT_PRIVMSG_MOD: (100, 30.0),
+}
+# The buckets a line of each class takes a token from; ordinary chat also counts toward the overall limit
+CLASS_BUCKETS = {
+    LIMIT_JOIN: (LIMIT_JOIN,),
+    LIMIT_PRIVMSG: (LIMIT_PRIVMSG, LIMIT_PRIVMSG_MOD),
+    LIMIT_PRIVMSG_MOD: (LIMIT_PRIVMSG_MOD,),
+}
+WINDOW_MARGIN = 1.05  # Tokens come back a little after the window, so network jitter can't push lines over
+URGENT_COMMANDS = ("PING", "PONG")
+MAX_QUEUED = 100  # Lines per limit class waiting for tokens; newer ones are dropped
+
+
+def command_of(line):
+    """The command of an outgoing line (which never carries a prefix or tags)."""
+    return line.partition(" ")[0].upper()
+
+
+class TokenBucket:
+    """`capacity` tokens, each coming back `period` seconds after it is spent.
+
+    Unlike a bucket that refills at a steady rate, this one can spend its
+    whole capacity at once (Twitch allows the full burst) and still never
+    lets more than `capacity` lines through in any `period`: exactly the
+    limit as Twitch counts it. It remembers at most `capacity` send times.
+    """
+
+    def __init__(self, capacity, period, clock=time.monotonic):
+        self.capacity = capacity
+        self.period = period * WINDOW_MARGIN
+        self.clock = clock
+        self.spent = collections.deque()  # When the tokens in use were spent, oldest first
+
+    def wait(self, now):
+        """Seconds until a token is available; 0.0 if one is now."""
+        while self.spent and self.spent[0] + self.period <= now:
+            self.spent.popleft()
+        if len(self.spent) < self.capacity:
+            return 0.0
+        return self.spent[0] + self.period - now
+
+    def take(self, now):
+        self.spent.append(now)
+
+
+class RateLimiter:
+    """The token buckets for one Twitch account, shared by all of its connections."""
+
+    def __init__(self, limits=None, clock=time.monotonic):
+        limits = TWITCH_LIMITS if limits is None else limits
+        self.clock = clock
+        self.buckets = {name: TokenBucket(lines, seconds, clock)
+                        for name, (lines, seconds) in limits.items()}
+        self.moderated = set()  # Channels where the bot is a moderator or the broadcaster
+
+    def classify(self, line):
+        """The limit class of an outgoing line, or None if it isn't rate limited."""
+        command, _, rest = line.partition(" ")
+        command = command.upper()
+        if command == "JOIN":
+            return LIMIT_JOIN
+        if command == "PRIVMSG":
+            channel = rest.partition(" ")[0].lstrip("#").lower()
+            return LIMIT_PRIVMSG_MOD if channel in self.moderated else LIMIT_PRIVMSG
+        return None
+
+    def set_moderator(self, channel, moderator):
+        """Records whether the bot moderates `channel` (from USERSTATE), which raises its chat limit there."""
+        if moderator:
+            self.moderated.add(channel)
+        else:
+            self.moderated.discard(channel)
+
+    def wait(self, limit, now):
+        """Seconds until a line of class `limit` may be sent."""
+        return max((self.buckets[name].wait(now) for name in CLASS_BUCKETS[limit] if name in self.buckets),
+                   default=0.0)
+
+    def take(self, limit, now):
+        for name in CLASS_BUCKETS[limit]:
+            if name in self.buckets:
+                self.buckets[name].take(now)
+
+
+class IRCWriter:
+    """Queues one connection's outgoing lines and writes them in rate-limited batches.
+
+    Every method runs on the connection's event loop. Queued JOINs and
+    registration lines are dropped when the connection goes away (they are
+    sent again on reconnect); queued chat waits for the next connection.
+    """
+
+    def __init__(self, loop, limiter, metrics=None, max_queued=MAX_QUEUED):
+        self.loop = loop
+        self.limiter = limiter
+        self.max_queued = max_queued
+        self.transport = None
+        self.urgent = collections.deque()
+        self.normal = collections.deque()
+        self.limited = {limit: collections.deque() for limit in CLASS_BUCKETS}  # limit -> (line, queued at)
+        self.flush_handle = None
+        self.flush_at = None
+        metrics = metrics or MetricsRegistry()
+        self.lines_sent = metrics.counter("irc_lines_sent_total", "IRC lines written, by limit class")
+        self.writes = metrics.counter("irc_writes_total", "Batched socket writes of outgoing IRC lines")
+        self.dropped = metrics.counter("irc_lines_dropped_total", "Outgoing IRC lines dropped, by limit class")
+        self.send_wait = metrics.histogram("irc_send_wait_seconds", "Time rate-limited IRC lines waited to be sent")
+
+    def qsize(self):
+        """Lines waiting to be written."""
+        return len(self.urgent) + len(self.normal) + sum(map(len, self.limited.values()))
+
+    def attach(self, transport):
+        """Starts writing to a newly connected transport."""
+        self.transport = transport
+        self.schedule(0.0)
+
+    def detach(self):
+        """Forgets the transport of a lost connection, keeping only queued chat."""
+        self.transport = None
+        self.urgent.clear()
+        self.normal.clear()
+        self.limited[LIMIT_JOIN].clear()
+        self.cancel()
+
+    def send(self, line):
+        """Queues a line; returns False if its class's queue was full and it was dropped."""
+        command = command_of(line)
+        if command in URGENT_COMMANDS:
+            self.urgent.append(line)
+        else:
+            limit = self.limiter.classify(line)
+            if limit is None:
+                self.normal.append(line)
+            else:
+                queue = self.limited[limit]
+                if len(queue) >= self.max_queued:
+                    self.dropped.inc(limit=limit)
+                    return False
+                queue.append((line, self.limiter.clock()))
+        self.schedule(0.0)
+        return True
+
+    def schedule(self, delay):
+        """Makes sure a flush runs within `delay` seconds; sends in the same loop pass share one flush."""
+        if self.transport is None:
+            return
+        at = self.loop.time() + delay
+        if self.flush_handle is not None:
+            if self.flush_at <= at:
+                return
+            self.flush_handle.cancel()
+        self.flush_at = at
+        if delay <= 0:
+            self.flush_handle = self.loop.call_soon(self.flush)
+        else:
+            self.flush_handle = self.loop.call_later(delay, self.flush)
+
+    def cancel(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    def flush(self):
+        """Writes every line that may go now in one write, and wakes up again when the next one may."""
+        self.flush_handle = None
+        transport = self.transport
+        if transport is None or transport.is_closing():
+            return
+        out = list(self.urgent) + list(self.normal)
+        self.urgent.clear()
+        self.normal.clear()
+        if out:
+            self.lines_sent.inc(len(out), limit="none")
+        now = self.limiter.clock()
+        next_wait = None
+        for limit, queue in self.limited.items():
+            while queue:
+                wait = self.limiter.wait(limit, now)
+                if wait > 0:
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+                    break
+                self.limiter.take(limit, now)
+                line, queued_at = queue.popleft()
+                out.append(line)
+                self.lines_sent.inc(limit=limit)
+                self.send_wait.observe(now - queued_at)
+        if out:
+            transport.write(b"".join(line.encode("utf-8") + b"\r\n" for line in out))
+            self.writes.inc()
+        if next_wait is not None:
+            self.schedule(next_wait)
@@ -0,0 +1,229 @@
+"""Counters, gauges and histograms for each stage of the chat-to-speech path.
+
+Components take an optional MetricsRegistry and register what they measure
+with `counter`, `gauge` and `histogram`, which return the existing metric if
+one of that name is already registered, so a client rebuilt on reconnect
+keeps adding to the same series. The registry renders everything in the
+Prometheus text exposition format for `/metrics`, and `snapshot` gives the
+rolling figures (rates, recent percentiles) shown in the GUI stats panel.
+"""
+import bisect
+import collections
+import threading
+import time
+
+# Bucket bounds in seconds
+PARSE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+RECENT_WINDOW = 60.0  # Seconds of observations kept for the rolling percentiles
+RECENT_SIZE = 2048
+
+
+def escape_label(value):
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels):
+    """Renders a sorted tuple of (name, value) pairs as {name="value",...}."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    """Formats a sample value the way Prometheus expects."""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels or read from a callback."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback  # For counts a component already keeps, such as cache hits
+        self.lock = threading.Lock()
+        self.values = collections.defaultdict(float)  # sorted label tuple -> count
+
+    def inc(self, amount=1, **labels):
+        """Adds `amount` to the series selected by the labels."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] += amount
+
+    def total(self):
+        """Sum over every label combination."""
+        if self.callback is not None:
+            return self.samples()[0][2]
+        with self.lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        """(suffix, labels, value) rows for the exposition format."""
+        if self.callback is not None:
+            try:
+                return [("", (), float(self.callback()))]
+            except Exception:
+                return [("", (), 0.0)]
+        with self.lock:
+            return [("", key, value) for key, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """A value that goes up and down; either set directly or read from a callback."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value):
+        """Sets the current value."""
+        self.value = value
+
+    def get(self):
+        """The current value, from the callback if there is one."""
+        if self.callback is not None:
+            try:
+                return float(self.callback())
+            except Exception:
+                return 0.0
+        return self.value
+
+    def samples(self):
+        """(suffix, labels, value) rows for the exposition format."""
+        return [("", (), self.get())]
+
+
+class Histogram:
+    """Bucketed distribution for export, plus a rolling window of recent values for percentiles."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.bounds = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = collections.deque(maxlen=RECENT_SIZE)  # (monotonic time, value)
+
+    def observe(self, value, weight=1):
+        """Records `weight` observations of `value`."""
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += weight
+            self.sum += value * weight
+            self.count += weight
+            self.recent.append((time.monotonic(), value))
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99), window=RECENT_WINDOW):
+        """Quantiles of the values observed in the last `window` seconds, or None if there were none."""
+        cutoff = time.monotonic() - window
+        with self.lock:
+            values = sorted(value for at, value in self.recent if at >= cutoff)
+        if not values:
+            return None
+        return [values[min(len(values) - 1, int(q * len(values)))] for q in quantiles]
+
+    def samples(self):
+        """(suffix, labels, value) rows for the exposition format."""
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        rows = []
+        cumulative = 0
+        for bound, bucket in zip(self.bounds + (float("inf"),), counts):
+            cumulative += bucket
+            rows.append(("_bucket", (("le", format_value(float(bound))),), cumulative))
+        rows.append(("_sum", (), total))
+        rows.append(("_count", (), count))
+        return rows
+
+
+class MetricsRegistry:
+    """Named metrics shared by the engine's components."""
+
+    def __init__(self, prefix="twitch_tts_"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.metrics = {}  # name -> metric, in registration order
+
+    def register(self, cls, name, help_text, **kwargs):
+        """Returns the metric called `name`, creating it if needed."""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, callback=None):
+        counter = self.register(Counter, name, help_text)
+        if callback is not None:
+            counter.callback = callback
+        return counter
+
+    def gauge(self, name, help_text, callback=None):
+        gauge = self.register(Gauge, name, help_text)
+        if callback is not None:
+            gauge.callback = callback  # The newest owner (e.g. a rebuilt pipeline) wins
+        return gauge
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, help_text, buckets=buckets)
+
+    def render_prometheus(self):
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            name = self.prefix + metric.name
+            lines.append(f"# HELP {name} {metric.help_text}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Current values for the stats panel: counter totals, gauge values and recent histogram percentiles."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        rows = {}
+        for metric in metrics:
+            if isinstance(metric, Counter):
+                by_label = {format_labels(labels): value for _, labels, value in metric.samples() if labels}
+                rows[metric.name] = {"kind": "counter", "total": metric.total(), "by_label": by_label}
+            elif isinstance(metric, Gauge):
+                rows[metric.name] = {"kind": "gauge", "value": metric.get()}
+            else:
+                rows[metric.name] = {"kind": "histogram", "count": metric.count,
+                                     "percentiles": metric.percentiles()}
+        return rows
+
+
+class RateTracker:
+    """Turns successive counter totals into per-second rates for a rolling display."""
+
+    def __init__(self):
+        self.previous = {}  # name -> (monotonic time, total)
+
+    def rate(self, name, total):
+        """Per-second increase of `total` since the last call for `name`."""
+        now = time.monotonic()
+        last = self.previous.get(name)
+        self.previous[name] = (now, total)
+        if last is None or now <= last[0]:
+            return 0.0
+        return max(0.0, (total - last[1]) / (now - last[0]))
@@ -0,0 +1,292 @@
+"""Typed settings kept in a JSON file, saved atomically in the background and reloaded when the file changes.
+
+A SettingsSchema gives every setting a default whose type is the setting's
+type, plus the allowed values of the settings that are choices and the
+ranges of the numbers that have limits. A
+SettingsStore holds the current values:
+
+* `update` validates a whole batch of changes before applying any of them,
+  then tells the subscribers of the changed keys, so components pick up new
+  values while running instead of being rebuilt;
+* saves are debounced: a burst of changes (a settings window, a connect)
+  becomes one write, made on the store's own thread a moment later, never
+  on the caller's;
+* writes go to a temporary file that is flushed to disk and renamed over the
+  settings file, so a crash leaves either the old or the new file, never
+  half of one;
+* the same thread polls the file, and an edit made by hand (or by another
+  tool) is validated and applied like any other update.
+
+A settings file that can't be parsed is kept as `<file>.corrupt` instead of
+being silently replaced by the defaults.
+"""
+import json
+import os
+import threading
+import time
+
+SAVE_DELAY = 0.5  # Seconds to wait for more changes before saving
+POLL_INTERVAL = 1.0  # Seconds between checks of the settings file for outside edits
+# Text accepted for on/off settings, e.g. from a hand-edited file or a form; anything else is an error
+BOOL_STRINGS = {"true": True, "false": False, "1": True, "0": False, "yes": True, "no": False,
+                "on": True, "off": False}
+
+
+class SettingsSchema:
+    """Setting names with their defaults (which fix their types), the allowed values of choice settings and number ranges."""
+
+    def __init__(self, defaults, choices=None, bounds=None):
+        self.defaults = dict(defaults)
+        self.choices = dict(choices or {})
+        self.bounds = dict(bounds or {})  # key -> (lowest, highest) allowed, either None for no limit
+
+    def coerce(self, key, value):
+        """Converts a value to the setting's type; raises ValueError if it can't or the value isn't allowed."""
+        if key not in self.defaults:
+            raise ValueError(f"Unknown setting: {key}")
+        default = self.defaults[key]
+        if isinstance(default, dict) and not isinstance(value, dict):
+            raise ValueError(f"{key} must be an object")
+        if isinstance(default, bool):
+            value = self.coerce_bool(key, value)  # Outside the try: its error isn't about numbers
+        elif isinstance(default, int) and isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{key} must be a whole number, not {value!r}")  # int() would cut it off
+        else:
+            try:
+                if default is None:
+                    value = None if value is None else str(value)
+                elif isinstance(default, int):
+                    value = int(value)
+                elif isinstance(default, float):
+                    value = float(value)
+                elif isinstance(default, dict):
+                    value = {str(k).lower(): str(v) for k, v in value.items()}
+                else:
+                    value = str(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be a number, not {value!r}") from None
+        if key in self.bounds:
+            lowest, highest = self.bounds[key]
+            if lowest is not None and not value >= lowest:  # Written so that NaN fails too
+                raise ValueError(f"{key} must be at least {lowest}, not {value!r}")
+            if highest is not None and not value <= highest:
+                raise ValueError(f"{key} must be at most {highest}, not {value!r}")
+        if key in self.choices and value not in self.choices[key]:
+            raise ValueError(f"Unknown {key.replace('_', ' ')}: {value}")
+        return value
+
+    @staticmethod
+    def coerce_bool(key, value):
+        """A real bool, 0 or 1, or one of BOOL_STRINGS; bool("false") would be True, so nothing else is guessed."""
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in BOOL_STRINGS:
+            return BOOL_STRINGS[value.strip().lower()]
+        raise ValueError(f"{key} must be true or false, not {value!r}")
+
+    def initial_values(self):
+        """The defaults, with mutable ones copied."""
+        return {key: self.coerce(key, value) for key, value in self.defaults.items()}
+
+
+class SettingsStore:
+    """The current settings, their subscribers and their file."""
+
+    def __init__(self, path, schema, save_delay=SAVE_DELAY, poll_interval=POLL_INTERVAL,
+                 on_error=None, on_reload=None):
+        self.path = path
+        self.schema = schema
+        self.save_delay = save_delay
+        self.poll_interval = poll_interval
+        self.on_error = on_error  # Called with a message for problems in the file
+        self.on_reload = on_reload  # Called with the changes picked up from an outside edit
+        self.values = schema.initial_values()
+        # Held while values change and subscribers run, so they see changes one batch at a time, in order
+        self.lock = threading.RLock()
+        self.wakeup = threading.Condition(self.lock)
+        self.file_lock = threading.Lock()  # Held while the file is written or read, never while subscribers run
+        self.subscribers = []  # (keys or None for every key, callback)
+        self.save_at = None  # When the pending save is due; None when nothing is unsaved
+        self.file_state = None  # (mtime, size) of the file as last written or read here
+        self.saves = 0
+        self.running = False
+        self.thread = None
+
+    # --- Values ---
+
+    def get(self, key):
+        return self.values[key]
+
+    def snapshot(self):
+        """A copy of every setting."""
+        with self.lock:
+            return {key: self.schema.coerce(key, value) for key, value in self.values.items()}
+
+    def subscribe(self, callback, keys=None):
+        """Calls `callback(changes)` with the changed values whenever any of `keys` (default: any setting) change."""
+        with self.lock:
+            self.subscribers.append((frozenset(keys) if keys is not None else None, callback))
+
+    def update(self, changes, save=True):
+        """Validates and applies a dict of changes, notifies subscribers and schedules a save.
+
+        Raises ValueError, changing nothing, if any value is invalid. Returns
+        the settings that actually changed.
+        """
+        values = {key: self.schema.coerce(key, value) for key, value in changes.items()}
+        with self.lock:
+            changed = {key: value for key, value in values.items() if value != self.values[key]}
+            if not changed:
+                return changed
+            self.values.update(changed)
+            for keys, callback in list(self.subscribers):
+                if keys is None or not keys.isdisjoint(changed):
+                    try:
+                        callback(changed)
+                    except Exception as e:
+                        self.report(f"Could not apply settings {', '.join(sorted(changed))}: {e}")
+            if save:
+                self.schedule_save()
+            return changed
+
+    def report(self, text):
+        if self.on_error:
+            self.on_error(text)
+        else:
+            print(text)
+
+    # --- File ---
+
+    def load(self):
+        """Reads the file into the store, or creates it with the defaults; invalid values keep their defaults."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+        except FileNotFoundError:
+            self.write()
+            return
+        except (OSError, ValueError) as e:  # json.JSONDecodeError is a ValueError
+            backup = self.path + ".corrupt"
+            try:
+                os.replace(self.path, backup)
+                self.report(f"Settings file {self.path} is unreadable ({e}); kept it as {backup} and started from defaults.")
+            except OSError:
+                self.report(f"Settings file {self.path} is unreadable ({e}); using defaults.")
+            self.write()
+            return
+        self.update(self.valid_values(data), save=False)
+        self.file_state = self.stat()
+
+    def valid_values(self, data):
+        """The known settings in `data` that have valid values; reports the rest."""
+        values = {}
+        for key, value in data.items():
+            if key not in self.schema.defaults:
+                continue  # A setting from another version; dropped on the next save
+            try:
+                values[key] = self.schema.coerce(key, value)
+            except ValueError as e:
+                self.report(f"Ignoring setting {key} in {self.path}: {e}")
+        return values
+
+    def stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def schedule_save(self):
+        """Saves in `save_delay` seconds, unless more changes come first and push the save back."""
+        with self.lock:
+            self.save_at = time.monotonic() + self.save_delay
+            self.wakeup.notify()
+        if not self.running:
+            self.write()  # No background thread (yet): save now rather than never
+
+    def write(self):
+        """Writes every setting atomically: a flushed temporary file renamed over the old one."""
+        with self.lock:
+            data = json.dumps(self.values, indent=4)
+            self.save_at = None
+        with self.file_lock:
+            temporary = f"{self.path}.tmp"
+            try:
+                with open(temporary, "w", encoding="utf-8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporary, self.path)
+            except OSError as e:
+                self.report(f"Could not save settings to {self.path}: {e}")
+                return False
+            self.file_state = self.stat()
+            self.saves += 1
+            return True
+
+    def flush(self):
+        """Writes a pending save now."""
+        with self.lock:
+            if self.save_at is not None:
+                self.write()
+
+    def check_file(self):
+        """Applies the file's contents if something other than this store changed it."""
+        with self.file_lock:
+            state = self.stat()
+            if state is None or state == self.file_state:
+                return
+            self.file_state = state
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                self.report(f"Not reloading {self.path}: {e}")  # Probably saved halfway; the next save retries
+                return
+        if not isinstance(data, dict):
+            return
+        changed = self.update(self.valid_values(data), save=False)
+        if changed and self.on_reload:
+            self.on_reload(changed)
+
+    # --- Background thread ---
+
+    def start(self):
+        """Starts the thread that saves changes and watches the file."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="settings", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Saves when a save is due and polls the file, sleeping in between; the lock is free while it works."""
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                now = time.monotonic()
+                save_due = self.save_at is not None and now >= self.save_at
+                poll_due = now >= next_poll
+                if not save_due and not poll_due:
+                    due = next_poll if self.save_at is None else min(next_poll, self.save_at)
+                    self.wakeup.wait(due - now)
+                    continue
+            if save_due:
+                self.write()
+            if poll_due:
+                self.check_file()
+                next_poll = time.monotonic() + self.poll_interval
+
+    def close(self):
+        """Stops the thread and writes any unsaved changes."""
+        with self.lock:
+            self.running = False
+            self.wakeup.notify()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+        self.flush()
@@ -0,0 +1,86 @@
+import os
+
+from audio_cache import AudioCache, CachingBackend
+from tts_backends import NullBackend
+
+VOICE = ("v1", 175, 1.0)
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = AudioCache(max_memory_bytes=10)
+    cache.put("a", *VOICE, b"aaaa")
+    cache.put("b", *VOICE, b"bbbb")
+    assert cache.get("a", *VOICE) == b"aaaa"  # Now "b" is the least recently used
+    cache.put("c", *VOICE, b"cccc")
+    assert cache.get("b", *VOICE) is None
+    assert cache.get("a", *VOICE) == b"aaaa"
+    assert cache.get("c", *VOICE) == b"cccc"
+    assert cache.memory_bytes == 8
+    assert (cache.memory_hits, cache.misses) == (3, 1)
+
+
+def test_entries_larger_than_the_memory_tier_are_not_kept():
+    cache = AudioCache(max_memory_bytes=4)
+    cache.put("a", *VOICE, b"aaa")
+    cache.put("big", *VOICE, b"x" * 5)
+    assert cache.get("big", *VOICE) is None
+    assert cache.get("a", *VOICE) == b"aaa"
+
+
+def test_keys_ignore_extra_whitespace_but_not_settings():
+    cache = AudioCache()
+    cache.put("gg  wp", *VOICE, b"x")
+    assert cache.get(" gg wp ", *VOICE) == b"x"
+    assert cache.get("gg wp", "v1", 200, 1.0) is None
+    assert cache.get("gg wp", "v2", 175, 1.0) is None
+
+
+def test_disk_tier_evicts_and_survives_a_restart(tmp_path):
+    cache = AudioCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=8)
+    cache.put("a", *VOICE, b"aaaa")
+    cache.put("b", *VOICE, b"bbbb")
+    assert cache.get("a", *VOICE) == b"aaaa"
+    cache.put("c", *VOICE, b"cccc")
+    assert len(os.listdir(tmp_path)) == 2
+    assert cache.disk_bytes == 8
+    reopened = AudioCache(disk_dir=str(tmp_path), max_disk_bytes=8)
+    assert reopened.get("b", *VOICE) is None
+    assert reopened.get("a", *VOICE) == b"aaaa"
+    assert reopened.disk_hits == 1
+    assert reopened.get("a", *VOICE) == b"aaaa"  # Promoted to the memory tier
+    assert reopened.memory_hits == 1
+
+
+def test_invalidate_keeps_only_the_current_settings(tmp_path):
+    cache = AudioCache(disk_dir=str(tmp_path))
+    cache.put("a", *VOICE, b"old")
+    cache.put("a", "v2", 175, 1.0, b"new")
+    cache.invalidate("v2", 175, 1.0)
+    assert cache.get("a", *VOICE) is None
+    assert cache.get("a", "v2", 175, 1.0) == b"new"
+    assert cache.memory_bytes == 3
+    assert len(os.listdir(tmp_path)) == 1
+
+
+class CountingBackend(NullBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def synthesize(self, text, voice_id=None, rate=None, volume=None):
+        self.calls.append(text)
+        return super().synthesize(text, voice_id, rate, volume)
+
+
+def test_caching_backend_reuses_phrases_and_drops_them_on_a_voice_change():
+    backend = CountingBackend()
+    caching = CachingBackend(backend, AudioCache(), max_text_length=20)
+    caching.synthesize(("ann says", "gg"))
+    caching.synthesize(("bob says", "gg"))
+    caching.synthesize("a message longer than twenty characters")
+    caching.synthesize("a message longer than twenty characters")
+    assert backend.calls == ["ann says", "gg", "bob says"] + ["a message longer than twenty characters"] * 2
+    caching.configure("other", 175, 1.0)
+    caching.synthesize("gg")
+    assert backend.calls[-1] == "gg"
+    assert caching.cache.memory_bytes == len(caching.cache.get("gg", "null:other", 175, 1.0))
@@ -0,0 +1,45 @@
+import argparse
+import json
+
+from benchmarks import check_scenario, load_baseline
+
+
+def args(**limits):
+    options = {"drain_timeout": 30.0, "tolerance": 0.25, "max_p99": None, "max_drop_rate": None,
+               "min_lines_per_second": None}
+    options.update(limits)
+    return argparse.Namespace(**options)
+
+
+def result(**values):
+    base = {"scenario": "busy", "lines_sent": 500, "lines_received": 500, "lines_per_second": 1000.0,
+            "parse_seconds": [1e-6, 2e-6, 3e-6], "errors": 0, "drop_rate": 0.1,
+            "end_to_end_seconds": [0.01, 0.02, 0.03], "drained": True, "peak_rss_mb": 30.0}
+    base.update(values)
+    return base
+
+
+def test_a_clean_run_passes():
+    assert check_scenario(result(), args()) == []
+    assert check_scenario(result(), args(), baseline=result()) == []
+
+
+def test_lost_lines_errors_and_backlog_always_fail():
+    failures = check_scenario(result(lines_received=499, errors=2, drained=False), args())
+    assert len(failures) == 3
+
+
+def test_explicit_limits():
+    failures = check_scenario(result(), args(max_p99=0.01, max_drop_rate=0.05, min_lines_per_second=2000))
+    assert len(failures) == 3
+
+
+def test_baseline_regressions_beyond_the_tolerance(tmp_path):
+    path = tmp_path / "baseline.json"
+    path.write_text(json.dumps(result()) + "\n" + json.dumps(result(scenario="raid")) + "\n")
+    baseline = load_baseline(str(path))["busy"]
+    assert check_scenario(result(lines_per_second=800.0, end_to_end_seconds=[0.01, 0.02, 0.04]), args(),
+                          baseline) == []
+    failures = check_scenario(result(lines_per_second=700.0, end_to_end_seconds=[0.01, 0.02, 0.05]), args(),
+                              baseline)
+    assert [failure.split()[0] for failure in failures] == ["lines_per_second", "end_to_end_seconds"]
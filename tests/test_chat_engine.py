@@ -0,0 +1,43 @@
+import json
+import threading
+
+import pytest
+
+from chat_engine import ChatEngine
+from irc_parser import parse_line
+from tts_backends import NullBackend
+from tts_pipeline import NullPlayer
+
+
+@pytest.fixture
+def engine(tmp_path):
+    settings_file = tmp_path / "settings.json"
+    settings_file.write_text(json.dumps({"history_file": "", "seen_users_file": ""}))
+    engine = ChatEngine(str(settings_file), backend=NullBackend(), player=NullPlayer())
+    yield engine
+    engine.close()
+
+
+def test_tts_command_does_not_wait_for_the_settings_lock(engine):
+    """A !tts command runs on the IRC loop thread, which disconnect() waits for while holding the lock."""
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with engine.settings_lock:
+            held.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    held.wait(5)
+    command = parse_line(b"@badges=moderator/1;mod=1 :ann!ann@ann PRIVMSG #chan :!tts off")
+    runner = threading.Thread(target=engine.handle_tts_command, args=(command, "chan", ["off"]))
+    runner.start()
+    runner.join(timeout=2)
+    stalled = runner.is_alive()
+    release.set()
+    holder.join()
+    assert not stalled
+    engine.command_runner.shutdown()
+    assert engine.tts_enabled is False
@@ -0,0 +1,26 @@
+from chat_history import ChatHistory
+
+
+def test_records_and_searches(tmp_path):
+    history = ChatHistory(str(tmp_path / "history.db"))
+    try:
+        history.record_message("chan", "Ann", "hello 100%", ts=10.0)
+        history.record_seen("chan", "bob", ts=20.0)
+        history.flush()
+        assert history.last_seen("chan", "ANN") == 10.0
+        assert history.viewer("chan", "bob")["messages"] == 0
+        assert [row["text"] for row in history.search(text="100%")] == ["hello 100%"]
+        assert history.search(text="1000") == []
+    finally:
+        history.close()
+
+
+def test_write_errors_go_to_the_error_callback(tmp_path):
+    errors = []
+    history = ChatHistory(str(tmp_path / "history.db"), on_error=errors.append)
+    try:
+        history.record_message("chan", "ann", None)  # NOT NULL text: the batch fails
+        history.flush()
+        assert len(errors) == 1 and errors[0].startswith("Chat history write failed")
+    finally:
+        history.close()
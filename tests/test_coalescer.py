@@ -0,0 +1,96 @@
+import threading
+
+from coalescer import Coalescer, MinHasher, normalize, shingles
+
+COPYPASTA = "this streamer is literally the best player i have ever seen in my entire life"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def collect(messages, window=1.5, **options):
+    """Runs `messages` ((user, text) pairs) through one coalescing window; returns the emitted entries."""
+    emitted = []
+    clock = Clock()
+    coalescer = Coalescer(lambda item, user, priority: emitted.append((tuple(item), user, priority)),
+                          window=window, clock=clock, **options)
+    coalescer.running = True
+    for user, text in messages:
+        coalescer.add(user, text, 2)
+    clock.now += window
+    with coalescer.lock:
+        due = coalescer.due_groups()
+    coalescer.emit_groups(due)
+    return emitted, coalescer
+
+
+def test_normalize_and_shingles():
+    assert normalize("  GG!!  wp. ") == "gg wp"
+    assert shingles("gg") == {"gg"}
+    assert shingles("lol") == {"lol"}
+    assert shingles("one two three four") == {"one two", "two three", "three four"}
+
+
+def test_signature_similarity_tracks_jaccard():
+    hasher = MinHasher(num_hashes=128, bands=32)
+    a = hasher.signature(shingles(normalize(COPYPASTA)))
+    b = hasher.signature(shingles(normalize(COPYPASTA + " KEKW")))
+    c = hasher.signature(shingles(normalize("does anyone know what game this is and where to buy it")))
+    assert hasher.similarity(a, a) == 1.0
+    assert hasher.similarity(a, b) > 0.75
+    assert hasher.similarity(a, c) < 0.25
+    assert len(hasher.band_keys(a)) == 32
+
+
+def test_exact_copies_are_merged():
+    emitted, coalescer = collect([("ann", "gg"), ("bob", "GG!"), ("Ann", "gg"), ("cat", "hello there")])
+    assert emitted == [(("2 people said", "gg"), "ann", 2), (("cat says", "hello there"), "cat", 2)]
+    assert coalescer.summary() == "coalesced 4->2"
+
+
+def test_near_duplicates_are_merged():
+    messages = [("ann", COPYPASTA), ("bob", COPYPASTA + " KEKW"), ("cat", "KEKW " + COPYPASTA),
+                ("dan", "does anyone know what game this is and where to buy it")]
+    emitted, _ = collect(messages)
+    assert [item for item, _, _ in emitted] == [("3 people said", COPYPASTA),
+                                                 ("dan says", "does anyone know what game this is and where to buy it")]
+
+
+def test_messages_sharing_a_few_words_stay_apart():
+    other = "this streamer is literally the worst at reading chat so please stop asking him things"
+    emitted, _ = collect([("ann", COPYPASTA), ("bob", other)])
+    assert [item for item, _, _ in emitted] == [("ann says", COPYPASTA), ("bob says", other)]
+
+
+def test_group_limit_flushes_the_oldest_group_early():
+    emitted, coalescer = collect([("ann", "one"), ("bob", "two"), ("cat", "three")], max_groups=2)
+    assert [item[1] for item, _, _ in emitted] == ["one", "two", "three"]
+    assert not coalescer.groups and not coalescer.buckets
+
+
+def test_flush_thread_survives_an_emit_error():
+    emitted = []
+    errors = []
+    done = threading.Event()
+
+    def emit(item, user, priority):
+        if item[1] == "boom":
+            raise RuntimeError("queue is gone")
+        emitted.append(item[1])
+        done.set()
+
+    coalescer = Coalescer(emit, window=0.01, on_error=errors.append)
+    coalescer.start()
+    try:
+        coalescer.add("ann", "boom", 2)
+        coalescer.add("bob", "still here", 2)
+        assert done.wait(2.0)
+    finally:
+        coalescer.stop()
+    assert emitted == ["still here"]
+    assert errors == ["Couldn't queue a message for TTS: queue is gone"]
@@ -0,0 +1,121 @@
+import http.client
+import json
+
+import pytest
+
+import chat_engine
+from chat_engine import ChatEngine
+from control_api import ControlServer, host_name
+from tts_backends import NullBackend
+from tts_pipeline import NullPlayer
+
+
+class FakeEngine:
+    def __init__(self):
+        self.updates = []
+        self.disconnects = 0
+
+    def status(self):
+        return {"connected": False}
+
+    def settings(self):
+        return {"rate": 175}
+
+    def update_settings(self, changes):
+        self.updates.append(changes)
+        return changes
+
+    def disconnect(self):
+        self.disconnects += 1
+
+
+@pytest.fixture
+def server():
+    server = ControlServer(FakeEngine(), port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+
+def post_json(server, path, data, **headers):
+    return request(server, "POST", path, json.dumps(data), {"Content-Type": "application/json", **headers})
+
+
+def test_host_name():
+    assert host_name("localhost:8765") == "localhost"
+    assert host_name("127.0.0.1") == "127.0.0.1"
+    assert host_name("[::1]:8765") == "::1"
+    assert host_name("http://evil.example:8765") == "evil.example"
+    assert host_name("http://LOCALHOST") == "localhost"
+
+
+def test_json_settings_update_is_applied(server):
+    assert post_json(server, "/settings", {"rate": 200}) == (200, {"rate": 200})
+    assert server.engine.updates == [{"rate": 200}]
+
+
+def test_post_without_json_content_type_is_refused(server):
+    status, _ = request(server, "POST", "/settings", json.dumps({"rate": 200}), {"Content-Type": "text/plain"})
+    assert status == 400
+    status, _ = request(server, "POST", "/disconnect")
+    assert status == 400
+    assert server.engine.updates == [] and server.engine.disconnects == 0
+
+
+def test_foreign_origin_and_host_are_refused(server):
+    assert post_json(server, "/disconnect", {}, Origin="http://evil.example")[0] == 403
+    assert request(server, "GET", "/settings", headers={"Host": "rebound.example:8765"})[0] == 403
+    assert post_json(server, "/disconnect", {}, Origin=f"http://localhost:{server.port}")[0] == 200
+    assert server.engine.disconnects == 1
+
+
+def test_file_and_command_settings_are_locked(server):
+    for key in ("seen_users_file", "record_file", "espeak_command", "control_token"):
+        status, _ = post_json(server, "/settings", {"rate": 200, key: "x"})
+        assert status == 403
+    assert server.engine.updates == []
+
+
+def test_token_is_required_when_set(server):
+    server.token = "secret"
+    assert request(server, "GET", "/status")[0] == 401
+    assert request(server, "GET", "/status", headers={"Authorization": "Bearer secret"})[0] == 200
+
+
+@pytest.fixture
+def engine_server(tmp_path):
+    settings_file = tmp_path / "settings.json"
+    settings_file.write_text(json.dumps({"history_file": "", "seen_users_file": ""}))
+    engine = ChatEngine(str(settings_file), backend=NullBackend(), player=NullPlayer())
+    server = ControlServer(engine, port=0)
+    server.start()
+    yield server
+    server.stop()
+    engine.close()
+
+
+@pytest.mark.parametrize("channels", [["a\r\nPRIVMSG #b :hi"], ["ok", "bad name"], [1], {"a": 1}, "a\nb:c"])
+def test_connect_refuses_channels_that_are_not_channel_names(engine_server, channels):
+    status, body = post_json(engine_server, "/connect", {"channels": channels})
+    assert status == 400
+    assert engine_server.engine.running is False and engine_server.engine.irc_client is None
+
+
+def test_connect_that_fails_halfway_can_be_retried(engine_server, monkeypatch):
+    def fail(*args, **kwargs):
+        raise ValueError("no network")
+
+    monkeypatch.setattr(chat_engine, "IRCClient", fail)
+    for _ in range(2):
+        assert post_json(engine_server, "/connect", {"channels": ["#Somechannel"]}) == (400, {"error": "no network"})
+    assert engine_server.engine.running is False
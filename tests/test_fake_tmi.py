@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from fake_tmi import FakeTMIServer
+from irc_client import IRCClient
+from irc_parser import CommandDispatcher
+from irc_writer import TWITCH_LIMITS
+
+SCALE = 10.0  # Both sides shorten Twitch's windows alike, so a full test takes seconds
+
+
+def wait_until(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.fixture
+def server():
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(FakeTMIServer(enforce_limits=True, limit_scale=SCALE).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+def test_client_stays_within_the_servers_limits(server):
+    channels = [f"channel{i}" for i in range(25)]  # More JOINs than one window allows
+    server.moderators.add(channels[0])
+    joined = set()
+    notices = []
+    dispatcher = CommandDispatcher({
+        "366": lambda message, channel: joined.add(channel),
+        "NOTICE": lambda message, channel: notices.append(message.trailing),
+    })
+    limits = {limit: (lines, seconds / SCALE) for limit, (lines, seconds) in TWITCH_LIMITS.items()}
+    client = IRCClient("oauth:test", "testbot", channels, dispatcher=dispatcher, host=server.host,
+                       port=server.port, channels_per_connection=10, rate_limits=limits)
+    client.start()
+    try:
+        assert wait_until(lambda: len(joined) == len(channels), 30)
+        # Over the ordinary chat window in one channel, and a burst in the moderated one
+        for i in range(25):
+            client.say(channels[1], f"reply {i}")
+        for i in range(40):
+            client.say(channels[0], f"mod reply {i}")
+        assert wait_until(lambda: len(server.chat_received) == 65, 30)
+        connections = len(client.connections)
+    finally:
+        client.stop()
+    assert not server.limit_violations
+    assert not notices
+    assert server.connections_accepted == connections  # Nobody was disconnected and had to reconnect
@@ -0,0 +1,104 @@
+import threading
+
+from greeter import Greeter, SeenUsers
+
+
+class History:
+    """Answers last_seen like ChatHistory, and notes which thread asked."""
+
+    def __init__(self, visits):
+        self.visits = visits
+        self.threads = []
+
+    def last_seen(self, channel, user):
+        self.threads.append(threading.current_thread().name)
+        return self.visits.get((channel, user))
+
+    def viewer_keys(self):
+        return iter(self.visits)
+
+
+class Clocks:
+    def __init__(self):
+        self.now = 0.0
+        self.wall = 1_000_000.0
+
+
+def settled_greeter(seen, clocks, **options):
+    welcomes = []
+    greeter = Greeter(lambda text, user: welcomes.append(text), seen, min_settle=0.0,
+                      clock=lambda: clocks.now, wall_clock=lambda: clocks.wall, **options)
+    greeter.watch("chan")
+    greeter.due(clocks.now)  # No joins yet: settles at once
+    return greeter, welcomes
+
+
+def send_ready(greeter, now):
+    greeter.process_arrivals()
+    with greeter.lock:
+        _, ready = greeter.due(now)
+    return [batch.text() for batch in ready]
+
+
+def test_arrival_is_only_queued_on_the_callers_thread():
+    clocks = Clocks()
+    history = History({("chan", "ann"): clocks.wall - 100 * 3600})
+    greeter, _ = settled_greeter(SeenUsers(history=history), clocks)
+    greeter.viewer_arrived("chan", "ann")
+    assert history.threads == []  # No query on the IRC loop
+    greeter.start()
+    try:
+        for _ in range(100):
+            if history.threads:
+                break
+            threading.Event().wait(0.01)
+    finally:
+        greeter.stop()
+    assert history.threads == ["greeter"]
+
+
+def test_new_and_returning_viewers_are_welcomed_together():
+    clocks = Clocks()
+    history = History({("chan", "ann"): clocks.wall - 100 * 3600, ("chan", "bob"): clocks.wall - 60})
+    greeter, _ = settled_greeter(SeenUsers(history=history), clocks, batch_window=3.0)
+    for user in ("ann", "bob", "cat"):
+        greeter.viewer_arrived("chan", user)
+    assert send_ready(greeter, clocks.now) == []
+    assert send_ready(greeter, clocks.now + 3.0) == ["Welcome to the stream, ann and cat!"]  # bob was just here
+
+
+def test_visit_is_recorded_after_the_lookup():
+    clocks = Clocks()
+    history = History({("chan", "ann"): clocks.wall - 100 * 3600})
+    greeter, _ = settled_greeter(SeenUsers(history=history), clocks, batch_window=0.0)
+    greeter.viewer_arrived("chan", "ann", record=lambda: history.visits.__setitem__(("chan", "ann"), clocks.wall))
+    assert history.visits[("chan", "ann")] < clocks.wall  # Not written from the IRC side
+    assert send_ready(greeter, clocks.now) == ["Welcome back, ann!"]
+    assert history.visits[("chan", "ann")] == clocks.wall
+
+
+def test_stop_still_records_queued_arrivals():
+    recorded = []
+    greeter = Greeter(lambda text, user: None, SeenUsers())
+    greeter.viewer_arrived("chan", "ann", record=lambda: recorded.append("ann"))
+    greeter.stop()
+    assert recorded == ["ann"]
+    assert greeter.seen.lookup("chan", "ann") == 0.0
+
+
+def test_save_errors_go_to_the_error_callback(tmp_path):
+    errors = []
+    seen = SeenUsers(str(tmp_path / "missing" / "seen.bloom"), on_error=errors.append)
+    seen.add("chan", "ann")
+    seen.save()
+    assert len(errors) == 1 and errors[0].startswith("Could not save seen users")
+    assert seen.changed  # Tried again on the next save
+
+
+def test_unreadable_file_is_reported_and_replaced(tmp_path):
+    path = tmp_path / "seen.bloom"
+    path.write_bytes(b"junk")
+    errors = []
+    seen = SeenUsers(str(path), on_error=errors.append)
+    assert errors and "starting a new list" in errors[0]
+    assert seen.lookup("chan", "ann") is None
@@ -0,0 +1,78 @@
+from irc_parser import CommandDispatcher, parse_line, parse_tags, scan_line
+
+
+def test_privmsg_with_tags():
+    message = parse_line(b"@badge-info=;display-name=Ann\\sB;mod=1 :ann!ann@ann.tmi.twitch.tv PRIVMSG #chan :hello :)")
+    assert message.command == "PRIVMSG"
+    assert message.nick == "ann"
+    assert message.prefix == "ann!ann@ann.tmi.twitch.tv"
+    assert message.channel == "chan"
+    assert message.params == ["#chan"]
+    assert message.trailing == "hello :)"
+    assert message.tag("display-name") == "Ann B"
+    assert message.tag("badge-info") == ""  # The first tag follows the "@"
+    assert message.tag("mod") == "1"
+    assert message.tag("bits") is None
+    assert message.tags == {"badge-info": "", "display-name": "Ann B", "mod": "1"}
+
+
+def test_tag_lookup_does_not_match_a_longer_key():
+    message = parse_line(b"@user-id=1;id=2 :a!a@a PRIVMSG #c :x")
+    assert message.tag("id") == "2"
+    assert message.tag("user-id") == "1"
+
+
+def test_tag_escapes():
+    assert parse_tags(rb"a=x\:y\sz\\;b=\r\n;c=\q") == {"a": "x;y z\\", "b": "\r\n", "c": "q"}
+
+
+def test_lines_without_tags_or_prefix():
+    ping = parse_line(b"PING :tmi.twitch.tv")
+    assert ping.command == "PING"
+    assert ping.prefix is None and ping.nick is None
+    assert ping.trailing == "tmi.twitch.tv"
+    join = parse_line(b":bob!bob@bob.tmi.twitch.tv JOIN #chan")
+    assert join.command == "JOIN" and join.nick == "bob" and join.channel == "chan"
+    assert join.trailing is None
+
+
+def test_names_reply_channel_is_the_first_hash_param():
+    message = parse_line(b":me.tmi.twitch.tv 353 me = #chan :ann bob cat")
+    assert message.command == "353"
+    assert message.params == ["me", "=", "#chan"]
+    assert message.channel == "chan"
+    assert message.trailing.split() == ["ann", "bob", "cat"]
+
+
+def test_runs_of_spaces_and_str_input():
+    message = parse_line("@a=1  :nick!n@h   privmsg #c :hi  there")
+    assert message.command == "PRIVMSG"
+    assert message.tag("a") == "1"
+    assert message.nick == "nick"
+    assert message.trailing == "hi  there"
+    assert parse_line(b"@a=1 :nick!n@h   PRIVMSG #c :x") == scan_line(b"@a=1 :nick!n@h   PRIVMSG #c :x")
+
+
+def test_invalid_utf8_is_ignored():
+    message = parse_line(b"@display-name=A\xffnn :a!a@a PRIVMSG #c :caf\xc3\xa9 \xff")
+    assert message.tag("display-name") == "Ann"
+    assert message.trailing == "café "
+
+
+def test_blank_and_truncated_lines():
+    assert parse_line(b"") is None
+    assert parse_line(b"   ") is None
+    assert parse_line(b"@a=1") is None
+    assert parse_line(b":prefix-only") is None
+
+
+def test_dispatcher_routes_by_command():
+    seen = []
+    dispatcher = CommandDispatcher({"PRIVMSG": lambda m, channel: seen.append((m.trailing, channel))},
+                                   default=lambda m, channel: seen.append((m.command, channel)))
+    dispatcher.register("ping", lambda m: seen.append("ping"))
+    dispatcher.dispatch(parse_line(b":a!a@a PRIVMSG #c :hi"), "c")
+    dispatcher.dispatch(parse_line(b":a!a@a JOIN #c"), "c")
+    dispatcher.dispatch(parse_line(b"PING :x"))
+    assert seen == [("hi", "c"), ("JOIN", "c"), "ping"]
+    assert CommandDispatcher().dispatch(parse_line(b"PING :x")) is None
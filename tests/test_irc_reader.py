@@ -0,0 +1,56 @@
+from irc_reader import LineFramer
+
+
+def test_lines_split_across_reads():
+    framer = LineFramer(16)
+    framer.feed(b"PING :a\r\nPRIV")
+    assert framer.lines() == [b"PING :a"]
+    assert framer.lines() == []
+    framer.feed(b"MSG #c :hi\r")
+    assert framer.lines() == []
+    framer.feed(b"\n\r\n\r\nPONG\r\n")
+    assert framer.lines() == [b"PRIVMSG #c :hi", b"PONG"]  # Empty lines are dropped
+
+
+def test_buffer_grows_for_a_long_line_and_compacts_the_tail():
+    framer = LineFramer(8)
+    line = b"x" * 100
+    framer.feed(line + b"\r\nab")
+    assert framer.lines() == [line]
+    assert len(framer.buffer) >= 102
+    framer.feed(b"c\r\n")
+    assert framer.lines() == [b"abc"]
+    assert framer.start == framer.end == 0
+
+
+def test_free_space_and_commit():
+    framer = LineFramer(8)
+    space = framer.free_space()
+    space[:6] = b"JOIN\r\n"
+    framer.commit(6)
+    assert framer.lines() == [b"JOIN"]
+
+
+def test_an_unterminated_line_past_the_limit_is_dropped():
+    framer = LineFramer(8, max_line_length=32)
+    framer.feed(b"PING :a\r\n" + b"x" * 20)
+    assert framer.lines() == [b"PING :a"]
+    for _ in range(10):
+        framer.feed(b"x" * 20)
+        assert framer.lines() == []
+    assert len(framer.buffer) <= 64
+    assert framer.dropped == 1
+    framer.feed(b"xx\r\nPONG\r\n")
+    assert framer.lines() == [b"PONG"]  # The rest of the long line is skipped too
+    framer.feed(b"x" * 40 + b"\r")
+    assert framer.lines() == []
+    framer.feed(b"\nJOIN\r\n")
+    assert framer.lines() == [b"JOIN"]  # A CRLF split across reads still ends the dropped line
+    assert framer.dropped == 2
+
+
+def test_long_complete_lines_are_kept():
+    framer = LineFramer(8, max_line_length=32)
+    framer.feed(b"y" * 100 + b"\r\n")
+    assert framer.lines() == [b"y" * 100]
+    assert framer.dropped == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+from irc_writer import (LIMIT_JOIN, LIMIT_PRIVMSG, LIMIT_PRIVMSG_MOD, WINDOW_MARGIN, IRCWriter, RateLimiter,
+                        TokenBucket)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Transport:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def is_closing(self):
+        return False
+
+    def lines(self):
+        return b"".join(self.writes).decode().split("\r\n")[:-1]
+
+
+def test_bucket_allows_full_burst_then_waits_for_the_oldest_token():
+    bucket = TokenBucket(3, 10.0)
+    for t in (0.0, 1.0, 2.0):
+        assert bucket.wait(t) == 0.0
+        bucket.take(t)
+    period = 10.0 * WINDOW_MARGIN
+    assert bucket.wait(2.0) == period - 2.0
+    assert bucket.wait(period) == 0.0  # The first token is back
+    bucket.take(period)
+    assert bucket.wait(period) == 1.0
+
+
+def test_limiter_classes_and_shared_buckets():
+    limiter = RateLimiter({LIMIT_JOIN: (1, 10.0), LIMIT_PRIVMSG: (2, 30.0), LIMIT_PRIVMSG_MOD: (3, 30.0)},
+                          clock=Clock())
+    limiter.set_moderator("modded", True)
+    assert limiter.classify("JOIN #a") == LIMIT_JOIN
+    assert limiter.classify("PRIVMSG #a :hi") == LIMIT_PRIVMSG
+    assert limiter.classify("PRIVMSG #Modded :hi") == LIMIT_PRIVMSG_MOD
+    assert limiter.classify("PONG :tmi.twitch.tv") is None
+    limiter.take(LIMIT_PRIVMSG, 0.0)
+    limiter.take(LIMIT_PRIVMSG, 0.0)
+    assert limiter.wait(LIMIT_PRIVMSG, 0.0) > 0
+    assert limiter.wait(LIMIT_PRIVMSG_MOD, 0.0) == 0.0  # Ordinary chat also counts toward the overall limit
+    limiter.take(LIMIT_PRIVMSG_MOD, 0.0)
+    assert limiter.wait(LIMIT_PRIVMSG_MOD, 0.0) > 0
+
+
+def test_writer_batches_and_paces_lines():
+    async def run():
+        loop = asyncio.get_running_loop()
+        clock = Clock()
+        limiter = RateLimiter({LIMIT_JOIN: (2, 10.0), LIMIT_PRIVMSG: (20, 30.0), LIMIT_PRIVMSG_MOD: (100, 30.0)},
+                              clock=clock)
+        writer = IRCWriter(loop, limiter)
+        transport = Transport()
+        writer.attach(transport)
+        for channel in "abc":
+            writer.send(f"JOIN #{channel}")
+        writer.send("PRIVMSG #a :hi")
+        writer.send("PONG :tmi.twitch.tv")
+        await asyncio.sleep(0)
+        assert len(transport.writes) == 1  # One write for everything sendable
+        assert transport.lines() == ["PONG :tmi.twitch.tv", "JOIN #a", "JOIN #b", "PRIVMSG #a :hi"]
+        assert writer.qsize() == 1
+        clock.now += 10.0 * WINDOW_MARGIN
+        writer.flush()
+        assert transport.lines()[-1] == "JOIN #c"
+        writer.cancel()
+
+    asyncio.run(run())
+
+
+def test_writer_drops_when_a_class_queue_is_full_and_keeps_chat_on_detach():
+    async def run():
+        loop = asyncio.get_running_loop()
+        limiter = RateLimiter({LIMIT_JOIN: (0, 10.0)}, clock=Clock())
+        writer = IRCWriter(loop, limiter, max_queued=2)
+        assert writer.send("JOIN #a") and writer.send("JOIN #b")
+        assert not writer.send("JOIN #c")
+        writer.send("PRIVMSG #a :hi")
+        writer.detach()
+        assert writer.qsize() == 1
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from settings_store import SettingsSchema, SettingsStore
+
+SCHEMA = SettingsSchema({"tts_enabled": True, "rate": 175, "volume": 1.0, "name": "bot"})
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (False, False), (1, True), (0, False),
+    ("true", True), ("False", False), (" yes ", True), ("no", False), ("on", True), ("OFF", False),
+    ("1", True), ("0", False),
+])
+def test_bool_settings_accept_only_clear_values(value, expected):
+    assert SCHEMA.coerce("tts_enabled", value) is expected
+
+
+@pytest.mark.parametrize("value", ["", "maybe", "nope", 2, -1, 0.5, None, [], {}])
+def test_bool_settings_reject_anything_else(value):
+    with pytest.raises(ValueError, match="tts_enabled must be true or false"):
+        SCHEMA.coerce("tts_enabled", value)
+
+
+def test_other_types_still_convert():
+    assert SCHEMA.coerce("rate", "200") == 200
+    assert SCHEMA.coerce("volume", 1) == 1.0
+    with pytest.raises(ValueError, match="rate must be a number"):
+        SCHEMA.coerce("rate", "fast")
+
+
+def test_update_applies_nothing_when_a_value_is_invalid(tmp_path):
+    store = SettingsStore(str(tmp_path / "settings.json"), SCHEMA)
+    with pytest.raises(ValueError):
+        store.update({"rate": 200, "tts_enabled": "sometimes"})
+    assert store.get("rate") == 175
+
+
+def test_hand_edited_file_with_string_bools(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"tts_enabled": "false", "rate": 150}))
+    errors = []
+    store = SettingsStore(str(path), SCHEMA, on_error=errors.append)
+    store.load()
+    assert store.get("tts_enabled") is False
+    path.write_text(json.dumps({"tts_enabled": "maybe", "rate": 160}))
+    store.file_state = None
+    store.check_file()
+    assert store.get("tts_enabled") is False  # The invalid value is reported, not guessed
+    assert store.get("rate") == 160
+    assert errors and "tts_enabled must be true or false" in errors[-1]
+
+
+BOUNDED = SettingsSchema({"max_queue_size": 10, "volume": 1.0, "ping_interval": 30.0},
+                         bounds={"max_queue_size": (1, None), "volume": (0.0, 1.0), "ping_interval": (1.0, None)})
+
+
+@pytest.mark.parametrize("key, value", [
+    ("max_queue_size", 0), ("max_queue_size", -5), ("max_queue_size", 1.9), ("volume", 7.0), ("volume", -0.1),
+    ("volume", float("nan")), ("ping_interval", 0),
+])
+def test_values_out_of_range_are_rejected(key, value):
+    with pytest.raises(ValueError, match=key):
+        BOUNDED.coerce(key, value)
+
+
+def test_values_in_range_and_whole_floats_are_accepted():
+    assert BOUNDED.coerce("max_queue_size", 2.0) == 2
+    assert BOUNDED.coerce("max_queue_size", "3") == 3
+    assert BOUNDED.coerce("volume", 0) == 0.0
+    assert BOUNDED.coerce("ping_interval", "1") == 1.0
@@ -0,0 +1,50 @@
+import pytest
+
+from text_chunks import chunk_phrases, estimate_seconds, limit_text, split_text, wrap_words
+
+
+@pytest.mark.parametrize("text, max_chars, expected", [
+    ("", 10, []),
+    ("   ", 10, []),
+    ("short", 0, ["short"]),
+    ("  spaces \n  collapse ", 0, ["spaces collapse"]),
+    ("fits exactly", 12, ["fits exactly"]),
+    ("One here. Two there. Three!", 12, ["One here.", "Two there.", "Three!"]),
+    ("Hi. Yo. Ok. Sure.", 8, ["Hi. Yo.", "Ok.", "Sure."]),  # Short sentences are packed back together
+    ("first part, second part; third", 14, ["first part,", "second part;", "third"]),
+    ("no breaks in this one at all", 10, ["no breaks", "in this", "one at all"]),
+    ("abcdefghijklmnop", 6, ["abcdef", "ghijkl", "mnop"]),
+])
+def test_split_text(text, max_chars, expected):
+    chunks = split_text(text, max_chars)
+    assert chunks == expected
+    if max_chars > 0:
+        assert all(len(chunk) <= max_chars for chunk in chunks)
+
+
+def test_wrap_words_cuts_only_words_longer_than_a_line():
+    assert wrap_words("a bb verylongword c", 5) == ["a bb", "veryl", "ongwo", "rd c"]
+
+
+def test_chunk_phrases_keeps_phrases_apart():
+    assert chunk_phrases(["bob says", "gg"], 0) == [("bob says", "gg")]
+    assert chunk_phrases(["bob says", "gg"], 20) == [("bob says", "gg")]
+    assert chunk_phrases(["bob says", "one two. three four."], 12) == [("bob says",), ("one two.",), ("three four.",)]
+    assert chunk_phrases(["", "gg"], 10) == [("gg",)]
+
+
+@pytest.mark.parametrize("text, max_chars, expected", [
+    ("anything", 0, ("anything", False)),
+    ("fits", 4, ("fits", False)),
+    ("one two three four", 12, ("one two", True)),  # At the last space before the cap
+    ("one, two three", 6, ("one", True)),  # Without the trailing comma
+    ("a supercalifragilistic", 10, ("a supercal", True)),  # No space in the second half: cut mid-word
+])
+def test_limit_text(text, max_chars, expected):
+    assert limit_text(text, max_chars) == expected
+
+
+def test_estimate_seconds():
+    assert estimate_seconds("one two three", rate=180) == pytest.approx(1.0)
+    assert estimate_seconds("") == 0.0
+    assert estimate_seconds("word", rate=0) == pytest.approx(60.0)  # A zero rate doesn't divide by zero
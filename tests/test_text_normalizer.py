@@ -0,0 +1,83 @@
+import os
+import re
+
+import pytest
+
+from text_normalizer import URL_REMOVE, TextNormalizer, get_normalizer, parse_emotes_tag, trie_pattern
+
+normalizer = TextNormalizer()
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Links
+    ("see https://www.example.com/a/b?c=1 now", "see link to example.com now"),
+    ("go to www.twitch.tv/someone", "go to link to twitch.tv"),
+    ("clips at clips.twitch.tv/Abc-123!", "clips at link to clips.twitch.tv"),
+    ("mail me at bob@example.com", "mail me at bob@example.com"),  # An address, not a link
+    ("version 1.2.3 is out", "version 1.2.3 is out"),
+    ("done.Next", "done.Next"),
+    # Repeated words and characters
+    ("KEKW KEKW KEKW", "haha"),
+    ("gg gg gg gg", "gg"),
+    ("gg gg", "gg gg"),  # Two is not spam
+    ("noooooooo", "noo"),
+    ("hahahahahaha", "haha"),
+    ("!!!!!!", "!!"),
+    ("1000000", "1000000"),  # Digit runs are numbers
+    ("good", "good"),
+    # Emotes
+    ("nice Kappa", "nice"),
+    ("LUL that was PogChamp", "haha that was pog"),
+    ("Kappa", ""),
+    ("Kappas and LULs", "Kappas and LULs"),  # An emote name inside a longer word is left alone
+    ("EZPZ is not EZ", "EZPZ is not easy"),
+    ("Pog PogU PogChampion", "pog pog PogChampion"),
+    # Invisible characters and junk
+    ("hi​​there", "hithere"),
+    ("źâl̃ḡo", "zalgo"),
+    ("art ⠀⣿█ here", "art here"),
+    ("   ", ""),
+])
+def test_normalize(text, expected):
+    assert normalizer.normalize(text) == expected
+
+
+def test_url_remove_mode():
+    assert TextNormalizer(url_mode=URL_REMOVE).normalize("look https://example.com/x here") == "look here"
+    with pytest.raises(ValueError):
+        TextNormalizer(url_mode="spell")
+
+
+def test_custom_emote_map_replaces_the_defaults():
+    custom = TextNormalizer({"catJAM": "cat dance"})
+    assert custom.normalize("catJAM KEKW") == "cat dance KEKW"
+    assert TextNormalizer({}).normalize("KEKW KEKW KEKW") == "KEKW"
+
+
+def test_tagged_emotes_are_replaced_by_position():
+    # Twitch positions are code points, end inclusive; unlisted emotes are dropped
+    assert normalizer.normalize("Kappa hi KEKW", "25:0-4/1:9-12") == "hi haha"
+    assert normalizer.normalize("ñ Unknown ok", "99:2-8") == "ñ ok"
+    assert normalizer.normalize("short", "1:0-40") == "short"  # Stale positions are ignored
+    assert parse_emotes_tag("25:0-4,6-10/1902:12-16") == [(0, 5), (6, 11), (12, 17)]
+    assert parse_emotes_tag("") == []
+
+
+@pytest.mark.parametrize("words, matches, misses", [
+    (["Pog", "PogU", "PogChamp"], ["Pog", "PogU", "PogChamp"], ["Po", "PogC", "PogUU"]),
+    (["a.b", "a+b"], ["a.b", "a+b"], ["axb", "aab"]),
+])
+def test_trie_pattern(words, matches, misses):
+    pattern = re.compile(trie_pattern(words))
+    assert all(pattern.fullmatch(word) for word in matches)
+    assert not any(pattern.fullmatch(word) for word in misses)
+
+
+def test_get_normalizer_reloads_a_changed_emote_file(tmp_path):
+    path = tmp_path / "emotes.json"
+    path.write_text('{"Wave": "hello"}', encoding="utf-8")
+    assert get_normalizer(str(path)).normalize("Wave KEKW") == "hello haha"
+    assert get_normalizer(str(path)) is get_normalizer(str(path))
+    path.write_text('{"Wave": "bye"}', encoding="utf-8")
+    os.utime(path, (1, 1))
+    assert get_normalizer(str(path)).normalize("Wave") == "bye"
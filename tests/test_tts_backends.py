@@ -0,0 +1,76 @@
+import io
+import math
+import struct
+import wave
+
+import pytest
+
+from tts_backends import Pyttsx3Backend, aiff_to_wav
+from tts_pipeline import join_wavs, wav_duration
+
+
+def extended(value):
+    """An 80-bit extended float, as AIFF stores the sample rate."""
+    exponent = math.frexp(value)[1]
+    return struct.pack(">HQ", exponent - 1 + 16383, int(value * 2 ** (64 - exponent)))
+
+
+def aiff(frames, channels=1, width=2, rate=22050, compression=None):
+    """Big-endian (or, for b"sowt", little-endian) PCM frames as AIFF, or AIFF-C with a compression type."""
+    comm = struct.pack(">hIh", channels, len(frames) // (channels * width), width * 8) + extended(rate)
+    if compression is not None:
+        comm += compression + b"\x00"  # Type, then an empty pascal string name
+    ssnd = struct.pack(">II", 0, 0) + frames
+    chunks = b"COMM" + struct.pack(">I", len(comm)) + comm + b"\x00" * (len(comm) & 1)
+    chunks += b"SSND" + struct.pack(">I", len(ssnd)) + ssnd
+    form = b"AIFF" if compression is None else b"AIFC"
+    return b"FORM" + struct.pack(">I", 4 + len(chunks)) + form + chunks
+
+
+def wav_frames(data):
+    with wave.open(io.BytesIO(data), "rb") as reader:
+        return reader.getparams(), reader.readframes(reader.getnframes())
+
+
+def test_aiff_samples_become_little_endian_wav():
+    params, frames = wav_frames(aiff_to_wav(aiff(struct.pack(">3h", 1, -2, 300), rate=22050)))
+    assert (params.nchannels, params.sampwidth, params.framerate, params.nframes) == (1, 2, 22050, 3)
+    assert frames == struct.pack("<3h", 1, -2, 300)
+
+
+def test_aifc_formats():
+    _, frames = wav_frames(aiff_to_wav(aiff(struct.pack("<2h", 5, -5), compression=b"sowt")))
+    assert frames == struct.pack("<2h", 5, -5)
+    _, frames = wav_frames(aiff_to_wav(aiff(bytes([0, 1, 2, 3, 4, 5]), width=3, compression=b"NONE")))
+    assert frames == bytes([2, 1, 0, 5, 4, 3])
+    _, frames = wav_frames(aiff_to_wav(aiff(bytes([0, 127, 128]), width=1)))
+    assert frames == bytes([128, 255, 0])  # Signed to unsigned
+    with pytest.raises(ValueError):
+        aiff_to_wav(aiff(b"\x00\x00", compression=b"ulaw"))
+    with pytest.raises(ValueError):
+        aiff_to_wav(b"not audio")
+
+
+class AiffDriver:
+    """Stands in for pyttsx3 on macOS, which saves AIFF to whatever path it is given."""
+
+    def __init__(self):
+        self.path = None
+
+    def setProperty(self, name, value):
+        pass
+
+    def save_to_file(self, text, path):
+        self.path = path
+
+    def runAndWait(self):
+        with open(self.path, "wb") as f:
+            f.write(aiff(b"\x00\x01" * 2205, rate=22050))
+
+
+def test_pyttsx3_aiff_output_can_be_joined_and_timed():
+    backend = Pyttsx3Backend()
+    backend.engine = AiffDriver()
+    data = backend.synthesize("hello")
+    assert data[:4] == b"RIFF"
+    assert wav_duration(join_wavs([data, data])) == pytest.approx(0.2)
@@ -0,0 +1,86 @@
+import queue
+import sys
+import time
+
+import pytest
+
+import tts_pipeline
+from metrics import MetricsRegistry
+from tts_backends import NullBackend, silent_wav
+from tts_pipeline import CAP_SKIP, CAP_TRUNCATE, TTSPipeline, Utterance, play_wav, wav_duration
+
+WORD = 60.0 / 175  # Seconds of silence NullBackend renders per word
+
+
+class Recorder:
+    """A player that notes how long each buffer it is given would play."""
+
+    def __init__(self):
+        self.played = []
+
+    def __call__(self, data):
+        self.played.append(wav_duration(data))
+
+
+def run_pipeline(texts, spoken=1, **options):
+    """Speaks `texts` until `spoken` of them have played; returns the durations played, the capped reports and the pipeline."""
+    source = queue.Queue()
+    for text in texts:
+        source.put(text)
+    player = Recorder()
+    capped = []
+    metrics = MetricsRegistry()
+    pipeline = TTSPipeline(NullBackend(), source, message_delay=0.0, player=player, metrics=metrics,
+                           on_capped=lambda text, policy: capped.append((text, policy)), **options)
+    pipeline.start()
+    deadline = time.monotonic() + 5.0
+    while pipeline.spoken.total() < spoken and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pipeline.stop()
+    return player.played, capped, pipeline
+
+
+def test_long_messages_are_played_in_chunks():
+    played, capped, pipeline = run_pipeline(["one two three. four five six."], chunk_chars=14)
+    assert played == [pytest.approx(3 * WORD, abs=1e-3)] * 2
+    assert capped == []
+    assert pipeline.spoken.total() == 1
+
+
+def test_character_cap_truncates_once():
+    played, capped, pipeline = run_pipeline(["one two three four"], max_chars=8)
+    assert sum(played) == pytest.approx(2 * WORD, abs=1e-3)
+    assert capped == [("one two three four", CAP_TRUNCATE)]
+    assert pipeline.capped.total() == 1
+
+
+def test_message_over_both_caps_is_reported_once():
+    played, capped, pipeline = run_pipeline(["one two three four five six seven"], max_chars=24, max_seconds=WORD * 2.5)
+    assert sum(played) == pytest.approx(WORD * 2.5, abs=1e-3)  # Cut mid-chunk at the time cap
+    assert len(capped) == 1
+    assert pipeline.capped.total() == 1
+
+
+def test_skip_policy_drops_long_messages_and_keeps_short_ones():
+    entry = Utterance(("ann says", "one two three four five six"), time.monotonic(), "ann")
+    played, capped, pipeline = run_pipeline([entry, "short"], max_seconds=WORD * 3, cap_policy=CAP_SKIP)
+    assert played == [pytest.approx(WORD, abs=1e-3)]
+    assert capped == [(entry, CAP_SKIP)]
+    assert capped[0][0].user == "ann"
+    assert pipeline.capped.total() == 1
+    assert pipeline.spoken.total() == 1
+
+
+def test_seconds_cap_truncates_across_chunks():
+    played, capped, pipeline = run_pipeline(["one two. three four. five six."], chunk_chars=11, max_seconds=WORD * 3)
+    assert played == [pytest.approx(2 * WORD, abs=1e-3), pytest.approx(WORD, abs=1e-3)]
+    assert len(capped) == 1
+    assert pipeline.spoken.total() == 1
+
+
+def test_play_wav_without_any_player_says_what_to_install(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "linux")
+    monkeypatch.setitem(sys.modules, "simpleaudio", None)  # Makes the import fail
+    monkeypatch.setattr(tts_pipeline.shutil, "which", lambda name: None)
+    with pytest.raises(RuntimeError, match="simpleaudio.*afplay, paplay, aplay, ffplay"):
+        play_wav(silent_wav(0.1))
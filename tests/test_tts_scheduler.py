@@ -0,0 +1,136 @@
+import queue
+
+import pytest
+
+from irc_parser import parse_line
+from tts_scheduler import (DROP_DUPLICATE, DROP_LOWEST_PRIORITY, DROP_OLDEST, PRIORITY_CHAT, PRIORITY_GREETING,
+                           PRIORITY_HIGH, TTSScheduler, message_priority)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def drain(scheduler):
+    items = []
+    while True:
+        try:
+            items.append(scheduler.get(block=False))
+        except queue.Empty:
+            return items
+
+
+def test_users_are_served_round_robin():
+    scheduler = TTSScheduler(max_size=20)
+    for i in range(5):
+        scheduler.put(f"spam {i}", user="spammer")
+    scheduler.put("hi", user="ann")
+    scheduler.put("hello", user="Bob")
+    scheduler.put("again", user="ann")
+    assert drain(scheduler) == ["spam 0", "hi", "hello", "spam 1", "again", "spam 2", "spam 3", "spam 4"]
+
+
+def test_high_priority_lane_goes_first():
+    scheduler = TTSScheduler(max_size=20)
+    scheduler.put("chat", user="ann")
+    scheduler.put("welcome", user="bob", priority=PRIORITY_GREETING)
+    scheduler.put("sub", user="cat", priority=PRIORITY_HIGH)
+    assert drain(scheduler) == ["sub", "welcome", "chat"]
+
+
+def test_lowest_priority_policy_drops_from_the_heaviest_chatter():
+    drops = []
+    scheduler = TTSScheduler(max_size=3, drop_policy=DROP_LOWEST_PRIORITY,
+                             on_drop=lambda entry, reason: drops.append((entry.item, reason)))
+    scheduler.put("spam 1", user="spammer")
+    scheduler.put("spam 2", user="spammer")
+    scheduler.put("hi", user="ann")
+    assert scheduler.put("sub", user="cat", priority=PRIORITY_HIGH)
+    assert drops == [("spam 2", "lowest_priority")]
+    assert not scheduler.put("spam 3", user="spammer")  # They already have the most queued
+    assert drops[-1] == ("spam 3", "lowest_priority")
+    assert drain(scheduler) == ["sub", "spam 1", "hi"]
+
+
+def test_lowest_priority_policy_refuses_lower_class_when_full():
+    scheduler = TTSScheduler(max_size=2, drop_policy=DROP_LOWEST_PRIORITY)
+    scheduler.put("a", user="ann", priority=PRIORITY_HIGH)
+    scheduler.put("b", user="bob", priority=PRIORITY_HIGH)
+    assert not scheduler.put("chat", user="cat")
+    assert scheduler.dropped == {"lowest_priority": 1}
+
+
+def test_oldest_policy_drops_the_oldest_entry_of_the_lowest_class():
+    clock = Clock()
+    scheduler = TTSScheduler(max_size=2, drop_policy=DROP_OLDEST, clock=clock)
+    scheduler.put("first", user="ann", priority=PRIORITY_HIGH)
+    clock.now = 1.0
+    scheduler.put("second", user="bob")
+    clock.now = 2.0
+    assert scheduler.put("third", user="cat")
+    assert drain(scheduler) == ["first", "third"]
+    assert scheduler.dropped == {"oldest": 1}
+
+
+def test_oldest_policy_takes_from_the_user_with_the_most_queued():
+    clock = Clock()
+    scheduler = TTSScheduler(max_size=4, drop_policy=DROP_OLDEST, clock=clock)
+    scheduler.put("ann 1", user="ann")
+    for i in range(3):
+        clock.now += 1.0
+        scheduler.put(f"spam {i}", user="spammer")
+    clock.now += 1.0
+    assert scheduler.put("bob 1", user="bob")
+    clock.now += 1.0
+    assert scheduler.put("spam 3", user="spammer")
+    assert sorted(drain(scheduler)) == ["ann 1", "bob 1", "spam 2", "spam 3"]
+    assert scheduler.dropped == {"oldest": 2}
+
+
+def test_duplicate_policy_drops_repeated_text():
+    scheduler = TTSScheduler(max_size=2, drop_policy=DROP_DUPLICATE)
+    scheduler.put("POG  champ", user="ann")
+    scheduler.put("nice", user="bob")
+    assert not scheduler.put("pog champ", user="cat")
+    assert scheduler.dropped == {"duplicate": 1}
+    assert scheduler.put("something new", user="cat")  # Not a duplicate: falls back to lowest priority
+    assert scheduler.qsize() == 2
+
+
+def test_stale_entries_expire_instead_of_being_spoken():
+    clock = Clock()
+    drops = []
+    scheduler = TTSScheduler(max_latency=10.0, clock=clock, on_drop=lambda entry, reason: drops.append(reason))
+    scheduler.put("old", user="ann")
+    clock.now = 8.0
+    scheduler.put("fresh", user="bob")
+    clock.now = 12.0
+    assert scheduler.get(block=False) == "fresh"
+    assert drops == ["stale"]
+    with pytest.raises(queue.Empty):
+        scheduler.get(block=False)
+
+
+def test_clear_one_user():
+    scheduler = TTSScheduler()
+    scheduler.put("a", user="Ann")
+    scheduler.put("b", user="bob")
+    scheduler.put("c", user="ann", priority=PRIORITY_HIGH)
+    assert scheduler.clear("ANN") == 2
+    assert drain(scheduler) == ["b"]
+
+
+def test_message_priority_from_tags():
+    assert message_priority(parse_line(b"@badges=vip/1;mod=0 :a!a@a PRIVMSG #c :hi")) == PRIORITY_HIGH
+    assert message_priority(parse_line(b"@bits=100 :a!a@a PRIVMSG #c :hi")) == PRIORITY_HIGH
+    assert message_priority(parse_line(b"@badges=glhf-pledge/1;mod=0 :a!a@a PRIVMSG #c :hi")) == PRIORITY_CHAT
+
+
+def test_a_zero_size_queue_drops_instead_of_failing():
+    scheduler = TTSScheduler(max_size=0)
+    assert not scheduler.put("hi", user="ann")
+    assert scheduler.dropped == {"lowest_priority": 1}
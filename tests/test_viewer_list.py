@@ -0,0 +1,38 @@
+from viewer_list import SortedNames, ViewerTracker
+
+
+def test_part_in_one_channel_keeps_viewer_still_in_another():
+    viewers = ViewerTracker()
+    assert viewers.add("ann", "a")
+    assert viewers.add("ann", "b")  # New to b, so b greets and records them
+    assert not viewers.add("ann", "b")
+    assert len(viewers) == 1
+    viewers.discard("ann", "a")
+    assert "ann" in viewers and viewers.channels("ann") == {"b"}
+    viewers.discard("ann", "a")  # A repeated PART changes nothing
+    assert viewers.channels("ann") == {"b"}
+    viewers.discard("ann", "b")
+    assert "ann" not in viewers
+
+
+def test_bulk_load_returns_names_new_to_the_channel():
+    viewers = ViewerTracker()
+    viewers.add("ann", "a")
+    assert viewers.bulk_load(["ann", "bob"], "a") == ["bob"]
+    assert viewers.bulk_load(["ann", "bob"], "b") == ["ann", "bob"]
+    assert len(viewers) == 2
+
+
+def test_delta_lists_each_name_once():
+    viewers = ViewerTracker()
+    names = SortedNames()
+    viewers.add("bob", "a")
+    viewers.add("bob", "b")
+    viewers.add("ann", "b")
+    names.apply(*viewers.take_delta())
+    assert names.names == ["ann", "bob"]
+    viewers.discard("bob", "a")
+    assert viewers.take_delta() == (False, [], [])
+    viewers.discard("bob", "b")
+    names.apply(*viewers.take_delta())
+    assert names.names == ["ann"]
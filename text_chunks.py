@@ -0,0 +1,101 @@
+"""Splits long TTS text into sentence and clause chunks that can be spoken as they are rendered.
+
+A 500-character message takes an engine several seconds to render whole, and
+nothing is heard until it is done. Cut into chunks at sentence ends (then at
+commas, semicolons and colons, then between words), the first chunk renders
+in a fraction of that time and plays while the rest are synthesized. Short
+neighbouring pieces are packed back together up to the chunk size, so a
+message made of short sentences isn't read in choppy fragments.
+"""
+import re
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+")
+CLAUSE_BREAK = re.compile(r"(?<=[,;:])\s+")
+WORDS_PER_MINUTE = 175  # Speaking rate assumed when a backend doesn't say
+
+
+def wrap_words(text, max_chars):
+    """Greedy word wrap; a single word longer than `max_chars` is cut."""
+    lines = []
+    line = ""
+    for word in text.split():
+        while len(word) > max_chars:
+            if line:
+                lines.append(line)
+                line = ""
+            lines.append(word[:max_chars])
+            word = word[max_chars:]
+        if line and len(line) + 1 + len(word) > max_chars:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def split_text(text, max_chars):
+    """Splits `text` into chunks of at most `max_chars`, preferring sentence and clause boundaries.
+
+    A `max_chars` of 0 or less leaves the text whole.
+    """
+    text = " ".join(text.split())
+    if not text:
+        return []
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for sentence in SENTENCE_BREAK.split(text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in CLAUSE_BREAK.split(sentence):
+            if len(clause) <= max_chars:
+                pieces.append(clause)
+            else:
+                pieces.extend(wrap_words(clause, max_chars))
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def chunk_phrases(phrases, max_chars):
+    """Groups the phrases of a TTS entry into chunks, as tuples of phrase pieces.
+
+    Phrases stay separate inside a chunk, so ("bob says", "gg") is still
+    cached as two phrases; a long phrase is split with `split_text`.
+    """
+    groups = []
+    group = []
+    size = 0
+    for phrase in phrases:
+        for piece in split_text(phrase, max_chars):
+            if group and max_chars > 0 and size + 1 + len(piece) > max_chars:
+                groups.append(tuple(group))
+                group, size = [], 0
+            group.append(piece)
+            size += len(piece) + (1 if size else 0)
+    if group:
+        groups.append(tuple(group))
+    return groups
+
+
+def limit_text(text, max_chars):
+    """Cuts `text` to at most `max_chars` at a word boundary; returns (text, whether it was cut)."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text, False
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;:"), True
+
+
+def estimate_seconds(text, rate=WORDS_PER_MINUTE):
+    """Roughly how long `text` takes to speak at `rate` words per minute."""
+    return len(text.split()) * 60.0 / max(1, rate)
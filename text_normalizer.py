@@ -0,0 +1,158 @@
+"""Rewrites chat text into what is worth saying out loud.
+
+Raw chat is full of things a speech engine reads badly or at great length:
+links ("h t t p s colon slash slash..."), emote spam ("KEKW KEKW KEKW"),
+stretched words ("noooooooo"), invisible characters Twitch clients add to
+dodge the duplicate-message filter, and zalgo or braille art. A
+TextNormalizer fixes all of these in one `re.sub` pass over the message
+with a single precompiled pattern; emote names are folded into that pattern
+as a trie-shaped regex, so looking them up costs the same for ten names or
+ten thousand. Emotes Twitch marks in the `emotes` tag are replaced by
+position first, without any name lookup at all.
+
+Rule tables (the emote map) are read once per file version and shared, see
+`get_normalizer`.
+"""
+import functools
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+URL_DOMAIN = "domain"  # "link to example.com"
+URL_REMOVE = "remove"
+URL_MODES = (URL_DOMAIN, URL_REMOVE)
+
+# Emote names and what to say instead; "" drops the emote. Emotes that
+# Twitch marks in the `emotes` tag but that aren't listed here are dropped.
+DEFAULT_EMOTES = {
+    "KEKW": "haha", "LUL": "haha", "LULW": "haha", "OMEGALUL": "haha", "ICANT": "haha",
+    "PogChamp": "pog", "Pog": "pog", "PogU": "pog", "POGGERS": "pog",
+    "Kappa": "", "Keepo": "", "monkaS": "", "monkaW": "", "Sadge": "", "PepeHands": "",
+    "BibleThump": "", "ResidentSleeper": "", "NotLikeThis": "", "4Head": "", "5Head": "",
+    "EZ": "easy", "Clap": "", "catJAM": "", "peepoHappy": "", "FeelsBadMan": "", "FeelsGoodMan": "",
+}
+
+URL = r"(?P<url>(?:https?://|www\.)\S+|(?<![\w@.])[\w-]+(?:\.[\w-]+)*\.(?:com|net|org|tv|gg|io|ly|be|me|co|us|uk|de)(?:/\S*)?(?![\w.]))"
+REPEATED_TOKEN = r"(?P<repeat>(?<!\S)(?P<token>\S+)(?:\s+(?P=token)(?!\S)){2,})"
+CHARACTER_RUN = r"(?P<run>(?P<unit>[^\s\d]{1,3}?)(?P=unit){3,})"
+# Invisible characters (zero-width, tag characters used to dodge the duplicate
+# filter) and combining marks (zalgo) are deleted; box drawing and braille art
+# become a space
+INVISIBLE = r"(?P<invisible>[\u200b-\u200f\u2060\ufeff\u034f\U000e0000-\U000e007f\u0300-\u036f\u0489]+)"
+JUNK = r"(?P<junk>[\u2500-\u259f\u2800-\u28ff]+)"
+
+
+def trie_pattern(words):
+    """A regex matching exactly `words`, factored by common prefixes (a trie) so matching doesn't try each word in turn."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End of a word
+
+    def build(node):
+        branches = []
+        optional = "" in node
+        for char in sorted(k for k in node if k):
+            branches.append(re.escape(char) + build(node[char]))
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    return build(trie)
+
+
+def parse_emotes_tag(tag):
+    """(start, end) code point ranges (end exclusive) of the emotes in a Twitch `emotes` tag, e.g. "25:0-4,6-10/1902:12-16"."""
+    ranges = []
+    for emote in tag.split("/"):
+        _, _, positions = emote.partition(":")
+        for position in positions.split(","):
+            start, _, end = position.partition("-")
+            if start.isdigit() and end.isdigit():
+                ranges.append((int(start), int(end) + 1))
+    ranges.sort()
+    return ranges
+
+
+class TextNormalizer:
+    """Cleans chat text for speech in one pass of a combined, precompiled pattern."""
+
+    def __init__(self, emote_map=None, url_mode=URL_DOMAIN):
+        if url_mode not in URL_MODES:
+            raise ValueError(f"Unknown URL mode: {url_mode}")
+        self.emote_map = dict(DEFAULT_EMOTES if emote_map is None else emote_map)
+        self.url_mode = url_mode
+        parts = [URL, REPEATED_TOKEN]
+        if self.emote_map:
+            parts.append(f"(?P<emote>(?<!\\S){trie_pattern(self.emote_map)}(?!\\S))")
+        parts += [INVISIBLE, JUNK, CHARACTER_RUN]
+        # The order matters: a URL is never mangled as a character run, and a
+        # repeated emote is collapsed before it is looked up
+        self.pattern = re.compile("|".join(parts))
+
+    def normalize(self, text, emotes_tag=None):
+        """The text to speak for a chat message; "" if nothing in it is worth saying."""
+        if emotes_tag:
+            text = self.replace_tagged_emotes(text, emotes_tag)
+        return " ".join(self.pattern.sub(self.replace, text).split())
+
+    def replace_tagged_emotes(self, text, emotes_tag):
+        """Swaps the emotes Twitch located in the text for their spoken form."""
+        pieces = []
+        previous = 0
+        for start, end in parse_emotes_tag(emotes_tag):
+            if start < previous or end > len(text):
+                continue  # Overlapping or stale positions; leave the text alone there
+            pieces.append(text[previous:start])
+            pieces.append(" " + self.emote_map.get(text[start:end], "") + " ")
+            previous = end
+        pieces.append(text[previous:])
+        return "".join(pieces)
+
+    def replace(self, match):
+        kind = match.lastgroup
+        if kind == "url":
+            if self.url_mode == URL_REMOVE:
+                return " "
+            url = match.group()
+            host = urlsplit(url if "://" in url else "http://" + url).hostname or ""
+            return f" link to {host[4:] if host.startswith('www.') else host} "
+        if kind == "repeat":
+            token = match.group("token")
+            return self.emote_map.get(token, token)
+        if kind == "emote":
+            return self.emote_map[match.group()]
+        if kind == "run":
+            return match.group("unit") * 2
+        if kind == "invisible":
+            return ""
+        return " "  # junk
+
+
+def load_emote_map(path):
+    """Reads a JSON object of emote name -> spoken text, merged over the defaults."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a JSON object of emote names")
+    emotes = dict(DEFAULT_EMOTES)
+    emotes.update({str(name): str(spoken or "") for name, spoken in data.items()})
+    return emotes
+
+
+@functools.lru_cache(maxsize=8)
+def cached_normalizer(emote_map_file, mtime, url_mode):
+    emote_map = load_emote_map(emote_map_file) if emote_map_file else None
+    return TextNormalizer(emote_map, url_mode)
+
+
+def get_normalizer(emote_map_file="", url_mode=URL_DOMAIN):
+    """A shared TextNormalizer for the settings; the pattern is only rebuilt when the emote file changes."""
+    mtime = os.path.getmtime(emote_map_file) if emote_map_file else None
+    return cached_normalizer(emote_map_file, mtime, url_mode)
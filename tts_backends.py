@@ -0,0 +1,407 @@
+"""Speech engines that render text to WAV bytes, and a process pool to run them in parallel.
+
+Every backend has the same small interface:
+
+    backend.voice_id, backend.rate, backend.volume   the default voice settings
+    backend.configure(voice_id, rate, volume)        changes the defaults
+    backend.synthesize(text, voice_id=None, rate=None, volume=None)
+                                                     WAV bytes; None means the default
+    backend.voices()                                 [(voice id, display name), ...]
+    backend.close()                                  releases processes or drivers
+
+Because the voice travels with each call, one backend can read every user in
+a different voice without being reconfigured between utterances.
+`ProcessPoolBackend` runs any of them in worker processes, each with its own
+engine instance, so several queued messages are synthesized at once across
+cores instead of taking turns on one engine.
+"""
+import array
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures.process import BrokenProcessPool
+
+SUBPROCESS_TIMEOUT = 60.0  # Seconds a command-line engine may take for one message
+NATURAL_RATE = 175  # Words per minute that Piper speaks at a length scale of 1.0
+
+
+def silent_wav(seconds, sample_rate=8000):
+    """WAV bytes of `seconds` of 8-bit mono silence."""
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(1)
+        writer.setframerate(sample_rate)
+        writer.writeframes(b"\x80" * int(seconds * sample_rate))
+    return out.getvalue()
+
+
+def scale_wav_volume(data, volume):
+    """WAV bytes with 16-bit samples scaled by `volume` (0.0-1.0); other formats are returned unchanged."""
+    if volume >= 1.0:
+        return data
+    with wave.open(io.BytesIO(data), "rb") as reader:
+        params = reader.getparams()
+        frames = reader.readframes(reader.getnframes())
+    if params.sampwidth != 2:
+        return data
+    samples = array.array("h")
+    samples.frombytes(frames)
+    if sys.byteorder != "little":
+        samples.byteswap()
+    samples = array.array("h", (int(sample * volume) for sample in samples))
+    if sys.byteorder != "little":
+        samples.byteswap()
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setparams(params)
+        writer.writeframes(samples.tobytes())
+    return out.getvalue()
+
+
+def aiff_to_wav(data):
+    """Converts uncompressed AIFF or AIFF-C bytes (what pyttsx3 writes on macOS) to WAV bytes.
+
+    Raises ValueError for anything else, including compressed AIFF-C. The
+    aifc module would read these, but it is deprecated and gone in 3.13.
+    """
+    if len(data) < 12 or data[:4] != b"FORM" or data[8:12] not in (b"AIFF", b"AIFC"):
+        raise ValueError("not a WAV or AIFF file")
+    channels = width = rate = frames = None
+    little_endian = False
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack(">4sI", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"COMM":
+            channels, frames, bits, exponent, mantissa = struct.unpack(">hIhHQ", body[:18])
+            width = (bits + 7) // 8
+            # An 80-bit extended float: sign and 15-bit exponent, then a 64-bit mantissa
+            rate = mantissa * 2.0 ** ((exponent & 0x7FFF) - 16383 - 63)
+            compression = body[18:22] if data[8:12] == b"AIFC" else b"NONE"
+            if compression == b"sowt":
+                little_endian = True
+            elif compression not in (b"NONE", b"twos"):
+                raise ValueError(f"compressed AIFF ({compression.decode('latin-1')}) is not supported")
+        elif chunk_id == b"SSND":
+            if channels is None:
+                raise ValueError("AIFF sound data comes before its format")
+            offset = struct.unpack(">I", body[:4])[0]
+            samples = body[8 + offset:8 + offset + frames * channels * width]
+            if width == 1:
+                samples = bytes((sample + 128) & 0xFF for sample in samples)  # Signed 8-bit to WAV's unsigned
+            elif not little_endian:
+                swapped = bytearray(len(samples))
+                for i in range(width):  # Reverse the bytes of every sample, one byte position at a time
+                    swapped[i::width] = samples[width - 1 - i::width]
+                samples = bytes(swapped)
+            out = io.BytesIO()
+            with wave.open(out, "wb") as writer:
+                writer.setnchannels(channels)
+                writer.setsampwidth(width)
+                writer.setframerate(round(rate))
+                writer.writeframes(samples)
+            return out.getvalue()
+        pos += 8 + size + (size & 1)  # Chunks are padded to an even length
+    raise ValueError("AIFF file has no sound data")
+
+
+def run_engine(argv, text):
+    """Runs a command-line engine with `text` on stdin; returns its stdout or raises RuntimeError."""
+    try:
+        result = subprocess.run(argv, input=text.encode("utf-8"), capture_output=True, timeout=SUBPROCESS_TIMEOUT)
+    except FileNotFoundError:
+        raise RuntimeError(f"{argv[0]} is not installed") from None
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"{argv[0]} took over {SUBPROCESS_TIMEOUT:.0f}s") from None
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", errors="replace").strip() or f"exit status {result.returncode}"
+        raise RuntimeError(f"{argv[0]} failed: {message}")
+    return result.stdout
+
+
+class Backend:
+    """Stores the default voice settings; subclasses implement `synthesize` and `voices`."""
+    name = ""
+
+    def __init__(self, voice_id=None, rate=175, volume=1.0):
+        self.configure(voice_id, rate, volume)
+
+    def configure(self, voice_id, rate, volume):
+        """Sets the voice properties used when a call doesn't give its own."""
+        self.voice_id = voice_id
+        self.rate = rate
+        self.volume = volume
+
+    def resolve(self, voice_id, rate, volume):
+        """The per-call settings with the defaults filled in."""
+        return (voice_id or self.voice_id,
+                self.rate if rate is None else rate,
+                self.volume if volume is None else volume)
+
+    def voices(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class Pyttsx3Backend(Backend):
+    """Renders text to WAV bytes with pyttsx3's `save_to_file`.
+
+    The macOS driver saves AIFF even to a .wav path; that is converted, so
+    the pipeline can join, time and trim the audio like any other WAV.
+
+    A pyttsx3 driver is not thread-safe, so calls on one instance take turns;
+    use a ProcessPoolBackend to synthesize in parallel.
+    """
+    name = "pyttsx3"
+
+    def __init__(self, voice_id=None, rate=175, volume=1.0):
+        self.engine = None
+        self.lock = threading.Lock()
+        super().__init__(voice_id, rate, volume)
+
+    def driver(self):
+        """The pyttsx3 driver, created on first use; call with the lock held."""
+        if self.engine is None:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+        return self.engine
+
+    def synthesize(self, text, voice_id=None, rate=None, volume=None):
+        """Returns `text` rendered as WAV file bytes."""
+        voice_id, rate, volume = self.resolve(voice_id, rate, volume)
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self.lock:
+                engine = self.driver()
+                if voice_id:
+                    engine.setProperty('voice', voice_id)
+                engine.setProperty('rate', rate)
+                engine.setProperty('volume', volume)
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+            with open(path, "rb") as f:
+                data = f.read()
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if data[:4] == b"RIFF":
+            return data
+        try:
+            return aiff_to_wav(data)  # The macOS driver (nsss) writes AIFF whatever the file is called
+        except ValueError as e:
+            raise RuntimeError(f"pyttsx3 wrote audio that can't be played: {e}") from None
+
+    def voices(self):
+        """The installed system voices."""
+        with self.lock:
+            return [(v.id, v.name) for v in self.driver().getProperty('voices')]
+
+
+class EspeakBackend(Backend):
+    """Runs the espeak-ng command for each message; fast, light and available almost everywhere."""
+    name = "espeak-ng"
+
+    def __init__(self, voice_id=None, rate=175, volume=1.0, command="espeak-ng"):
+        self.command = command
+        super().__init__(voice_id, rate, volume)
+
+    def synthesize(self, text, voice_id=None, rate=None, volume=None):
+        """Returns `text` rendered as WAV file bytes."""
+        voice_id, rate, volume = self.resolve(voice_id, rate, volume)
+        # Amplitude runs 0-200 with 100 as the default; the text goes on stdin so it can't be read as options
+        argv = [self.command, "--stdout", "-s", str(int(rate)), "-a", str(int(volume * 100))]
+        if voice_id:
+            argv += ["-v", voice_id]
+        return run_engine(argv, text)
+
+    def voices(self):
+        """The voices espeak-ng lists, by the language name `-v` accepts."""
+        output = run_engine([self.command, "--voices"], "").decode("utf-8", errors="replace")
+        voices = []
+        for line in output.splitlines()[1:]:  # Skip the column header
+            columns = line.split()
+            if len(columns) >= 4:
+                voices.append((columns[1], f"{columns[3].replace('_', ' ')} ({columns[1]})"))
+        return voices
+
+
+class PiperBackend(Backend):
+    """Runs the Piper neural engine's command for each message.
+
+    Piper voices are .onnx model files, so a voice id is a model path; `model`
+    is the default. Rate maps onto Piper's length scale and volume is applied
+    to the samples afterwards, since Piper has no volume option.
+    """
+    name = "piper"
+
+    def __init__(self, voice_id=None, rate=175, volume=1.0, command="piper", model=""):
+        self.command = command
+        self.model = model
+        super().__init__(voice_id, rate, volume)
+
+    def synthesize(self, text, voice_id=None, rate=None, volume=None):
+        """Returns `text` rendered as WAV file bytes."""
+        voice_id, rate, volume = self.resolve(voice_id, rate, volume)
+        model = voice_id or self.model
+        if not model:
+            raise RuntimeError("No Piper voice model configured (set piper_model)")
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            length_scale = NATURAL_RATE / max(1, rate)
+            run_engine([self.command, "--model", model, "--output_file", path,
+                        "--length_scale", f"{length_scale:.3f}"], text)
+            with open(path, "rb") as f:
+                return scale_wav_volume(f.read(), volume)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def voices(self):
+        """Every .onnx model next to the default one."""
+        directory = os.path.dirname(self.model) if self.model else ""
+        if not directory or not os.path.isdir(directory):
+            return [(self.model, os.path.basename(self.model))] if self.model else []
+        return [(os.path.join(directory, name), name[:-len(".onnx")])
+                for name in sorted(os.listdir(directory)) if name.endswith(".onnx")]
+
+
+class NullBackend(Backend):
+    """A backend that makes no sound, for benchmarks, replays and machines without a speech engine.
+
+    Synthesis sleeps for `synth_cost` seconds plus `cost_per_char` per
+    character, standing in for a real engine's cost, and returns silence
+    as long as the text would take to speak at `rate` words per minute.
+    """
+    name = "null"
+
+    def __init__(self, synth_cost=0.0, cost_per_char=0.0, voice_id=None, rate=175, volume=1.0):
+        self.synth_cost = synth_cost
+        self.cost_per_char = cost_per_char
+        super().__init__(voice_id, rate, volume)
+
+    def synthesize(self, text, voice_id=None, rate=None, volume=None):
+        """Returns silent WAV bytes after the simulated synthesis cost."""
+        _, rate, _ = self.resolve(voice_id, rate, volume)
+        if isinstance(text, tuple):
+            text = " ".join(text)
+        cost = self.synth_cost + self.cost_per_char * len(text)
+        if cost > 0:
+            time.sleep(cost)
+        return silent_wav(len(text.split()) * 60.0 / max(1, rate))
+
+    def voices(self):
+        return [("silent-1", "Silence 1"), ("silent-2", "Silence 2"), ("silent-3", "Silence 3")]
+
+
+BACKENDS = {
+    "pyttsx3": Pyttsx3Backend,
+    "espeak-ng": EspeakBackend,
+    "piper": PiperBackend,
+    "null": NullBackend,
+}
+
+
+def create_backend(name, voice_id=None, rate=175, volume=1.0, **options):
+    """Builds the backend registered as `name`; raises ValueError for an unknown one."""
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown TTS engine: {name}") from None
+    return cls(voice_id=voice_id, rate=rate, volume=volume, **options)
+
+
+# The engine owned by this worker process (see ProcessPoolBackend)
+worker_backend = None
+
+
+def init_worker(name, options):
+    """Process pool initializer: builds this worker's own engine."""
+    global worker_backend
+    worker_backend = create_backend(name, **options)
+
+
+def synthesize_in_worker(text, voice_id, rate, volume):
+    return worker_backend.synthesize(text, voice_id, rate, volume)
+
+
+def voices_in_worker():
+    return worker_backend.voices()
+
+
+class ProcessPoolBackend(Backend):
+    """Runs a backend in `processes` worker processes, each with its own engine instance.
+
+    Calls block the calling thread until a worker returns the audio, so
+    several pipeline synthesis threads keep several workers busy at once.
+    Every call carries its full voice settings; no worker engine is shared
+    or reconfigured behind another call's back. A worker that crashes (as
+    native speech drivers sometimes do) fails the message it was rendering,
+    and the pool is rebuilt for the next one.
+    """
+
+    def __init__(self, name, processes=2, voice_id=None, rate=175, volume=1.0, **options):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown TTS engine: {name}")
+        self.name = name
+        self.processes = max(1, processes)
+        self.options = options
+        self.lock = threading.Lock()
+        self.executor = None
+        super().__init__(voice_id, rate, volume)
+
+    def pool(self):
+        """The worker pool, started on first use."""
+        with self.lock:
+            if self.executor is None:
+                # Spawned rather than forked: speech drivers don't survive a fork of a threaded process
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(self.name, self.options),
+                )
+            return self.executor
+
+    def call(self, function, *args):
+        """Runs `function` in a worker and waits for its result."""
+        executor = self.pool()
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            executor.shutdown(wait=False)
+            raise RuntimeError(f"{self.name} worker process died") from None
+
+    def synthesize(self, text, voice_id=None, rate=None, volume=None):
+        """Returns `text` rendered as WAV file bytes by one of the workers."""
+        return self.call(synthesize_in_worker, text, *self.resolve(voice_id, rate, volume))
+
+    def voices(self):
+        """The voices the engine offers, as listed by a worker."""
+        return self.call(voices_in_worker)
+
+    def close(self):
+        """Stops the workers; messages still waiting for one fail."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
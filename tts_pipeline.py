@@ -0,0 +1,408 @@
+"""Two-stage TTS pipeline: render upcoming messages to audio while the previous one plays.
+
+Synthesis workers take text from the TTS queue and render it to in-memory WAV
+data through a backend; a separate player thread plays the finished buffers
+back-to-back in queue order. A bounded look-ahead keeps the workers from
+rendering far ahead of what will actually be spoken.
+
+Long messages are rendered in sentence/clause chunks (see text_chunks) and
+playback starts as soon as the first chunk is ready, while the worker keeps
+rendering the rest. Messages can be capped in characters and in spoken
+seconds; CAP_TRUNCATE speaks them up to the cap, CAP_SKIP skips them.
+"""
+import collections
+import io
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+from metrics import MetricsRegistry
+from text_chunks import WORDS_PER_MINUTE, chunk_phrases, estimate_seconds, limit_text
+
+CAP_TRUNCATE = "truncate"
+CAP_SKIP = "skip"
+CAP_POLICIES = (CAP_TRUNCATE, CAP_SKIP)
+# Command-line WAV players, tried in order when simpleaudio isn't installed
+PLAYER_COMMANDS = (["afplay"], ["paplay"], ["aplay", "-q"], ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"])
+
+
+def wav_duration(data):
+    """Length of WAV bytes in seconds."""
+    with wave.open(io.BytesIO(data), "rb") as reader:
+        return reader.getnframes() / float(reader.getframerate())
+
+
+class NullPlayer:
+    """A player that only waits as long as the audio would take to play, `speed` times faster."""
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+
+    def __call__(self, data):
+        if self.speed > 0:
+            time.sleep(wav_duration(data) / self.speed)
+
+
+def join_wavs(parts):
+    """Concatenates WAV byte strings rendered with the same format into one WAV."""
+    if len(parts) == 1:
+        return parts[0]
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        for i, part in enumerate(parts):
+            with wave.open(io.BytesIO(part), "rb") as reader:
+                if i == 0:
+                    writer.setparams(reader.getparams())
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return out.getvalue()
+
+
+def trim_wav(data, seconds):
+    """The first `seconds` of WAV bytes."""
+    with wave.open(io.BytesIO(data), "rb") as reader:
+        params = reader.getparams()
+        frames = reader.readframes(min(reader.getnframes(), int(max(0.0, seconds) * reader.getframerate())))
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setparams(params)
+        writer.writeframes(frames)
+    return out.getvalue()
+
+
+def find_command_player():
+    """Returns the argv prefix of a command-line WAV player, or None."""
+    for command in PLAYER_COMMANDS:
+        if shutil.which(command[0]):
+            return command
+    return None
+
+
+def play_wav(data):
+    """Plays WAV bytes and blocks until playback has finished.
+
+    Uses winsound on Windows, then simpleaudio if it is installed, then the
+    first of PLAYER_COMMANDS found on the PATH (afplay ships with macOS).
+    """
+    if sys.platform == "win32":
+        import winsound
+        winsound.PlaySound(data, winsound.SND_MEMORY)
+        return
+    try:
+        import simpleaudio
+    except ImportError:
+        simpleaudio = None
+    if simpleaudio is not None:
+        simpleaudio.WaveObject.from_wave_file(io.BytesIO(data)).play().wait_done()
+        return
+    command = find_command_player()
+    if command is None:
+        names = ", ".join(player[0] for player in PLAYER_COMMANDS)
+        raise RuntimeError(f"No audio player found (pip install simpleaudio, or install one of {names}).")
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        subprocess.run(command + [path], check=False)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class Utterance(tuple):
+    """The phrases of one TTS entry, remembering when the chat that caused it arrived.
+
+    Behaves exactly like a tuple of phrases; `received_at` (time.monotonic)
+    lets the pipeline measure chat-to-speech latency, and `user` (None for
+    an entry several people caused) lets the engine pick that user's voice.
+    """
+
+    def __new__(cls, phrases, received_at, user=None):
+        self = super().__new__(cls, phrases)
+        self.received_at = received_at
+        self.user = user
+        return self
+
+    def __reduce__(self):
+        return (Utterance, (tuple(self), self.received_at, self.user))
+
+
+class RenderSlot:
+    """One queued message; its audio chunks are added by a synthesis worker while the player consumes them."""
+    __slots__ = ("text", "chunks", "error", "synth_time", "finished", "cancelled", "capped", "ready")
+
+    def __init__(self, text):
+        self.text = text
+        self.chunks = []
+        self.error = None
+        self.synth_time = 0.0
+        self.finished = False  # No more chunks will be added
+        self.cancelled = False  # The player has stopped listening; render nothing more
+        self.capped = False  # Already counted as over a cap
+        self.ready = threading.Condition()
+
+    def add_chunk(self, audio):
+        with self.ready:
+            self.chunks.append(audio)
+            self.ready.notify_all()
+
+    def finish(self, error=None):
+        with self.ready:
+            self.error = error
+            self.finished = True
+            self.ready.notify_all()
+
+    def wait_chunk(self, index, timeout):
+        """Chunk `index` once rendered; None if there will be no such chunk or the wait timed out."""
+        with self.ready:
+            self.ready.wait_for(lambda: len(self.chunks) > index or self.finished, timeout)
+            return self.chunks[index] if len(self.chunks) > index else None
+
+
+class PipelineStats:
+    """Rolling throughput and timing figures for the pipeline."""
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.spoken_at = collections.deque()
+        self.synth_times = collections.deque(maxlen=50)
+        self.play_times = collections.deque(maxlen=50)
+        self.errors = 0
+
+    def record(self, synth_time, play_time):
+        """Records one message that has finished playing."""
+        now = time.monotonic()
+        with self.lock:
+            self.spoken_at.append(now)
+            self.synth_times.append(synth_time)
+            self.play_times.append(play_time)
+            while self.spoken_at and now - self.spoken_at[0] > self.window:
+                self.spoken_at.popleft()
+
+    def per_minute(self):
+        """Messages spoken over the last window, scaled to a minute."""
+        with self.lock:
+            return len(self.spoken_at) * 60.0 / self.window
+
+    def summary(self):
+        """A one-line description for the status bar."""
+        with self.lock:
+            synth = sum(self.synth_times) / len(self.synth_times) if self.synth_times else 0.0
+            play = sum(self.play_times) / len(self.play_times) if self.play_times else 0.0
+            count = len(self.spoken_at)
+        return f"TTS: {count * 60.0 / self.window:.0f}/min, synth {synth:.2f}s, play {play:.2f}s"
+
+
+class TTSPipeline:
+    """Renders messages from `source` ahead of time and plays them back-to-back."""
+
+    def __init__(self, backend, source, workers=1, lookahead=3, message_delay=1.0,
+                 player=play_wav, on_spoken=None, on_error=None, metrics=None,
+                 chunk_chars=0, max_chars=0, max_seconds=0.0, cap_policy=CAP_TRUNCATE, on_capped=None):
+        self.backend = backend
+        self.source = source
+        self.workers = max(1, workers)
+        self.lookahead = threading.Semaphore(max(1, lookahead))
+        self.message_delay = message_delay
+        self.player = player
+        self.on_spoken = on_spoken
+        self.on_error = on_error
+        self.chunk_chars = chunk_chars  # 0 renders each message whole
+        self.max_chars = max_chars  # Per phrase; 0 for no limit
+        self.max_seconds = max_seconds  # Spoken length per message; 0 for no limit
+        self.cap_policy = cap_policy
+        self.on_capped = on_capped  # Called with (text, policy) for every message over a cap
+        self.stats = PipelineStats()
+        metrics = metrics or MetricsRegistry()
+        self.synth_latency = metrics.histogram("tts_synth_seconds", "Time to synthesize one message")
+        self.play_latency = metrics.histogram("tts_play_seconds", "Time to play one message")
+        self.end_to_end_latency = metrics.histogram(
+            "tts_end_to_end_seconds", "Time from receiving a chat message to starting to speak it")
+        self.first_audio_latency = metrics.histogram(
+            "tts_first_audio_seconds", "Time from starting to synthesize a message to its first playable audio")
+        self.blocked_latency = metrics.histogram(
+            "tts_blocked_seconds", "Time the player spent waiting for one message's audio")
+        self.capped = metrics.counter("tts_capped_total", "Messages truncated or skipped for being too long")
+        self.errors = metrics.counter("tts_errors_total", "Messages that failed to synthesize or play")
+        self.spoken = metrics.counter("tts_spoken_total", "Messages spoken")
+        self.rendered = collections.deque()  # RenderSlots in the order they will play
+        self.order_lock = threading.Lock()
+        self.slot_ready = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        """Starts the synthesis workers and the player."""
+        self.running = True
+        self.threads = [threading.Thread(target=self.synth_worker, daemon=True) for _ in range(self.workers)]
+        self.threads.append(threading.Thread(target=self.play_worker, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stops every thread; rendered messages that have not played yet are dropped."""
+        self.running = False
+        with self.slot_ready:
+            self.slot_ready.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads = []
+        self.rendered.clear()
+
+    def next_slot(self):
+        """Takes the next message from the source and reserves its playback position."""
+        if not self.lookahead.acquire(timeout=0.5):
+            return None
+        # Taking the item and appending its slot under one lock keeps playback in queue order
+        with self.order_lock:
+            try:
+                text = self.source.get(timeout=0.5)
+            except queue.Empty:
+                self.lookahead.release()
+                return None
+            slot = RenderSlot(text)
+            with self.slot_ready:
+                self.rendered.append(slot)
+                self.slot_ready.notify_all()
+        self.source.task_done()
+        return slot
+
+    def plan_chunks(self, slot):
+        """The pieces to render for a slot's queue entry, one after another; [] if it is skipped for its length.
+
+        Chunks keep the entry's type: an Utterance is split into Utterances
+        (so the user's voice and arrival time carry over), a string into strings.
+        """
+        item = slot.text
+        phrases = list(item) if isinstance(item, tuple) else [item]
+        limited = [limit_text(phrase, self.max_chars) for phrase in phrases]
+        truncated = any(cut for _, cut in limited)
+        phrases = [phrase for phrase, _ in limited]
+        if not truncated and self.max_seconds > 0 and self.cap_policy == CAP_SKIP:
+            rate = getattr(self.backend, "rate", WORDS_PER_MINUTE)
+            truncated = estimate_seconds(" ".join(phrases), rate) > self.max_seconds
+        if truncated:
+            self.report_capped(slot)
+            if self.cap_policy == CAP_SKIP:
+                return []
+        groups = chunk_phrases(phrases, self.chunk_chars)
+        if len(groups) == 1 and not truncated:
+            return [item]
+        if isinstance(item, Utterance):
+            return [Utterance(group, item.received_at, item.user) for group in groups]
+        if isinstance(item, tuple):
+            return groups
+        return [" ".join(group) for group in groups]
+
+    def report_capped(self, slot):
+        """Counts a message over the character or duration cap, once even if it is over both."""
+        if slot.capped:
+            return
+        slot.capped = True
+        self.capped.inc(policy=self.cap_policy)
+        if self.on_capped:
+            self.on_capped(slot.text, self.cap_policy)
+
+    def synth_worker(self):
+        """Renders queued messages to audio, chunk by chunk."""
+        while self.running:
+            slot = self.next_slot()
+            if slot is None:
+                continue
+            start = time.perf_counter()
+            error = None
+            try:
+                for chunk in self.plan_chunks(slot):
+                    if slot.cancelled or not self.running:
+                        break
+                    slot.add_chunk(self.backend.synthesize(chunk))
+                    if len(slot.chunks) == 1:
+                        self.first_audio_latency.observe(time.perf_counter() - start)
+            except Exception as e:
+                error = e
+            slot.synth_time = time.perf_counter() - start
+            self.synth_latency.observe(slot.synth_time)
+            slot.finish(error)
+
+    def next_chunk(self, slot, index):
+        """Waits for chunk `index` of a slot; None when it has no more or the pipeline stops."""
+        while self.running:
+            audio = slot.wait_chunk(index, timeout=0.5)
+            if audio is not None or slot.finished:
+                return audio
+        return None
+
+    def play_worker(self):
+        """Plays rendered messages in order, waiting `message_delay` between them."""
+        while self.running:
+            with self.slot_ready:
+                while self.running and not self.rendered:
+                    self.slot_ready.wait(timeout=0.5)
+                if not self.running:
+                    return
+                slot = self.rendered[0]
+            waited = time.perf_counter()
+            audio = self.next_chunk(slot, 0)
+            blocked = time.perf_counter() - waited
+            if not self.running:
+                return
+            with self.slot_ready:
+                self.rendered.popleft()
+            self.lookahead.release()
+            if audio is None:
+                if slot.error is not None:
+                    self.report_error("synth", slot.error)
+                continue  # Failed, or skipped by the length cap
+            received_at = getattr(slot.text, "received_at", None)
+            if received_at is not None:
+                self.end_to_end_latency.observe(time.monotonic() - received_at)
+            start = time.perf_counter()
+            played = 0.0  # Seconds of audio played so far
+            index = 0
+            try:
+                while audio is not None:
+                    if self.max_seconds > 0:
+                        duration = wav_duration(audio)
+                        if played + duration > self.max_seconds:
+                            if self.cap_policy == CAP_TRUNCATE:
+                                self.player(trim_wav(audio, self.max_seconds - played))
+                            slot.cancelled = True
+                            self.report_capped(slot)
+                            break
+                        played += duration
+                    self.player(audio)
+                    index += 1
+                    waited = time.perf_counter()
+                    audio = self.next_chunk(slot, index)
+                    blocked += time.perf_counter() - waited
+            except Exception as e:
+                slot.cancelled = True
+                self.report_error("play", e)
+                continue
+            if slot.error is not None:
+                self.report_error("synth", slot.error)  # A later chunk failed; what rendered was played
+            play_time = time.perf_counter() - start
+            self.play_latency.observe(play_time)
+            self.blocked_latency.observe(blocked)
+            self.spoken.inc()
+            self.stats.record(slot.synth_time, play_time)
+            if self.on_spoken:
+                self.on_spoken(slot.text, self.stats)
+            time.sleep(self.message_delay)
+
+    def report_error(self, stage, error):
+        """Counts a failed message and passes the error on (or prints it if nobody listens)."""
+        self.stats.errors += 1
+        self.errors.inc(stage=stage)
+        if self.on_error:
+            self.on_error(stage, error)
+        else:
+            print(f"TTS error: {error}")
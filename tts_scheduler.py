@@ -0,0 +1,222 @@
+"""Priority- and fairness-aware scheduler for the TTS queue.
+
+Messages are grouped into priority classes (subs/mods/bits first, then
+greetings, then regular chat). Within a class, users are served round-robin,
+so one person spamming cannot crowd out everyone else. Entries older than the
+configured max latency are dropped instead of being read out late, and when
+the queue is full a drop policy decides what goes.
+
+The scheduler exposes the `get`/`task_done`/`qsize` subset of `queue.Queue`
+that TTSPipeline uses, so it can be used as the pipeline's source directly.
+"""
+import collections
+import queue
+import threading
+import time
+
+from metrics import MetricsRegistry
+
+PRIORITY_HIGH = 0  # Subscribers, moderators, VIPs, the broadcaster and cheers
+PRIORITY_GREETING = 1
+PRIORITY_CHAT = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "priority", PRIORITY_GREETING: "greeting", PRIORITY_CHAT: "chat"}
+
+DROP_OLDEST = "oldest"
+DROP_LOWEST_PRIORITY = "lowest_priority"
+DROP_DUPLICATE = "duplicate"
+DROP_POLICIES = (DROP_OLDEST, DROP_LOWEST_PRIORITY, DROP_DUPLICATE)
+
+PRIORITY_BADGES = ("broadcaster", "moderator", "vip", "subscriber", "founder")
+
+
+def message_priority(message):
+    """Picks a priority class for a chat PRIVMSG from its IRC tags."""
+    if message.tag("mod") == "1" or message.tag("subscriber") == "1" or message.tag("bits"):
+        return PRIORITY_HIGH
+    badges = message.tag("badges") or ""
+    if any(badge.partition("/")[0] in PRIORITY_BADGES for badge in badges.split(",")):
+        return PRIORITY_HIGH
+    return PRIORITY_CHAT
+
+
+def duplicate_key(item):
+    """Normalized text used to spot duplicates; ignores who said it."""
+    text = item[-1] if isinstance(item, tuple) else item
+    return " ".join(text.lower().split())
+
+
+class ScheduledMessage:
+    """One queued TTS entry."""
+    __slots__ = ("item", "user", "priority", "enqueued_at", "key")
+
+    def __init__(self, item, user, priority, enqueued_at):
+        self.item = item
+        self.user = user
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.key = duplicate_key(item)
+
+
+class TTSScheduler:
+    """Bounded, thread-safe TTS queue with priority classes and per-user round-robin."""
+
+    def __init__(self, max_size=10, max_latency=60.0, drop_policy=DROP_LOWEST_PRIORITY,
+                 on_drop=None, clock=time.monotonic, metrics=None):
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.drop_policy = drop_policy
+        self.on_drop = on_drop
+        self.clock = clock
+        # priority -> OrderedDict(user -> deque of ScheduledMessage); dict order is the round-robin order
+        self.classes = {p: collections.OrderedDict() for p in PRIORITY_NAMES}
+        self.size = 0
+        self.dropped = collections.Counter()  # reason -> count
+        self.not_empty = threading.Condition()
+        metrics = metrics or MetricsRegistry()
+        metrics.gauge("tts_queue_depth", "Entries waiting in the TTS queue", callback=self.qsize)
+        self.drop_counter = metrics.counter("tts_dropped_total", "TTS entries dropped, by reason")
+        self.wait_time = metrics.histogram("tts_queue_wait_seconds", "Time entries spent in the TTS queue")
+
+    def configure(self, max_size=None, max_latency=None, drop_policy=None):
+        """Updates the limits; takes effect on the next put/get."""
+        with self.not_empty:
+            if max_size is not None:
+                self.max_size = max_size
+            if max_latency is not None:
+                self.max_latency = max_latency
+            if drop_policy is not None:
+                self.drop_policy = drop_policy
+
+    def qsize(self):
+        """Number of queued entries."""
+        return self.size
+
+    def task_done(self):
+        """Present for queue.Queue compatibility; nothing to track."""
+
+    def put(self, item, user=None, priority=PRIORITY_CHAT):
+        """Offers an entry; returns False if it was dropped instead of queued."""
+        dropped = []
+        with self.not_empty:
+            entry = ScheduledMessage(item, (user or "").lower(), priority, self.clock())
+            if self.size >= self.max_size:
+                victim, reason = self.choose_victim(entry)
+                dropped.append((victim, reason))
+                if victim is entry:
+                    self.report(dropped)
+                    return False
+                self.remove(victim)
+            self.classes[priority].setdefault(entry.user, collections.deque()).append(entry)
+            self.size += 1
+            self.not_empty.notify()
+        self.report(dropped)
+        return True
+
+    def choose_victim(self, entry):
+        """Decides which entry to drop (possibly the new one) when the queue is full."""
+        if not self.size:
+            return entry, self.drop_policy  # A max_size of 0: nothing queued to drop instead
+        if self.drop_policy == DROP_DUPLICATE:
+            for users in self.classes.values():
+                for entries in users.values():
+                    for queued in entries:
+                        if queued.key == entry.key:
+                            return entry, "duplicate"
+        lowest = max(p for p, users in self.classes.items() if users)
+        users = self.classes[lowest]
+        if self.drop_policy == DROP_OLDEST:
+            # The new entry always gets in (unless it ranks below everything queued), pushing out the
+            # oldest entry of whoever has the most queued in the lowest class; the globally oldest entry
+            # would nearly always belong to someone else when one user floods the queue
+            if entry.priority > lowest:
+                return entry, "oldest"
+            heaviest = max(users, key=lambda u: (len(users[u]), -users[u][0].enqueued_at))
+            return users[heaviest][0], "oldest"
+        # Lowest priority: drop from the lowest class, taking from whoever has the most queued there
+        if entry.priority > lowest:
+            return entry, "lowest_priority"
+        heaviest = max(users, key=lambda u: len(users[u]))
+        if entry.priority == lowest and len(users.get(entry.user, ())) >= len(users[heaviest]):
+            return entry, "lowest_priority"
+        return users[heaviest][-1], "lowest_priority"
+
+    def remove(self, victim):
+        """Removes a queued entry."""
+        users = self.classes[victim.priority]
+        entries = users[victim.user]
+        entries.remove(victim)
+        if not entries:
+            del users[victim.user]
+        self.size -= 1
+
+    def pop(self):
+        """Returns the next entry's item without blocking, or raises queue.Empty."""
+        dropped = []
+        with self.not_empty:
+            item = self.pop_locked(dropped)
+        self.report(dropped)
+        if item is None:
+            raise queue.Empty
+        return item
+
+    def pop_locked(self, dropped):
+        """Takes the next fresh entry, round-robin across users; caller holds the lock."""
+        now = self.clock()
+        for users in self.classes.values():
+            while users:
+                user, entries = next(iter(users.items()))
+                entry = entries.popleft()
+                self.size -= 1
+                # Move this user to the back of the rotation
+                del users[user]
+                if entries:
+                    users[user] = entries
+                if self.max_latency and now - entry.enqueued_at > self.max_latency:
+                    dropped.append((entry, "stale"))
+                    continue
+                self.wait_time.observe(now - entry.enqueued_at)
+                return entry.item
+        return None
+
+    def get(self, block=True, timeout=None):
+        """Blocks until an entry is available, like queue.Queue.get."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        dropped = []
+        with self.not_empty:
+            while True:
+                item = self.pop_locked(dropped)
+                if item is not None or not block:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.not_empty.wait(remaining)
+        self.report(dropped)
+        if item is None:
+            raise queue.Empty
+        return item
+
+    def clear(self, user=None):
+        """Drops every queued entry, or only `user`'s; returns how many were dropped."""
+        dropped = []
+        with self.not_empty:
+            for users in self.classes.values():
+                for name in [user.lower()] if user else list(users):
+                    for entry in users.pop(name, ()):
+                        dropped.append((entry, "cleared"))
+            self.size -= len(dropped)
+        self.report(dropped)
+        return len(dropped)
+
+    def report(self, dropped):
+        """Counts dropped entries and tells the owner about them, outside the lock."""
+        for entry, reason in dropped:
+            self.dropped[reason] += 1
+            self.drop_counter.inc(reason=reason)
+            if self.on_drop:
+                self.on_drop(entry, reason)
+
+    def summary(self):
+        """A short description of queue depth and drops for the status bar."""
+        drops = ", ".join(f"{reason} {count}" for reason, count in sorted(self.dropped.items()))
+        return f"queue {self.size}/{self.max_size}" + (f", dropped: {drops}" if drops else "")
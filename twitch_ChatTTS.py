@@ -1,123 +1,106 @@
-import socket
-import threading
-import sys
+import argparse
 import time
-import re
 import tkinter as tk
+import tkinter.font as tkfont
 from tkinter import scrolledtext, messagebox, ttk
-import queue
-import json
-import os
-import pyttsx3
 
-# --- EDIT THESE VALUES ---
-# Use the token you generated from the Twitch Developer console.
-OAUTH_TOKEN = "oauth:YourOAuthTOKEN"
-# Use the name of your bot account.
-BOT_USERNAME = "USERNAMEofYourBotsTwitchAccount"
+from chat_engine import DEFAULT_SETTINGS_FILE, ChatEngine
+from gui_queue import GuiMessageQueue, drain
+from metrics import RateTracker
+from tts_backends import BACKENDS
+from tts_pipeline import CAP_POLICIES
+from tts_scheduler import DROP_POLICIES
+from viewer_list import SortedNames
+
+# The OAuth token and bot account name are set in chat_engine.py.
+
+
+class VirtualListView(tk.Frame):
+    """A scrollable list that only renders the rows currently in view."""
+
+    def __init__(self, master, model, font=("Helvetica", 10), **kwargs):
+        super().__init__(master, **kwargs)
+        self.model = model
+        self.first = 0
+        self.line_height = tkfont.Font(font=font).metrics("linespace")
+        self.text = tk.Text(self, wrap=tk.NONE, state=tk.DISABLED, font=font, height=20, width=20)
+        self.scrollbar = tk.Scrollbar(self, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.bind("<Configure>", lambda event: self.render())
+        self.text.bind("<MouseWheel>", self.on_mousewheel)
+        self.text.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.text.bind("<Button-5>", lambda event: self.scroll_by(3))
+
+    def visible_rows(self):
+        """Number of rows that fit in the widget's current height."""
+        return max(1, self.text.winfo_height() // self.line_height)
+
+    def on_scroll(self, action, amount, unit=None):
+        """Handles scrollbar drags ("moveto") and clicks ("scroll")."""
+        if action == "moveto":
+            self.first = int(float(amount) * len(self.model))
+        elif action == "scroll":
+            step = self.visible_rows() if unit == "pages" else 1
+            self.first += int(amount) * step
+        self.render()
+
+    def on_mousewheel(self, event):
+        """Scrolls three rows per wheel notch."""
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def scroll_by(self, rows):
+        """Moves the view by a number of rows."""
+        self.first += rows
+        self.render()
+        return "break"  # Keep the Text widget from scrolling its own contents too
+
+    def render(self):
+        """Redraws only the rows that are visible."""
+        rows = self.visible_rows()
+        total = len(self.model)
+        self.first = max(0, min(self.first, total - rows))
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "\n".join(self.model.slice(self.first, rows)))
+        self.text.config(state=tk.DISABLED)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
-# --- Do not edit below this line unless you know what you are doing ---
 
 class TwitchGUI:
-    """A GUI for the Twitch IRC bot using tkinter."""
-    def __init__(self, master):
+    """A GUI for the Twitch IRC bot using tkinter; a client of a ChatEngine."""
+    def __init__(self, master, engine):
         self.master = master
+        self.engine = engine
         master.title("Twitch IRC Chat")
         master.geometry("1000x800")
         
-        # Queues for safe cross-thread communication
-        self.message_queue = queue.Queue() # For GUI updates (chat log, status)
-        self.tts_queue = queue.Queue() # For messages to be spoken
-        
-        # IRC and threading variables
-        self.irc_thread = None
-        self.tts_thread = None
-        self.irc_socket = None
-        self.running = False
-        self.connected_channel = None
-        self.viewers = set() # Set to store unique usernames
-        
-        # New flag to prevent mass greetings on initial join
-        self.is_initial_join = True
-        
-        # TTS engine and settings
-        self.tts_engine = None
-        self.settings_file = "tts_settings.json"
-        self.voice_id = None
-        self.rate = 175
-        self.volume = 1.0
-        self.max_queue_size = 10  # Max messages to buffer for TTS
-        self.message_delay = 1.0  # Delay in seconds between TTS messages
-        self.max_chat_lines = 25 # New setting for chat log
-        self.processing_message = False
-        self.last_channel = ""
-        
-        self.load_settings()
-        self.setup_tts_engine()
+        # Engine events (chat log, status) arrive on this queue for the GUI thread
+        self.message_queue = engine.subscribe(GuiMessageQueue())
+        self.viewer_names = SortedNames() # The GUI thread's sorted copy of the viewers, updated from deltas
+        self.gui_lag = (0, 0.0) # (queued GUI messages, age of the oldest in seconds)
+        
+        # GUI-side metrics, reported alongside the engine's
+        engine.metrics.gauge("gui_queue_depth", "Events waiting for the GUI", callback=self.message_queue.qsize)
+        self.drain_lag = engine.metrics.histogram("gui_drain_lag_seconds", "How long events waited before the GUI drew them")
+        self.drain_time = engine.metrics.histogram("gui_drain_seconds", "Time the GUI spent drawing events per tick")
+        self.stats_window = None
+        self.stats_rates = RateTracker()
+        
         self.setup_gui()
         
         # Load the last connected channel into the entry field
-        if self.last_channel:
-            self.channel_entry.insert(0, self.last_channel)
+        if engine.last_channel:
+            self.channel_entry.insert(0, engine.last_channel)
+        if engine.running:
+            self.show_connection(engine.connected_channels)
         
-        # Start the GUI update loop
+        # Start the GUI update loops
         self.master.after(100, self.check_message_queue)
-
-    def load_settings(self):
-        """Loads TTS and last channel settings from a file, or creates one with defaults."""
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, "r") as f:
-                    settings = json.load(f)
-                    self.voice_id = settings.get("voice_id")
-                    self.rate = settings.get("rate", 175)
-                    self.volume = settings.get("volume", 1.0)
-                    self.max_queue_size = settings.get("max_queue_size", 10)
-                    self.message_delay = settings.get("message_delay", 1.0)
-                    self.max_chat_lines = settings.get("max_chat_lines", 25) # Load new setting
-                    self.last_channel = settings.get("last_channel", "")
-            except json.JSONDecodeError:
-                self.save_settings()
-        else:
-            self.save_settings()
-
-    def save_settings(self):
-        """Saves current TTS and last channel settings to a file."""
-        settings = {
-            "voice_id": self.voice_id,
-            "rate": self.rate,
-            "volume": self.volume,
-            "max_queue_size": self.max_queue_size,
-            "message_delay": self.message_delay,
-            "max_chat_lines": self.max_chat_lines, # Save new setting
-            "last_channel": self.last_channel
-        }
-        with open(self.settings_file, "w") as f:
-            json.dump(settings, f, indent=4)
-
-    def setup_tts_engine(self):
-        """Initializes the pyttsx3 engine and applies saved settings."""
-        try:
-            self.tts_engine = pyttsx3.init()
-            voices = self.tts_engine.getProperty('voices')
-            if self.voice_id:
-                self.tts_engine.setProperty('voice', self.voice_id)
-            elif voices:
-                self.voice_id = voices[0].id
-                self.tts_engine.setProperty('voice', self.voice_id)
-            else:
-                self.voice_id = None
-            self.tts_engine.setProperty('rate', self.rate)
-            self.tts_engine.setProperty('volume', self.volume)
-        except Exception as e:
-            messagebox.showerror("TTS Error", f"Failed to initialize TTS engine: {e}")
-            self.tts_engine = None
-            
-    def speak(self, text):
-        """Uses the TTS engine to speak a given text."""
-        if self.tts_engine:
-            self.tts_engine.say(text)
-            self.tts_engine.runAndWait()
+        self.master.after(250, self.refresh_viewer_list)
 
     def setup_gui(self):
         """Builds the main GUI layout."""
@@ -131,11 +114,17 @@ class TwitchGUI:
         preferences_menu.add_command(label="TTS Settings", command=self.open_settings_window)
         preferences_menu.add_command(label="Rate Limitations", command=self.open_rate_limit_window)
 
+        # View menu
+        view_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="View", menu=view_menu)
+        view_menu.add_command(label="Stats", command=self.open_stats_window)
+        view_menu.add_command(label="Chat History", command=self.open_history_window)
+
         # Top frame for input and button
         top_frame = tk.Frame(self.master, padx=10, pady=10)
         top_frame.pack(fill=tk.X)
 
-        tk.Label(top_frame, text="Channel:").pack(side=tk.LEFT, padx=(0, 5))
+        tk.Label(top_frame, text="Channels:").pack(side=tk.LEFT, padx=(0, 5))
         self.channel_entry = tk.Entry(top_frame, width=30)
         self.channel_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
         self.channel_entry.bind("<Return>", self.toggle_connection)
@@ -163,30 +152,50 @@ class TwitchGUI:
         viewers_frame.grid(row=0, column=1, sticky="nsew")
         viewers_frame.pack_propagate(False)
         
-        tk.Label(viewers_frame, text="Current Viewers").pack(side=tk.TOP, pady=(0, 5))
-        self.viewers_log = scrolledtext.ScrolledText(viewers_frame, wrap=tk.WORD, state=tk.DISABLED, font=("Helvetica", 10), height=20)
+        self.viewers_title = tk.Label(viewers_frame, text="Current Viewers")
+        self.viewers_title.pack(side=tk.TOP, pady=(0, 5))
+        self.viewers_log = VirtualListView(viewers_frame, self.viewer_names, font=("Helvetica", 10))
         self.viewers_log.pack(fill=tk.BOTH, expand=True)
 
-        # Status label at the bottom
-        self.status_label = tk.Label(self.master, text="Status: Disconnected", bd=1, relief=tk.SUNKEN, anchor=tk.W)
-        self.status_label.pack(fill=tk.X, padx=10, pady=(0, 5))
+        # Status bar at the bottom: status text on the left, IRC latency on the right
+        status_frame = tk.Frame(self.master)
+        status_frame.pack(fill=tk.X, padx=10, pady=(0, 5))
+        self.latency_label = tk.Label(status_frame, text="Latency: --", bd=1, relief=tk.SUNKEN, width=16, anchor=tk.W)
+        self.latency_label.pack(side=tk.RIGHT)
+        self.tts_stats_label = tk.Label(status_frame, text="TTS: --", bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.tts_stats_label.pack(side=tk.RIGHT, padx=(5, 5))
+        self.gui_lag_label = tk.Label(status_frame, text="GUI: --", bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.gui_lag_label.pack(side=tk.RIGHT)
+        self.status_label = tk.Label(status_frame, text="Status: Disconnected", bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
     def open_settings_window(self):
         """Opens a new window for TTS settings."""
         settings_window = tk.Toplevel(self.master)
         settings_window.title("TTS Settings")
-        settings_window.geometry("400x350")
+        settings_window.geometry("400x500")
         
         settings_frame = tk.Frame(settings_window, padx=10, pady=10)
         settings_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Speech engine; the voice list below belongs to the engine in use
+        tk.Label(settings_frame, text="Engine (reopen this window to see its voices):").pack(anchor=tk.W)
+        self.speech_engine_var = tk.StringVar(settings_window, value=self.engine.speech_engine)
+        engine_menu = ttk.Combobox(settings_frame, textvariable=self.speech_engine_var, values=sorted(BACKENDS), state="readonly")
+        engine_menu.pack(fill=tk.X, pady=(0, 10))
+        
         # Voice selection
         tk.Label(settings_frame, text="Voice:").pack(anchor=tk.W)
-        voices = self.tts_engine.getProperty('voices')
-        voice_names = [v.name for v in voices]
+        try:
+            voices = self.engine.voices()
+        except Exception as e:
+            settings_window.destroy()
+            messagebox.showerror("TTS Error", f"Failed to initialize TTS engine: {e}")
+            return
+        voice_names = [name for _, name in voices]
         
         self.voice_var = tk.StringVar(settings_window)
-        current_voice_name = next((v.name for v in voices if v.id == self.voice_id), voice_names[0])
+        current_voice_name = next((name for voice_id, name in voices if voice_id == self.engine.voice_id), voice_names[0] if voice_names else "")
         self.voice_var.set(current_voice_name)
         
         voice_menu = ttk.Combobox(settings_frame, textvariable=self.voice_var, values=voice_names, state="readonly")
@@ -195,20 +204,30 @@ class TwitchGUI:
         # Rate setting
         tk.Label(settings_frame, text="Rate:").pack(anchor=tk.W)
         self.rate_scale = tk.Scale(settings_frame, from_=50, to=400, orient=tk.HORIZONTAL)
-        self.rate_scale.set(self.rate)
+        self.rate_scale.set(self.engine.rate)
         self.rate_scale.pack(fill=tk.X)
         
         # Volume setting
         tk.Label(settings_frame, text="Volume:").pack(anchor=tk.W)
         self.volume_scale = tk.Scale(settings_window, from_=0.0, to=1.0, resolution=0.1, orient=tk.HORIZONTAL)
-        self.volume_scale.set(self.volume)
+        self.volume_scale.set(self.engine.volume)
         self.volume_scale.pack(fill=tk.X)
         
+        # Parallel synthesis and per-user voices
+        tk.Label(settings_window, text="Synthesis processes (0 = none):").pack(anchor=tk.W, padx=10)
+        self.processes_scale = tk.Scale(settings_window, from_=0, to=8, orient=tk.HORIZONTAL)
+        self.processes_scale.set(self.engine.synth_processes)
+        self.processes_scale.pack(fill=tk.X)
+        self.voice_per_user_var = tk.BooleanVar(settings_window, value=self.engine.voice_per_user)
+        tk.Checkbutton(settings_window, text="Give each chatter their own voice", variable=self.voice_per_user_var).pack(anchor=tk.W, padx=10)
+        self.normalize_var = tk.BooleanVar(settings_window, value=self.engine.tts_normalize)
+        tk.Checkbutton(settings_window, text="Shorten links, emote spam and stretched words", variable=self.normalize_var).pack(anchor=tk.W, padx=10)
+        
         # Buttons for testing and saving
         btn_frame = tk.Frame(settings_window, pady=10)
         btn_frame.pack(fill=tk.X)
         
-        test_btn = tk.Button(btn_frame, text="Test Voice", command=self.test_tts)
+        test_btn = tk.Button(btn_frame, text="Test Voice", command=lambda: self.test_tts(voices))
         test_btn.pack(side=tk.LEFT, padx=(0, 5), expand=True, fill=tk.X)
         
         save_btn = tk.Button(btn_frame, text="Save & Apply", command=lambda: self.apply_and_save_settings(settings_window, voices))
@@ -218,7 +237,7 @@ class TwitchGUI:
         """Opens a new window for TTS and chat rate limiting settings."""
         rate_limit_window = tk.Toplevel(self.master)
         rate_limit_window.title("Rate Limitations")
-        rate_limit_window.geometry("400x300") # Updated size
+        rate_limit_window.geometry("400x720")
         
         rate_limit_frame = tk.Frame(rate_limit_window, padx=10, pady=10)
         rate_limit_frame.pack(fill=tk.BOTH, expand=True)
@@ -226,19 +245,55 @@ class TwitchGUI:
         # Max queue size for TTS
         tk.Label(rate_limit_frame, text="Max TTS Messages in Queue:").pack(anchor=tk.W)
         self.max_queue_scale = tk.Scale(rate_limit_frame, from_=1, to=20, orient=tk.HORIZONTAL)
-        self.max_queue_scale.set(self.max_queue_size)
+        self.max_queue_scale.set(self.engine.max_queue_size)
         self.max_queue_scale.pack(fill=tk.X)
         
+        # What to drop when the TTS queue is full
+        tk.Label(rate_limit_frame, text="When the TTS queue is full, drop:").pack(anchor=tk.W)
+        self.drop_policy_var = tk.StringVar(rate_limit_window, value=self.engine.tts_drop_policy)
+        drop_policy_menu = ttk.Combobox(rate_limit_frame, textvariable=self.drop_policy_var, values=list(DROP_POLICIES), state="readonly")
+        drop_policy_menu.pack(fill=tk.X, pady=(0, 5))
+        
+        # Maximum time a message may wait before it is skipped
+        tk.Label(rate_limit_frame, text="Skip TTS messages older than (seconds, 0 = never):").pack(anchor=tk.W)
+        self.max_latency_scale = tk.Scale(rate_limit_frame, from_=0, to=300, resolution=5, orient=tk.HORIZONTAL)
+        self.max_latency_scale.set(self.engine.tts_max_latency)
+        self.max_latency_scale.pack(fill=tk.X)
+        
         # Message delay for TTS
         tk.Label(rate_limit_frame, text="Delay between TTS messages (seconds):").pack(anchor=tk.W)
         self.delay_scale = tk.Scale(rate_limit_frame, from_=0.0, to=5.0, resolution=0.1, orient=tk.HORIZONTAL)
-        self.delay_scale.set(self.message_delay)
+        self.delay_scale.set(self.engine.message_delay)
         self.delay_scale.pack(fill=tk.X)
         
+        # Long messages: chunked playback and length caps
+        tk.Label(rate_limit_frame, text="Speak long messages in chunks of (characters, 0 = whole):").pack(anchor=tk.W)
+        self.chunk_scale = tk.Scale(rate_limit_frame, from_=0, to=300, resolution=10, orient=tk.HORIZONTAL)
+        self.chunk_scale.set(self.engine.tts_chunk_chars)
+        self.chunk_scale.pack(fill=tk.X)
+        
+        tk.Label(rate_limit_frame, text="Longest message to speak (seconds, 0 = no limit):").pack(anchor=tk.W)
+        self.max_seconds_scale = tk.Scale(rate_limit_frame, from_=0, to=120, resolution=5, orient=tk.HORIZONTAL)
+        self.max_seconds_scale.set(self.engine.tts_max_message_seconds)
+        self.max_seconds_scale.pack(fill=tk.X)
+        
+        tk.Label(rate_limit_frame, text="Messages over the limit are:").pack(anchor=tk.W)
+        self.cap_policy_var = tk.StringVar(rate_limit_window, value=self.engine.tts_cap_policy)
+        cap_policy_menu = ttk.Combobox(rate_limit_frame, textvariable=self.cap_policy_var, values=list(CAP_POLICIES), state="readonly")
+        cap_policy_menu.pack(fill=tk.X, pady=(0, 5))
+        
+        # Greetings: batched welcomes for new viewers
+        self.greet_var = tk.BooleanVar(rate_limit_window, value=self.engine.greet_viewers)
+        tk.Checkbutton(rate_limit_frame, text="Welcome new viewers", variable=self.greet_var).pack(anchor=tk.W)
+        tk.Label(rate_limit_frame, text="Welcome viewers arriving within (seconds) together:").pack(anchor=tk.W)
+        self.greet_batch_scale = tk.Scale(rate_limit_frame, from_=0.5, to=30.0, resolution=0.5, orient=tk.HORIZONTAL)
+        self.greet_batch_scale.set(self.engine.greet_batch_window)
+        self.greet_batch_scale.pack(fill=tk.X)
+        
         # New: Max chat lines
         tk.Label(rate_limit_frame, text="Max Chat Messages to Show:").pack(anchor=tk.W, pady=(10, 0))
         self.max_chat_scale = tk.Scale(rate_limit_frame, from_=1, to=100, orient=tk.HORIZONTAL)
-        self.max_chat_scale.set(self.max_chat_lines)
+        self.max_chat_scale.set(self.engine.max_chat_lines)
         self.max_chat_scale.pack(fill=tk.X)
         
         # Save button
@@ -247,257 +302,246 @@ class TwitchGUI:
 
     def apply_and_save_rate_limits(self, window):
         """Applies new rate limit settings and saves them."""
-        self.max_queue_size = self.max_queue_scale.get()
-        self.message_delay = self.delay_scale.get()
-        self.max_chat_lines = self.max_chat_scale.get() # Apply new setting
-        self.save_settings()
+        self.engine.update_settings({
+            "max_queue_size": self.max_queue_scale.get(),
+            "tts_drop_policy": self.drop_policy_var.get(),
+            "tts_max_latency": self.max_latency_scale.get(),
+            "message_delay": self.delay_scale.get(),
+            "tts_chunk_chars": self.chunk_scale.get(),
+            "tts_max_message_seconds": self.max_seconds_scale.get(),
+            "tts_cap_policy": self.cap_policy_var.get(),
+            "greet_viewers": self.greet_var.get(),
+            "greet_batch_window": self.greet_batch_scale.get(),
+            "max_chat_lines": self.max_chat_scale.get(),
+        })
         messagebox.showinfo("Settings", "Rate limitations saved and applied!")
         window.destroy()
         
-    def test_tts(self):
-        """Tests the TTS engine with the current settings."""
-        self.tts_engine.setProperty('rate', self.rate_scale.get())
-        self.tts_engine.setProperty('volume', self.volume_scale.get())
-        self.tts_engine.say("This is a test of the current settings.")
-        self.tts_engine.runAndWait()
+    def selected_voice_id(self, voices):
+        """The id of the voice picked in the settings window."""
+        selected_voice_name = self.voice_var.get()
+        return next((voice_id for voice_id, name in voices if name == selected_voice_name), self.engine.voice_id)
+
+    def test_tts(self, voices):
+        """Tests the TTS engine with the current settings; the engine speaks on its own thread."""
+        self.engine.test_voice(self.rate_scale.get(), self.volume_scale.get(), self.selected_voice_id(voices))
 
     def apply_and_save_settings(self, window, voices):
         """Applies new settings to the engine and saves them."""
-        # Update instance variables
-        selected_voice_name = self.voice_var.get()
-        selected_voice_id = next((v.id for v in voices if v.name == selected_voice_name), self.voice_id)
-        
-        self.voice_id = selected_voice_id
-        self.rate = self.rate_scale.get()
-        self.volume = self.volume_scale.get()
-        
-        # Apply to engine
-        self.tts_engine.setProperty('voice', self.voice_id)
-        self.tts_engine.setProperty('rate', self.rate)
-        self.tts_engine.setProperty('volume', self.volume)
+        changes = {
+            "speech_engine": self.speech_engine_var.get(),
+            "rate": self.rate_scale.get(),
+            "volume": self.volume_scale.get(),
+            "synth_processes": self.processes_scale.get(),
+            "voice_per_user": self.voice_per_user_var.get(),
+            "tts_normalize": self.normalize_var.get(),
+        }
+        if changes["speech_engine"] == self.engine.speech_engine:
+            changes["voice_id"] = self.selected_voice_id(voices)  # Voice ids only mean something to their own engine
+        else:
+            changes["voice_id"] = None
         
-        # Save to file
-        self.save_settings()
+        # The engine re-renders with the new voice and drops cached audio for the old one
+        self.engine.update_settings(changes)
         messagebox.showinfo("Settings", "Settings saved and applied!")
         window.destroy()
 
     def toggle_connection(self, event=None):
         """Toggles the connection to the Twitch IRC server."""
-        if not self.running:
-            channel = self.channel_entry.get().lower()
-            if not channel:
-                messagebox.showerror("Error", "Please enter a channel name.")
+        if not self.engine.running:
+            try:
+                self.engine.connect(self.channel_entry.get())
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
                 return
-            
-            self.connected_channel = channel
-            self.last_channel = channel # Save the channel before connecting
-            self.save_settings() # Persist the channel to the settings file
-            
+            self.show_connection(self.engine.connected_channels)
+        else:
+            self.engine.disconnect()
+            self.show_connection([])
+
+    def show_connection(self, channels):
+        """Updates the entry and button for a connection made or ended here or through the control API."""
+        if channels:
+            self.channel_entry.config(state=tk.NORMAL)
+            self.channel_entry.delete(0, tk.END)
+            self.channel_entry.insert(0, ", ".join(channels))
             self.channel_entry.config(state=tk.DISABLED)
             self.connect_btn.config(text="Disconnect")
-            self.running = True
-            self.viewers.clear() # Clear viewer list on new connection
-            self.is_initial_join = True # Reset the flag for a new connection
-
-            # Start the IRC thread to listen for messages
-            self.irc_thread = threading.Thread(
-                target=self.irc_connection_worker,
-                args=(channel,),
-                daemon=True
-            )
-            self.irc_thread.start()
-
-            # Start a separate TTS thread to process audio messages
-            self.tts_thread = threading.Thread(
-                target=self.process_tts_queue,
-                daemon=True
-            )
-            self.tts_thread.start()
         else:
-            self.disconnect()
-
-    def disconnect(self):
-        """Stops the IRC thread and resets the GUI."""
-        self.running = False
-        if self.irc_socket:
-            self.irc_socket.close()
-        if self.irc_thread:
-            self.irc_thread.join(timeout=1)
-        if self.tts_thread:
-            self.tts_thread.join(timeout=1)
-            
-        self.channel_entry.config(state=tk.NORMAL)
-        self.connect_btn.config(text="Connect")
-        self.status_label.config(text="Status: Disconnected")
-        self.update_viewer_list_gui([]) # Clear viewer list on disconnect
-        self.is_initial_join = True # Reset the flag for a new connection
-        
-    def irc_connection_worker(self, channel):
-        """Worker thread for handling IRC communication."""
-        self.irc_socket = self.connect_to_twitch()
-        if self.irc_socket:
-            if self.authenticate_and_join(self.irc_socket, channel):
-                self.listen_for_messages(self.irc_socket, channel)
-            else:
-                self.message_queue.put(("status", "Failed to authenticate or join."))
-        else:
-            self.message_queue.put(("status", "Failed to connect to Twitch."))
+            self.channel_entry.config(state=tk.NORMAL)
+            self.connect_btn.config(text="Connect")
+            self.status_label.config(text="Status: Disconnected")
+            self.latency_label.config(text="Latency: --")
 
-    def connect_to_twitch(self):
-        """Establishes a connection to Twitch's IRC server."""
-        server = 'irc.chat.twitch.tv'
-        port = 6667
-        s = socket.socket()
-        try:
-            s.connect((server, port))
-            self.message_queue.put(("status", "Connected to Twitch IRC server."))
-            return s
-        except socket.error:
-            return None
-
-    def authenticate_and_join(self, s, channel):
-        """Authenticates the bot and joins the specified channel."""
-        try:
-            s.send(f"PASS {OAUTH_TOKEN}\r\n".encode('utf-8'))
-            s.send(f"NICK {BOT_USERNAME}\r\n".encode('utf-8'))
-            s.send("CAP REQ :twitch.tv/membership twitch.tv/tags twitch.tv/commands\r\n".encode('utf-8'))
-            s.send(f"JOIN #{channel}\r\n".encode('utf-8'))
-            self.message_queue.put(("status", f"Attempting to join channel #{channel}..."))
-            return True
-        except socket.error:
-            return False
-
-    def listen_for_messages(self, s, channel):
-        """Listens for and processes messages from the IRC server."""
-        buffer = ""
-        while self.running:
-            try:
-                s.settimeout(0.5)  # Set a short timeout
-                response = s.recv(2048).decode('utf-8', errors='ignore')
-                
-                if not response:
-                    self.message_queue.put(("status", "Connection lost."))
-                    break
-                
-                buffer += response
-                lines = buffer.split('\r\n')
-                buffer = lines.pop()
-
-                for line in lines:
-                    if line.startswith("PING"):
-                        s.send("PONG :tmi.twitch.tv\r\n".encode('utf-8'))
-                    elif "366" in line:
-                        self.message_queue.put(("status", f"Successfully joined #{channel}. Waiting for initial viewer list to populate..."))
-                        # Start a timer to turn off the initial join flag after 30 seconds
-                        threading.Timer(30, self.end_initial_join).start()
-                    elif "JOIN" in line and not line.startswith(":jtv"):
-                        match = re.search(r':(\w+)!.*JOIN #(\w+)', line)
-                        if match:
-                            username = match.group(1).lower()
-                            self.viewers.add(username)
-                            self.message_queue.put(("viewer_update", sorted(list(self.viewers))))
-                            # Only greet if the initial join period is over
-                            if not self.is_initial_join and self.tts_queue.qsize() < self.max_queue_size:
-                                self.tts_queue.put(f"Welcome to the stream, {username}!")
-                            else:
-                                self.message_queue.put(("status", f"Initial join or TTS queue full, dropping join message for {username}."))
-                                    
-                    elif "PART" in line:
-                        match = re.search(r':(\w+)!.*PART #(\w+)', line)
-                        if match:
-                            username = match.group(1).lower()
-                            self.viewers.discard(username)
-                            self.message_queue.put(("viewer_update", sorted(list(self.viewers))))
-                            
-                    elif "PRIVMSG" in line:
-                        match = re.search(r'display-name=([^;]+).*PRIVMSG #\w+ :(.+)', line)
-                        if match:
-                            username = match.group(1)
-                            message_content = match.group(2)
-                            
-                            # Add user to the viewer set if they chat for the first time
-                            if username.lower() not in self.viewers:
-                                self.viewers.add(username.lower())
-                                self.message_queue.put(("viewer_update", sorted(list(self.viewers))))
-                                # Only greet first-time chatters after the initial join period is over
-                                if not self.is_initial_join and self.tts_queue.qsize() < self.max_queue_size:
-                                    self.tts_queue.put(f"Welcome to the stream, {username}!")
-                            
-                            # Add message to GUI queue
-                            self.message_queue.put(("message", f"{username}: {message_content}"))
-                            
-                            # Add message to TTS queue if under limit
-                            if self.tts_queue.qsize() < self.max_queue_size:
-                                self.tts_queue.put(f"{username} says {message_content}")
-                            else:
-                                self.message_queue.put(("status", f"TTS queue full, dropping message from {username}."))
-                                
-            except socket.timeout:
-                continue
-            except socket.error:
-                break
-            except Exception:
-                break
-        s.close()
-        
-    def end_initial_join(self):
-        """Sets the initial join flag to False after a delay."""
-        self.is_initial_join = False
-        self.message_queue.put(("status", "Initial join period over. Greeter is now active!"))
-
-    def process_tts_queue(self):
-        """A dedicated thread to process TTS messages from the queue."""
-        while self.running:
-            try:
-                # Get a message from the queue, wait up to 1 second
-                message_to_speak = self.tts_queue.get(timeout=1)
-                self.speak(message_to_speak)
-                self.tts_queue.task_done()
-                time.sleep(self.message_delay)
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"TTS error: {e}")
-                
     def check_message_queue(self):
-        """Periodically checks the message queue for new messages and updates the GUI."""
-        while not self.message_queue.empty():
-            message_type, content = self.message_queue.get_nowait()
-            if message_type == "status":
-                self.status_label.config(text=f"Status: {content}")
-            elif message_type == "message":
-                # Display the message in the chat log
-                self.chat_log.config(state=tk.NORMAL)
-                self.chat_log.insert(tk.END, content + "\n")
-                
-                # New: Trim the chat log to the maximum number of lines
-                if int(self.chat_log.index('end-1c').split('.')[0]) > self.max_chat_lines:
-                    self.chat_log.delete(1.0, f"{self.chat_log.index('end-1c').split('.')[0] - self.max_chat_lines + 1}.0")
-                
-                self.chat_log.see(tk.END)
-                self.chat_log.config(state=tk.DISABLED)
-                self.message_queue.task_done()
-            elif message_type == "viewer_update":
-                self.update_viewer_list_gui(content)
-                self.message_queue.task_done()
-        
-        self.master.after(100, self.check_message_queue)
+        """Drains the message queue within a per-tick time budget and updates the GUI in one batch."""
+        batch = drain(self.message_queue, self.engine.gui_frame_budget_ms / 1000.0)
+        latest = batch.latest
+        if "connection" in latest:
+            self.show_connection(latest["connection"])
+        if "status" in latest:
+            self.status_label.config(text=f"Status: {latest['status']}")
+        if "tts_stats" in latest:
+            self.tts_stats_label.config(text=latest["tts_stats"])
+        if "latency" in latest:
+            self.latency_label.config(text=f"Latency: {latest['latency'] * 1000:.0f} ms")
+        if batch.chat_lines:
+            self.append_chat_lines(batch.chat_lines)
 
-    def update_viewer_list_gui(self, viewers):
-        """Updates the viewer list display in the GUI."""
-        self.viewers_log.config(state=tk.NORMAL)
-        self.viewers_log.delete(1.0, tk.END)
-        for viewer in viewers:
-            self.viewers_log.insert(tk.END, viewer + "\n")
-        self.viewers_log.config(state=tk.DISABLED)
+        # Report how far the GUI is behind the IRC and TTS threads
+        if batch.count:
+            self.drain_lag.observe(batch.lag)
+            self.drain_time.observe(batch.elapsed)
+        self.gui_lag = (batch.depth, batch.oldest_age)
+        self.gui_lag_label.config(text=f"GUI: {batch.depth} queued, {batch.oldest_age * 1000:.0f} ms behind")
+
+        # Come back sooner if the budget ran out with messages still waiting
+        self.master.after(10 if batch.depth else 100, self.check_message_queue)
+
+    def append_chat_lines(self, lines):
+        """Adds a batch of chat lines with a single insert and a single trim."""
+        lines = lines[-self.engine.max_chat_lines:] # Lines that would be trimmed anyway are never inserted
+        self.chat_log.config(state=tk.NORMAL)
+        self.chat_log.insert(tk.END, "\n".join(lines) + "\n")
+        
+        # Trim the chat log to the maximum number of lines; the last line is always the empty one after "\n"
+        last_line = int(self.chat_log.index('end-1c').split('.')[0])
+        if last_line - 1 > self.engine.max_chat_lines:
+            self.chat_log.delete(1.0, f"{last_line - self.engine.max_chat_lines}.0")
+        
+        self.chat_log.see(tk.END)
+        self.chat_log.config(state=tk.DISABLED)
+
+    def open_stats_window(self):
+        """Opens (or raises) a window with rolling per-stage stats and the profiler."""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        self.stats_window = tk.Toplevel(self.master)
+        self.stats_window.title("Stats")
+        self.stats_window.geometry("640x560")
+        
+        btn_frame = tk.Frame(self.stats_window, padx=10, pady=5)
+        btn_frame.pack(fill=tk.X)
+        self.profiler_btn = tk.Button(btn_frame, command=self.toggle_profiler)
+        self.profiler_btn.pack(side=tk.LEFT)
+        tk.Button(btn_frame, text="Reset Profile", command=self.engine.profiler.reset).pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.stats_text = scrolledtext.ScrolledText(self.stats_window, wrap=tk.NONE, state=tk.DISABLED, font=("Courier", 10))
+        self.stats_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.stats_rates = RateTracker()
+        self.refresh_stats()
+
+    def toggle_profiler(self):
+        """Starts or stops the sampling profiler."""
+        self.engine.set_profiling(not self.engine.profiler.running)
+        self.refresh_stats(reschedule=False)
+
+    def refresh_stats(self, reschedule=True):
+        """Redraws the stats window once a second while it is open."""
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            self.stats_window = None
+            return
+        self.profiler_btn.config(text="Stop Profiler" if self.engine.profiler.running else "Start Profiler")
+        self.stats_text.config(state=tk.NORMAL)
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(tk.END, self.format_stats())
+        self.stats_text.config(state=tk.DISABLED)
+        if reschedule:
+            self.master.after(1000, self.refresh_stats)
+
+    def format_stats(self):
+        """Counters with their rate, gauges, and p50/p95/p99 of the last minute for histograms."""
+        lines = []
+        for name, row in self.engine.metrics.snapshot().items():
+            if row["kind"] == "counter":
+                rate = self.stats_rates.rate(name, row["total"])
+                lines.append(f"{name:<34} {row['total']:>10.0f} {rate:>9.1f}/s")
+                for labels, value in row["by_label"].items():
+                    lines.append(f"  {labels:<32} {value:>10.0f}")
+            elif row["kind"] == "gauge":
+                lines.append(f"{name:<34} {row['value']:>10.4g}")
+            elif row["percentiles"]:
+                p50, p95, p99 = (value * 1000 for value in row["percentiles"])
+                lines.append(f"{name:<34} p50 {p50:.2f} / p95 {p95:.2f} / p99 {p99:.2f} ms")
+            else:
+                lines.append(f"{name:<34} --")
+        profiler = self.engine.profiler
+        if profiler.running or profiler.samples:
+            lines.append("")
+            lines.append(profiler.summary())
+        return "\n".join(lines)
+
+    def open_history_window(self):
+        """Opens a window for searching the stored chat history."""
+        if self.engine.history is None:
+            messagebox.showinfo("Chat History", "Chat history is disabled (history_file setting).")
+            return
+        history_window = tk.Toplevel(self.master)
+        history_window.title("Chat History")
+        history_window.geometry("700x500")
+        
+        search_frame = tk.Frame(history_window, padx=10, pady=5)
+        search_frame.pack(fill=tk.X)
+        fields = {}
+        for label, key, width in (("Text:", "text", 24), ("User:", "user", 14), ("Channel:", "channel", 14)):
+            tk.Label(search_frame, text=label).pack(side=tk.LEFT)
+            fields[key] = tk.Entry(search_frame, width=width)
+            fields[key].pack(side=tk.LEFT, padx=(0, 8))
+        results = scrolledtext.ScrolledText(history_window, wrap=tk.WORD, state=tk.DISABLED)
+        
+        def search(event=None):
+            rows = self.engine.search_history(limit=500, **{key: entry.get().strip() or None for key, entry in fields.items()})
+            results.config(state=tk.NORMAL)
+            results.delete(1.0, tk.END)
+            for row in rows:
+                stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["ts"]))
+                results.insert(tk.END, f"{stamp} #{row['channel']} {row['user']}: {row['text']}\n")
+            if not rows:
+                results.insert(tk.END, "No matching messages.")
+            results.config(state=tk.DISABLED)
+        
+        tk.Button(search_frame, text="Search", command=search).pack(side=tk.LEFT)
+        for entry in fields.values():
+            entry.bind("<Return>", search)
+        results.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        search()
+
+    def refresh_viewer_list(self):
+        """Applies pending viewer joins/parts to the viewer pane a few times a second."""
+        reset, added, removed = self.engine.viewers.take_delta()
+        if reset or added or removed:
+            self.viewer_names.apply(reset, added, removed)
+            self.viewers_title.config(text=f"Current Viewers ({len(self.viewer_names)})")
+            self.viewers_log.render()
+        self.master.after(250, self.refresh_viewer_list)
 
 
 def main():
     """Main function to run the application."""
+    parser = argparse.ArgumentParser(description="Twitch chat TTS with a Tk GUI. Use chat_engine.py to run without one.")
+    parser.add_argument("--settings", default=DEFAULT_SETTINGS_FILE, help="settings file")
+    parser.add_argument("--control-port", type=int, default=0, help="also serve the local control API on this port")
+    args = parser.parse_args()
+
+    engine = ChatEngine(args.settings)
+    server = None
+    if args.control_port:
+        from control_api import ControlServer
+        server = ControlServer(engine, engine.control_host, args.control_port, token=engine.control_token)
+        server.start()
+
     root = tk.Tk()
-    app = TwitchGUI(root)
+    app = TwitchGUI(root, engine)
+
+    def on_close():
+        engine.close()
+        if server:
+            server.stop()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
     root.mainloop()
 
 if __name__ == "__main__":
     main()
-
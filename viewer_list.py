@@ -0,0 +1,138 @@
+"""Incremental viewer tracking for the viewer pane.
+
+The IRC side records joins and parts in a ViewerTracker, which only keeps the
+channels each viewer is in and the pending changes since the GUI last looked. The GUI pulls
+those deltas a few times a second, applies them to a SortedNames model with
+bisect, and its VirtualListView draws just the rows that are on screen. This
+module has no Tk dependency so the headless engine can use it.
+"""
+import bisect
+import threading
+
+
+class ViewerTracker:
+    """Thread-safe set of viewers that remembers what changed since the last `take_delta`.
+
+    Membership is per channel: a viewer in two joined channels stays listed
+    until they have left both. The viewer list (and `len`) shows each name
+    once however many channels they are in.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.members = {}  # name -> the channel they are in, or a set of channels when several
+        self.pending = {}  # name -> True if added, False if removed since the last delta
+        self.reset = False
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def channels(self, name):
+        """The channels a viewer is in."""
+        channels = self.members.get(name)
+        if channels is None:
+            return set()
+        return set(channels) if isinstance(channels, set) else {channels}
+
+    def add(self, name, channel):
+        """Adds a viewer to a channel; returns True if they were not already in it."""
+        with self.lock:
+            return self.add_locked(name, channel)
+
+    def add_locked(self, name, channel):
+        channels = self.members.get(name)
+        if channels is None:
+            self.members[name] = channel  # Most viewers are in one channel: no set for them
+            self.mark(name, True)
+            return True
+        if isinstance(channels, set):
+            if channel in channels:
+                return False
+            channels.add(channel)
+        elif channels == channel:
+            return False
+        else:
+            self.members[name] = {channels, channel}
+        return True
+
+    def discard(self, name, channel):
+        """Removes a viewer from a channel; they leave the list once they are in no channel."""
+        with self.lock:
+            channels = self.members.get(name)
+            if channels is None:
+                return
+            if isinstance(channels, set):
+                channels.discard(channel)
+                if len(channels) > 1:
+                    return
+                if channels:
+                    self.members[name] = next(iter(channels))
+                    return
+            elif channels != channel:
+                return
+            del self.members[name]
+            self.mark(name, False)
+
+    def bulk_load(self, names, channel):
+        """Adds a batch of names to a channel at once, as from a 353 NAMES reply; returns the ones new to it."""
+        with self.lock:
+            add = self.add_locked
+            return [name for name in names if add(name, channel)]
+
+    def clear(self):
+        """Forgets every viewer; the next delta tells the GUI to start over."""
+        with self.lock:
+            self.members.clear()
+            self.pending.clear()
+            self.reset = True
+
+    def mark(self, name, added):
+        """Records a change, cancelling it out against an opposite pending one."""
+        previous = self.pending.get(name)
+        if previous is not None and previous != added:
+            del self.pending[name]
+        else:
+            self.pending[name] = added
+
+    def take_delta(self):
+        """Returns (reset, added, removed) since the last call and starts a new delta."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            reset, self.reset = self.reset, False
+        added = [name for name, was_added in pending.items() if was_added]
+        removed = [name for name, was_added in pending.items() if not was_added]
+        return reset, added, removed
+
+
+class SortedNames:
+    """A sorted list of names updated in place with add/remove deltas."""
+
+    def __init__(self):
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def apply(self, reset, added, removed):
+        """Applies a delta from ViewerTracker.take_delta."""
+        if reset:
+            self.names = []
+        names = self.names
+        for name in removed:
+            index = bisect.bisect_left(names, name)
+            if index < len(names) and names[index] == name:
+                del names[index]
+        if len(added) > 64 and len(added) * 4 > len(names):
+            # Large batches (the NAMES burst after connecting) are cheaper to merge with one sort
+            names.extend(added)
+            names.sort()
+        else:
+            for name in added:
+                bisect.insort(names, name)
+
+    def slice(self, start, count):
+        """Returns up to `count` names starting at `start`."""
+        return self.names[start:start + count]